@@ -0,0 +1,331 @@
+"""
+SQLite index of FITS headers and sky footprints.
+
+Scanning a directory reads only the headers of its FITS files. For every
+image HDU it stores a few key header cards and the footprint polygon of
+its WCS. An R*Tree over the footprint bounding boxes makes "which frames
+contain this RA/Dec" a millisecond query. Rescanning skips files whose
+size and modification time did not change.
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from astropy.io import fits
+from astropy.wcs import WCS
+from logpool import control
+
+from starmate.loader import FITS_PATTERNS
+from starmate.variables import settings
+
+# Header cards copied into the index
+INDEX_CARDS = ("OBJECT", "DATE-OBS", "MJD-OBS", "EXPTIME", "FILTER", "INSTRUME", "TELESCOP")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER
+);
+CREATE TABLE IF NOT EXISTS frames (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    hdu INTEGER NOT NULL,
+    naxis1 INTEGER,
+    naxis2 INTEGER,
+    object TEXT,
+    date_obs TEXT,
+    mjd_obs REAL,
+    exptime REAL,
+    filter TEXT,
+    instrume TEXT,
+    telescop TEXT,
+    footprint TEXT
+);
+CREATE INDEX IF NOT EXISTS frames_path ON frames (path);
+CREATE VIRTUAL TABLE IF NOT EXISTS frames_box USING rtree (
+    id, ra_min, ra_max, dec_min, dec_max
+);
+"""
+
+
+def default_index_path():
+    base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "starmate", "index.sqlite")
+
+
+def footprint_box(footprint):
+    """RA/Dec bounding box of a footprint, as a list of (ra_min, ra_max, dec_min, dec_max).
+
+    Boxes crossing RA = 0 are split in two. Footprints around a pole get the
+    full RA range up to the pole.
+    """
+    ra = np.asarray(footprint)[:, 0] % 360
+    dec = np.asarray(footprint)[:, 1]
+
+    # Unwrap RA along the polygon; a full turn means a pole is inside
+    steps = (np.diff(np.append(ra, ra[0])) + 180) % 360 - 180
+    if abs(steps.sum()) > 180:
+        if dec.mean() > 0:
+            return [(0.0, 360.0, float(dec.min()), 90.0)]
+        return [(0.0, 360.0, -90.0, float(dec.max()))]
+
+    unwrapped = ra[0] + np.concatenate([[0], np.cumsum(steps[:-1])])
+    ra_min, ra_max = unwrapped.min(), unwrapped.max()
+    dec_min, dec_max = float(dec.min()), float(dec.max())
+
+    if ra_min < 0:
+        return [(ra_min + 360, 360.0, dec_min, dec_max), (0.0, ra_max, dec_min, dec_max)]
+    if ra_max > 360:
+        return [(ra_min, 360.0, dec_min, dec_max), (0.0, ra_max - 360, dec_min, dec_max)]
+    return [(ra_min, ra_max, dec_min, dec_max)]
+
+
+def footprint_contains(footprint, ra, dec):
+    """Whether the point (ra, dec) lies inside a footprint polygon.
+
+    The polygon is projected gnomonically around the point, where its
+    great-circle edges become straight lines, then tested by ray casting.
+    """
+    ra0, dec0 = np.radians(ra), np.radians(dec)
+    ras = np.radians(np.asarray(footprint)[:, 0])
+    decs = np.radians(np.asarray(footprint)[:, 1])
+
+    cos_c = np.sin(dec0) * np.sin(decs) + np.cos(dec0) * np.cos(decs) * np.cos(ras - ra0)
+    if np.any(cos_c <= 0):
+        return False  # Part of the polygon is more than 90 deg away
+
+    x = np.cos(decs) * np.sin(ras - ra0) / cos_c
+    y = (np.cos(dec0) * np.sin(decs) - np.sin(dec0) * np.cos(decs) * np.cos(ras - ra0)) / cos_c
+
+    inside = False
+    for i in range(len(x)):
+        x1, y1, x2, y2 = x[i - 1], y[i - 1], x[i], y[i]
+        if (y1 > 0) != (y2 > 0) and 0 < x1 + (0 - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+
+def header_footprint(header):
+    """RA/Dec of the image corners of a header as a (4, 2) array, or None
+    without a celestial WCS."""
+    wcs = WCS(header, naxis=2)
+    if not wcs.has_celestial:
+        return None
+    return wcs.calc_footprint(axes=(header["NAXIS1"], header["NAXIS2"]))
+
+
+def read_frames(path):
+    """Header cards and footprint of every image HDU of a file (headers only)."""
+    frames = []
+    with fits.open(path, lazy_load_hdus=True) as hdus:
+        for hdu_num, hdu in enumerate(hdus):
+            header = hdu.header
+            if not hdu.is_image or header.get("NAXIS", 0) < 2:
+                continue
+
+            # Key cards may live in the primary header of multi-extension files
+            cards = {card: header.get(card, hdus[0].header.get(card)) for card in INDEX_CARDS}
+
+            try:
+                footprint = header_footprint(header)
+            except Exception:
+                footprint = None
+
+            frames.append({
+                "hdu": hdu_num,
+                "naxis1": header.get("NAXIS1"),
+                "naxis2": header.get("NAXIS2"),
+                "cards": cards,
+                "footprint": None if footprint is None else footprint.tolist(),
+            })
+    return frames
+
+
+class ArchiveIndex:
+    def __init__(self, db_path=None):
+        self.db_path = db_path or settings.index_db or default_index_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.db.close()
+
+    @staticmethod
+    def find_files(directory, recursive=True):
+        """FITS files under a directory."""
+        found = []
+        for root, dirs, files in os.walk(directory):
+            for name in files:
+                if any(fnmatch.fnmatch(name, pattern) for pattern in FITS_PATTERNS):
+                    found.append(os.path.abspath(os.path.join(root, name)))
+            if not recursive:
+                break
+        return sorted(found)
+
+    def scan(self, directory, recursive=True, workers=None, progress=None):
+        """Index every FITS file under ``directory``, skipping unchanged ones.
+
+        Files that disappeared from the directory are dropped from the index.
+        ``progress(done, total)`` is called as files are read. Returns
+        (indexed, skipped, removed) file counts.
+        """
+        paths = self.find_files(directory, recursive)
+
+        with self._lock:
+            known = {
+                path: (size, mtime_ns)
+                for path, size, mtime_ns in self.db.execute("SELECT path, size, mtime_ns FROM files")
+            }
+
+        changed = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if known.get(path) != (stat.st_size, stat.st_mtime_ns):
+                changed.append((path, stat.st_size, stat.st_mtime_ns))
+
+        # Files under the scanned directory that are gone
+        directory = os.path.abspath(directory)
+        present = set(paths)
+        removed = [
+            p for p in known
+            if p not in present and (
+                p.startswith(os.path.join(directory, "")) if recursive else os.path.dirname(p) == directory
+            )
+        ]
+
+        indexed = 0
+        with ThreadPoolExecutor(workers or settings.bulk_workers) as pool:
+            futures = [(item, pool.submit(read_frames, item[0])) for item in changed]
+            for count, ((path, size, mtime_ns), future) in enumerate(futures, start=1):
+                try:
+                    frames = future.result()
+                except Exception as e:
+                    control.warn(f"Could not index {path}: {e}")
+                    frames = []
+                self._write_file(path, size, mtime_ns, frames)
+                indexed += 1
+                if progress is not None:
+                    progress(count, len(changed))
+
+        for path in removed:
+            self._write_file(path, None, None, [])
+
+        return indexed, len(paths) - len(changed), len(removed)
+
+    def _write_file(self, path, size, mtime_ns, frames):
+        """Replace the frames of a file; size None removes the file."""
+        with self._lock, self.db:
+            ids = [row[0] for row in self.db.execute("SELECT id FROM frames WHERE path = ?", (path,))]
+            for frame_id in ids:
+                self.db.execute("DELETE FROM frames_box WHERE id >= ? AND id < ?", (frame_id * 2, frame_id * 2 + 2))
+            self.db.execute("DELETE FROM frames WHERE path = ?", (path,))
+            self.db.execute("DELETE FROM files WHERE path = ?", (path,))
+
+            if size is None:
+                return
+
+            self.db.execute("INSERT INTO files VALUES (?, ?, ?)", (path, size, mtime_ns))
+            for frame in frames:
+                cards = frame["cards"]
+                cursor = self.db.execute(
+                    "INSERT INTO frames (path, hdu, naxis1, naxis2, object, date_obs, mjd_obs, "
+                    "exptime, filter, instrume, telescop, footprint) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        path, frame["hdu"], frame["naxis1"], frame["naxis2"],
+                        _text(cards["OBJECT"]), _text(cards["DATE-OBS"]), _number(cards["MJD-OBS"]),
+                        _number(cards["EXPTIME"]), _text(cards["FILTER"]), _text(cards["INSTRUME"]),
+                        _text(cards["TELESCOP"]),
+                        None if frame["footprint"] is None else json.dumps(frame["footprint"]),
+                    ),
+                )
+                if frame["footprint"] is None:
+                    continue
+
+                # Up to two boxes per frame (split at RA = 0), ids 2 * id and 2 * id + 1
+                for part, box in enumerate(footprint_box(frame["footprint"])):
+                    self.db.execute(
+                        "INSERT INTO frames_box VALUES (?, ?, ?, ?, ?)",
+                        (cursor.lastrowid * 2 + part, *box),
+                    )
+
+    def query(self, ra, dec):
+        """Frames whose footprint contains (ra, dec), as a list of dicts."""
+        ra = ra % 360
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT DISTINCT f.id, f.path, f.hdu, f.object, f.date_obs, f.exptime, f.filter, f.footprint "
+                "FROM frames_box b JOIN frames f ON f.id = b.id / 2 "
+                "WHERE b.ra_min <= ? AND b.ra_max >= ? AND b.dec_min <= ? AND b.dec_max >= ?",
+                (ra, ra, dec, dec),
+            ).fetchall()
+
+        matches = []
+        for frame_id, path, hdu, obj, date_obs, exptime, filt, footprint in rows:
+            if not footprint_contains(json.loads(footprint), ra, dec):
+                continue
+            matches.append({
+                "path": path, "hdu": hdu, "object": obj,
+                "date_obs": date_obs, "exptime": exptime, "filter": filt,
+            })
+        return sorted(matches, key=lambda m: (m["date_obs"] or "", m["path"], m["hdu"]))
+
+    def stats(self):
+        with self._lock:
+            n_files = self.db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            n_frames = self.db.execute("SELECT COUNT(*) FROM frames").fetchone()[0]
+        return n_files, n_frames
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def index_cli(argv):
+    """``starmate index {scan,find,info}``: manage the header and footprint index."""
+    parser = argparse.ArgumentParser(prog="starmate index", description="Index FITS headers and footprints")
+    parser.add_argument("--db", default=None, help="index database")
+    sub = parser.add_subparsers(dest="action", required=True)
+
+    scan = sub.add_parser("scan", help="index the FITS files of a directory")
+    scan.add_argument("directory")
+    scan.add_argument("--no-recursive", action="store_true")
+
+    find = sub.add_parser("find", help="list frames containing a position")
+    find.add_argument("ra", type=float)
+    find.add_argument("dec", type=float)
+
+    sub.add_parser("info", help="show index size")
+    args = parser.parse_args(argv)
+
+    index = ArchiveIndex(args.db)
+    if args.action == "scan":
+        indexed, skipped, removed = index.scan(args.directory, recursive=not args.no_recursive)
+        print(f"Indexed {indexed} files, {skipped} unchanged, {removed} removed")
+    elif args.action == "find":
+        for match in index.query(args.ra, args.dec):
+            print(f"{match['path']}[{match['hdu']}]  {match['date_obs'] or ''}  {match['object'] or ''}")
+    else:
+        n_files, n_frames = index.stats()
+        print(f"{index.db_path}: {n_files} files, {n_frames} frames")
+    index.close()
@@ -0,0 +1,157 @@
+import customtkinter as ctk
+from starmate.variables import colors, fonts
+from starmate.archive_index import ArchiveIndex
+from logpool import control
+
+
+class FindFrames:
+    def __init__(self, master, menu_callback, manager):
+        self.master = master
+        self.menu_callback = menu_callback
+        self.manager = manager
+
+        self.index = ArchiveIndex()
+        self.matches = []
+        self.scan_future = None
+
+        # Destroy all widgets in the master frame
+        for widget in self.master.winfo_children():
+            widget.destroy()
+
+        # Main Menu Button at the top
+        main_menu_button = ctk.CTkButton(
+            self.master,
+            text="Main Menu",
+            font=fonts.md,
+            fg_color=colors.accent,
+            text_color=colors.text,
+            command=menu_callback
+        )
+        main_menu_button.pack(side="top", pady=(10, 10), padx=10)
+
+        # Title
+        title_label = ctk.CTkLabel(
+            self.master,
+            text="Find Frames",
+            font=fonts.lg,
+            text_color=colors.text
+        )
+        title_label.pack(pady=(0, 10))
+
+        # Directory indexing
+        index_frame = ctk.CTkFrame(self.master, fg_color=colors.bg)
+        index_frame.pack(pady=5, padx=10, fill="x")
+
+        self.directory_entry = ctk.CTkEntry(index_frame, placeholder_text="Directory to index", width=250, font=fonts.sm)
+        self.directory_entry.pack(side="left", padx=10, pady=5)
+
+        index_button = ctk.CTkButton(
+            index_frame,
+            text="Index",
+            command=self.start_scan,
+            font=fonts.sm,
+            fg_color=colors.blue,
+            text_color=colors.text,
+            width=80
+        )
+        index_button.pack(side="left", padx=5)
+
+        # Position query, defaulting to the position in the coordinate panel
+        query_frame = ctk.CTkFrame(self.master, fg_color=colors.bg)
+        query_frame.pack(pady=5, padx=10, fill="x")
+
+        self.ra_entry = ctk.CTkEntry(query_frame, placeholder_text="RA", width=120, font=fonts.sm)
+        self.ra_entry.pack(side="left", padx=10, pady=5)
+        self.dec_entry = ctk.CTkEntry(query_frame, placeholder_text="Dec", width=120, font=fonts.sm)
+        self.dec_entry.pack(side="left", padx=10, pady=5)
+
+        ra, dec = self.manager.viewer.get_panel_ra_dec()
+        if ra != "N/A" and dec != "N/A":
+            self.ra_entry.insert(0, ra)
+            self.dec_entry.insert(0, dec)
+
+        find_button = ctk.CTkButton(
+            query_frame,
+            text="Find",
+            command=self.find,
+            font=fonts.sm,
+            fg_color=colors.blue,
+            text_color=colors.text,
+            width=80
+        )
+        find_button.pack(side="left", padx=5)
+
+        self.open_button = ctk.CTkButton(
+            self.master,
+            text="Open All",
+            command=self.open_all,
+            font=fonts.md,
+            fg_color=colors.green,
+            text_color=colors.text,
+            state="disabled"
+        )
+        self.open_button.pack(pady=10)
+
+        # Status label
+        n_files, n_frames = self.index.stats()
+        self.status_label = ctk.CTkLabel(
+            self.master,
+            text=f"{n_files} files, {n_frames} frames indexed",
+            font=fonts.sm,
+            text_color=colors.accent
+        )
+        self.status_label.pack(pady=10)
+
+    def start_scan(self):
+        """Index a directory in the background."""
+        directory = self.directory_entry.get().strip()
+        if not directory:
+            control.warn("Enter a directory to index.")
+            return
+        if self.scan_future is not None and not self.scan_future.done():
+            control.warn("An index scan is already running.")
+            return
+
+        control.info(f"Indexing {directory}...")
+        self.status_label.configure(text="Indexing...")
+        self.scan_future = control.submit(self.index.scan, directory)
+        self.master.after(200, self.check_scan)
+
+    def check_scan(self):
+        if not self.scan_future.done():
+            self.master.after(200, self.check_scan)
+            return
+
+        try:
+            indexed, skipped, removed = self.scan_future.result()
+        except Exception as e:
+            control.critical(f"Error indexing directory: {e}")
+            self.status_label.configure(text="Indexing failed")
+            return
+
+        n_files, n_frames = self.index.stats()
+        control.info(f"Indexed {indexed} files ({skipped} unchanged, {removed} removed).")
+        if self.status_label.winfo_exists():
+            self.status_label.configure(text=f"{n_files} files, {n_frames} frames indexed")
+
+    def find(self):
+        """List the indexed frames that contain the position."""
+        try:
+            ra = float(self.ra_entry.get())
+            dec = float(self.dec_entry.get())
+        except ValueError:
+            control.warn("Invalid RA or Dec.")
+            return
+
+        self.matches = self.index.query(ra, dec)
+        files = sorted({m["path"] for m in self.matches})
+
+        control.info(f"{len(self.matches)} frames in {len(files)} files contain RA: {ra}, Dec: {dec}")
+        self.status_label.configure(text=f"{len(self.matches)} frames in {len(files)} files")
+        self.open_button.configure(state="normal" if files else "disabled")
+
+    def open_all(self):
+        """Open every file with a frame containing the position."""
+        files = sorted({m["path"] for m in self.matches})
+        if files:
+            self.manager.loader.submit_many(files)
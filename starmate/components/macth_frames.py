@@ -1,5 +1,9 @@
 import customtkinter as ctk
 from starmate.variables import colors, fonts
+from starmate.image import ReprojectedImage
+from starmate.reproject import compatible
+
+from logpool import control
 
 class MatchFrames:
     def __init__(self, master, menu_callback, manager):
@@ -47,20 +51,89 @@ class MatchFrames:
         )
         self.master.button2.pack(side="left", padx=10, pady=10)
 
+        # Resample the other images onto the active image's pixel grid
+        self.master.reproject_button = ctk.CTkButton(
+            self.master, 
+            text="reproject", 
+            command=self.on_reproject_clicked, 
+            font=fonts.md, 
+            fg_color=colors.accent
+        )
+        self.master.reproject_button.pack(pady=10)
+
+        # Keep the same field when switching images
+        self.master.lock_switch = ctk.CTkSwitch(
+            self.master,
+            text="lock views",
+            command=self.toggle_lock_views,
+            font=fonts.md,
+            progress_color=colors.accent
+        )
+        if self.manager.views_locked:
+            self.master.lock_switch.select()
+        self.master.lock_switch.pack(pady=10)
+
     def on_go_clicked(self, typ = "physical"):
-        # Call the callback with the values
-        center_x, center_y = self.manager.im_ref().get_canvas_center_pos()
-        x_image, y_image = self.manager.im_ref().canvas_pos_to_xy(center_x, center_y)
-        ra, dec = self.manager.im_ref().get_image_canvas_center_coords()
-        
-        zoom_level = self.manager.im_ref().zoom_level
-        
-        for image in self.manager.images:
-            if typ == "coordinates":
-                self.manager.images[image].center_on_coordinate(ra, dec, zoom_level)
-        
-            if typ == "physical":
-                self.manager.images[image].center_on_xy(x_image, y_image, zoom_level)
-                
-            
-            
\ No newline at end of file
+        """Show every image at the position at the center of the active image,
+        by pixel or by sky coordinates, with the active zoom.
+
+        Only the views are recorded; each image moves to its view when it is
+        next activated, so nothing is rendered here.
+        """
+        if not self.manager.active_im():
+            control.warn("No active image.")
+            return
+        active = self.manager.im_ref()
+
+        center_x, center_y = active.get_canvas_center_pos()
+        x_image, y_image = active.canvas_pos_to_xy(center_x, center_y)
+        zoom_level = active.zoom_level
+
+        if typ == "coordinates":
+            ra, dec = active.get_image_canvas_center_coords()
+            view = ("sky", ra, dec, zoom_level)
+        else:
+            view = ("pixel", x_image, y_image, zoom_level)
+
+        for image in self.manager.images.values():
+            if image is not active:
+                image.pending_view = view
+        control.info(f"Matched {len(self.manager.images) - 1} image(s) to {active.name} by {typ}")
+
+    def toggle_lock_views(self):
+        """Carry the field of the shown image over to every image activated after it."""
+        self.manager.views_locked = bool(self.master.lock_switch.get())
+        control.info("views locked." if self.manager.views_locked else "views unlocked.")
+
+    def on_reproject_clicked(self):
+        """Add every other image, resampled onto the active image's grid, as
+        a new image named "<image>@<active image>". They are shown at the
+        active image's zoom and position, so switching between them blinks
+        the same field."""
+        if not self.manager.active_im():
+            control.warn("No active image.")
+            return
+        target = self.manager.im_ref()
+
+        added = 0
+        for name, image in list(self.manager.images.items()):
+            if image is target or isinstance(image, ReprojectedImage):
+                continue
+            if not compatible(image.wcs_info, target.wcs_info):
+                control.warn(f"{name}: no celestial WCS in the frame of {target.name}, skipped")
+                continue
+
+            # A reprojection made earlier keeps its computed tiles
+            reprojected_name = f"{name}@{target.name}"
+            reprojected = self.manager.images.get(reprojected_name)
+            if reprojected is None:
+                reprojected = ReprojectedImage(image, target, self.manager, reprojected_name)
+                self.manager.images[reprojected_name] = reprojected
+                added += 1
+
+            reprojected.zoom_level = target.zoom_level
+            reprojected.offset_x = target.offset_x
+            reprojected.offset_y = target.offset_y
+
+        self.manager.viewer.update_image_list()
+        control.info(f"Reprojected {added} image(s) onto {target.name}")
@@ -204,7 +204,7 @@ class MeasurementTable:
             measurement_id = selection[0]
             self.manager.measurement_manager.remove_measurement(measurement_id)
             self.refresh_table()
-            self.manager.viewer.update_display_image()
+            self.manager.viewer.update_overlays()
 
     def toggle_visibility(self):
         """Toggle visibility of the selected measurement."""
@@ -213,13 +213,13 @@ class MeasurementTable:
             measurement_id = selection[0]
             self.manager.measurement_manager.toggle_visibility(measurement_id)
             self.refresh_table()
-            self.manager.viewer.update_display_image()
+            self.manager.viewer.update_overlays()
 
     def clear_all(self):
         """Clear all measurements."""
         self.manager.measurement_manager.clear_all()
         self.refresh_table()
-        self.manager.viewer.update_display_image()
+        self.manager.viewer.update_overlays()
 
     def show_residual(self):
         """Show residual calculation UI."""
@@ -0,0 +1,97 @@
+import customtkinter as ctk
+from starmate.variables import colors, fonts
+from starmate.memory import format_bytes
+
+
+class MemoryView:
+    def __init__(self, master, menu_callback, manager):
+        self.master = master
+        self.menu_callback = menu_callback
+        self.manager = manager
+
+        # Destroy all widgets in the master frame
+        for widget in self.master.winfo_children():
+            widget.destroy()
+
+        # Main Menu Button at the top
+        main_menu_button = ctk.CTkButton(
+            self.master,
+            text="Main Menu",
+            font=fonts.md,
+            fg_color=colors.accent,
+            text_color=colors.text,
+            command=menu_callback
+        )
+        main_menu_button.pack(side="top", pady=(10, 10), padx=10)
+
+        # Title
+        title_label = ctk.CTkLabel(
+            self.master,
+            text="Memory Usage",
+            font=fonts.lg,
+            text_color=colors.text
+        )
+        title_label.pack(pady=(0, 10))
+
+        # Control buttons frame
+        control_frame = ctk.CTkFrame(self.master, fg_color=colors.bg)
+        control_frame.pack(pady=5, padx=10, fill="x")
+
+        refresh_button = ctk.CTkButton(
+            control_frame,
+            text="Refresh",
+            command=self.refresh,
+            font=fonts.sm,
+            fg_color=colors.blue,
+            text_color=colors.text,
+            width=80
+        )
+        refresh_button.pack(side="left", padx=2)
+
+        release_button = ctk.CTkButton(
+            control_frame,
+            text="Release Inactive",
+            command=self.release_inactive,
+            font=fonts.sm,
+            fg_color=colors.red,
+            text_color=colors.text,
+            width=120
+        )
+        release_button.pack(side="left", padx=2)
+
+        self.total_label = ctk.CTkLabel(
+            self.master,
+            text="",
+            font=fonts.sm,
+            text_color=colors.accent
+        )
+        self.total_label.pack(pady=5)
+
+        # Per-image resident bytes
+        self.list_frame = ctk.CTkScrollableFrame(self.master, fg_color=colors.dark)
+        self.list_frame.pack(pady=5, padx=10, fill="both", expand=True)
+
+        self.refresh()
+
+    def refresh(self):
+        for widget in self.list_frame.winfo_children():
+            widget.destroy()
+
+        usage = self.manager.memory.usage()
+        for row, (name, nbytes) in enumerate(sorted(usage.items(), key=lambda item: -item[1])):
+            color = colors.accent if name == self.manager.active_image else colors.text
+            ctk.CTkLabel(
+                self.list_frame, text=name, font=fonts.sm, text_color=color, anchor="w"
+            ).grid(row=row, column=0, sticky="w", padx=5)
+            ctk.CTkLabel(
+                self.list_frame, text=format_bytes(nbytes), font=fonts.sm, text_color=color
+            ).grid(row=row, column=1, sticky="e", padx=5)
+
+        self.total_label.configure(
+            text=f"{format_bytes(sum(usage.values()))} of {self.manager.memory.limit_mb:.0f} MB budget"
+        )
+
+    def release_inactive(self):
+        self.manager.memory.release_inactive()
+        self.manager.update_memory()
+        self.refresh()
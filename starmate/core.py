@@ -12,14 +12,18 @@ from starmate.fonts.font_manager import FontManager
 from starmate.fits_viewer import FITSViewer
 
 from starmate.image import FitsImage
-from starmate.variables import colors, fonts
+from starmate import reproject
+from starmate.variables import colors, fonts, settings
 from starmate.measurements import MeasurementManager
+from starmate.loader import FileLoader, expand_paths
+from starmate.memory import MemoryBudget, format_bytes
 
 from logpool import control
 
 from starmate.components.go_to_position import CoordinateInput
 from starmate.components.macth_frames import MatchFrames
 from starmate.components.query_object import QueryObject
+from starmate.components.find_frames import FindFrames
 
 class Manager:
     def __init__(self):
@@ -31,6 +35,8 @@ class Manager:
         
         self.active_image = None
         self.images = {}
+        # Whether activating an image moves it to the field of the image shown before
+        self.views_locked = False
         self.drawing_mode = False
         self.measurement_manager = MeasurementManager()
 
@@ -44,8 +50,9 @@ class Manager:
         self.init_mainframe()
         self.init_sidebar()
         
-        parser = argparse.ArgumentParser(description="CLI for astroxs package")
-        self.args = parser.parse_args()
+        self.args = self.parse_args()
+        self.loader = FileLoader(self)
+        self.memory = MemoryBudget(self)
         self.viewer = FITSViewer(self, self.root, self.args)
         
         self.sidebar_menu()
@@ -53,6 +60,49 @@ class Manager:
         self.setup_terminal()
         
         control.info("started starmate")
+
+        # Files, directories or glob patterns given on the command line
+        if self.args.paths:
+            self.root.after_idle(self.load_paths, self.args.paths)
+
+    def parse_args(self):
+        parser = argparse.ArgumentParser(description="CLI for astroxs package")
+        parser.add_argument("paths", nargs="*", help="FITS files, directories or glob patterns to open")
+        parser.add_argument("--workers", type=int, default=settings.bulk_workers,
+                            help="threads used to index headers when loading many files")
+        parser.add_argument("--memory-limit", type=float, default=settings.bulk_memory_limit_mb,
+                            help="MB of pixels prefetched when loading many files")
+        parser.add_argument("--sort-key", default=settings.bulk_sort_key,
+                            help="header keyword used to order loaded frames")
+        parser.add_argument("--limits", choices=["zscale", "sampled", "exact"], default=settings.first_limits,
+                            help="display limits of newly shown images")
+        parser.add_argument("--fps", type=float, default=settings.target_fps,
+                            help="most frames drawn per second while panning and zooming")
+        parser.add_argument("--render-stats", type=int, default=settings.render_stats_every, metavar="N",
+                            help="log frame timings and dropped frames every N frames")
+        parser.add_argument("--memory-budget", type=float, default=settings.memory_budget_mb,
+                            help="MB of pixels and display caches kept for loaded images")
+        args = parser.parse_args()
+
+        settings.bulk_workers = args.workers
+        settings.bulk_memory_limit_mb = args.memory_limit
+        settings.bulk_sort_key = args.sort_key
+        settings.memory_budget_mb = args.memory_budget
+        settings.first_limits = args.limits
+        settings.target_fps = args.fps
+        settings.render_stats_every = args.render_stats
+        return args
+
+    def load_paths(self, paths):
+        """Load command line paths: a single file directly, anything else as one bulk job."""
+        if len(paths) == 1:
+            self.viewer.load_fits(paths[0])
+            return
+
+        files = []
+        for path in paths:
+            files.extend(expand_paths(path))
+        self.loader.submit_many(files)
     
     def active_im(self) -> bool:
         if self.active_image is None:
@@ -63,8 +113,24 @@ class Manager:
         if self.active_im():
             return self.images[self.active_image]
 
+    def activate_image(self, name):
+        """Make an image the active one and move it to its pending view.
+
+        With views locked, the pending view is the field of the image shown
+        before, so pans and zooms carry over without touching inactive images.
+        """
+        previous = self.im_ref()
+        self.active_image = name
+        image = self.images[name]
+        if self.views_locked and previous is not None and previous is not image:
+            image.pending_view = previous.linked_view(image)
+        image.apply_pending_view()
+
     def start(self):
         self.root.mainloop()
+        self.loader.shutdown()
+        self.viewer.render_worker.stop()
+        reproject.shutdown()
         
     def init_mainframe(self):
         # Main Frame using ctk
@@ -94,6 +160,16 @@ class Manager:
         
         self.image_selector.pack(side="left", padx=5)
 
+        # Resident memory of the active image and of all images
+        self.memory_label = ctk.CTkLabel(
+            selector_frame,
+            text="",
+            fg_color=colors.bg,
+            text_color=colors.text_secondary,
+            font=fonts.sm,
+        )
+        self.memory_label.pack(side="left", padx=10)
+
     def setup_terminal(self):
         # Terminal Frame
         self.terminal_frame = ctk.CTkFrame(
@@ -252,6 +328,30 @@ class Manager:
         )
         match_frames_button.pack(side="left", padx=10, pady=5)
 
+        find_frames_button = ctk.CTkButton(
+            row2_frame,
+            text="Find Frames",
+            command=lambda: FindFrames(
+                self.sidebar_content,
+                self.sidebar_menu,
+                manager=self
+            ),
+            font=fonts.md,
+            fg_color=colors.blue,
+            text_color=colors.text
+        )
+        find_frames_button.pack(side="left", padx=10, pady=5)
+
+        memory_button = ctk.CTkButton(
+            row2_frame,
+            text="Memory",
+            command=self.show_memory_view,
+            font=fonts.md,
+            fg_color=colors.blue,
+            text_color=colors.text
+        )
+        memory_button.pack(side="left", padx=10, pady=5)
+
         # Third Row: Online Query Tools
         row3_frame = ctk.CTkFrame(self.sidebar_content, fg_color=colors.bg)
         row3_frame.pack(fill="x", expand=True, pady=(10, 5), padx=10)
@@ -307,11 +407,30 @@ class Manager:
         print("change_active_image")
         selected_image = self.image_selector.get()  # Retrieve the selected image name
         if selected_image in self.images:  # Check if the selected image is valid
-            self.active_image = selected_image
+            self.activate_image(selected_image)
+            self.viewer.update_slice_control()
             self.viewer.update_display_image()  # Refresh the display to show the selected image
+            self.update_memory()
             self.viewer.toggle_freeze_coords()
             self.root.focus_set()
         
+    def update_memory(self):
+        """Track the active image in the memory budget, evict if over it and refresh the label."""
+        if self.active_im():
+            self.memory.touch(self.active_image)
+        self.memory.enforce()
+
+        usage = self.memory.usage()
+        active = format_bytes(usage.get(self.active_image, 0)) if self.active_im() else "-"
+        self.memory_label.configure(
+            text=f"image: {active} | total: {format_bytes(sum(usage.values()))} / {self.memory.limit_mb:.0f} MB"
+        )
+
+    def show_memory_view(self):
+        """Show per-image memory usage."""
+        from starmate.components.memory_view import MemoryView
+        MemoryView(self.sidebar_content, self.sidebar_menu, manager=self)
+
     def load_font(self):
         """Load the custom font and add it to the pyglet font registry. """
         # Load the custom font with pyglet
@@ -355,10 +474,9 @@ class Manager:
             self.viewer.image_canvas.unbind("<Button-1>")
             self.viewer.image_canvas.bind("<Button-1>", self.viewer.start_pan)
             self.root.unbind("<Escape>")
-            self.viewer.update_display_image()
 
-        # Update display to show temporary measurement
-        self.viewer.update_display_image()
+        # Update the overlays to show the (temporary) measurement
+        self.viewer.update_overlays()
 
     def cancel_measurement(self, event=None):
         """Cancel the current measurement."""
@@ -371,7 +489,7 @@ class Manager:
         self.viewer.image_canvas.unbind("<Button-1>")
         self.viewer.image_canvas.bind("<Button-1>", self.viewer.start_pan)
         self.root.unbind("<Escape>")
-        self.viewer.update_display_image()
+        self.viewer.update_overlays()
 
     def show_measurement_table(self):
         """Show the measurement table UI."""
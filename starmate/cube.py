@@ -0,0 +1,103 @@
+import numpy as np
+
+from starmate.image import FitsImage, HDUData
+from starmate.utils import LRUCache
+
+
+class FitsCube(FitsImage):
+    """A 3D HDU shown as a single image with a movable slice.
+
+    All slices share one header and one WCS. The cube stays memory-mapped and
+    only the active slice is read. The limits and stretch of recent slices
+    are kept in a small LRU, and their display tiles in the display cache, so
+    stepping back and forth through the cube does not recompute them.
+    """
+
+    def __init__(self, header, manager, name = None, cube_loader = None, file_path = None, hdu_index = None, cache_size = 16):
+        # The cube is held and released where a plain image holds its pixels
+        super().__init__(
+            None, header, manager, name, data_loader=cube_loader, file_path=file_path, hdu_index=hdu_index
+        )
+
+        self.n_slices = header["NAXIS3"]
+        self.slice_index = 0
+
+        # (slice, pmin, pmax, stretch, param, limits) ->
+        # (vmin, vmax, transfer, limits mode)
+        self.slice_cache = LRUCache(cache_size)
+
+        # How limits are found for slices shown with the slider
+        self.slice_limits = "exact"
+
+    @property
+    def cube(self):
+        """The full (memory-mapped) data cube."""
+        return self._resident_data()
+
+    @property
+    def image_data(self):
+        """The active slice of the cube."""
+        if self.cube is None:
+            return None
+        return self.cube[self.slice_index]
+
+    @image_data.setter
+    def image_data(self, value):
+        raise AttributeError("FitsCube data is read from the cube; use set_slice instead")
+
+    @property
+    def plane(self):
+        return self.slice_index
+
+    def release(self):
+        self.slice_cache.clear()
+        super().release()
+
+    def update_image_cache(self, pmin=0, pmax=100, stretch=None, param=None, limits="exact"):
+        """Update the cached image of the active slice, reusing stretched slices."""
+        if stretch is not None:
+            self.set_stretch(stretch, param)
+
+        try:
+            pmin = float(pmin)
+            pmax = float(pmax)
+        except ValueError:
+            print("Invalid pmin or pmax value")
+            return
+
+        self.pmin, self.pmax = pmin, pmax
+        self.slice_limits = limits
+        key = (self.slice_index, pmin, pmax, self.stretch_name, self.stretch_param, limits)
+
+        cached = self.slice_cache.get(key)
+        if cached is not None:
+            self.vmin, self.vmax, self.transfer, self.limits_mode = cached
+            self.limits_version += 1
+            return
+
+        super().update_image_cache(pmin, pmax, limits=limits)
+        self.slice_cache.put(key, (self.vmin, self.vmax, self.transfer, self.limits_mode))
+
+    def refine_limits(self) -> bool:
+        key = (self.slice_index, self.pmin, self.pmax, self.stretch_name, self.stretch_param, self.slice_limits)
+        if not super().refine_limits():
+            return False
+        self.slice_cache.put(key, (self.vmin, self.vmax, self.transfer, self.limits_mode))
+        return True
+
+    def set_slice(self, index):
+        """Move to another slice of the cube."""
+        index = int(np.clip(index, 0, self.n_slices - 1))
+        if index == self.slice_index and self.vmin is not None:
+            return
+
+        self.slice_index = index
+        self.update_image_cache(self.pmin, self.pmax, limits=self.slice_limits)
+
+    @staticmethod
+    def load_lazy(hdu, manager = None, name = None, file_path = None, hdu_index = None):
+        """Register a 3D HDU with only its header parsed."""
+        return FitsCube(
+            hdu.header, manager, name,
+            cube_loader=HDUData(file_path, hdu_index, hdu), file_path=file_path, hdu_index=hdu_index
+        )
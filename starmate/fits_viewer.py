@@ -7,15 +7,24 @@ from tkinter import font as tkFont
 from astropy.io import fits
 from PIL import Image, ImageTk
 import numpy as np
+import glob
 import os
+import time
 from logpool import control
 
-from starmate.image import FitsImage
-from starmate.variables import fonts, colors
+from starmate.cube import FitsCube
+from starmate.stretch import STRETCHES, COLORMAPS
+from starmate.scheduler import FrameScheduler
+from starmate.renderer import RenderWorker
+from starmate.overlay import OverlayLayer, overlay_shapes
+from starmate.variables import fonts, colors, settings
 
 import starmate
 
 MAX_DISPLAY_SIZE = 2000  # Limit to a maximum display size to reduce lag
+RENDER_POLL_MS = 4  # Interval of the checks for frames from the render worker
+READOUT_TAG = "StarmateReadout"  # Bindtag of the cursor readout on the image canvas
+MAGNIFIER_SIZE = (150, 150)
 
 class FITSViewer:
     def __init__(self, manager, root, args):
@@ -41,15 +50,30 @@ class FITSViewer:
         # Additional attributes
         self.coords_frozen = False
 
+        # Pan, zoom and other view changes are coalesced into frames
+        self.render_worker = RenderWorker()
+        self._collecting = False
+        self._refine_after = None  # Pending full render after a coarse frame
+        # Canvas item and PhotoImage the frames are blitted into
+        self.tk = None
+        self._photo_mode = None
+        self.image_item = None
+        self.frames = FrameScheduler(self.root, self.render_frame, worker=self.render_worker)
+
         # Content frame inside main_frame for UI elements
         self.content_frame = self.manager.content_frame
 
+        # Cursor readout: last pointer position on the canvas, the pixel and
+        # magnifier content shown for it, and the label texts
+        self._pointer = None
+        self._readout_scheduled = False
+        self._readout_pixel = None
+        self._magnifier_key = None
+        self._readout_text = {}
+
         # Setup main UI components
         self.setup_ui()
 
-        self.update_coordinates()
-        self.update_thumbnail()
-
     def setup_ui(self):
         # Main file frame and canvas inside content_frame with padding
         file_frame = ctk.CTkFrame(self.content_frame, fg_color=colors.bg)
@@ -74,6 +98,28 @@ class FITSViewer:
         )
         browse_button.pack(side="right", padx=5, pady=5)
 
+        folder_button = ctk.CTkButton(
+            file_frame,
+            text="Open Folder",
+            command=self.open_folder_dialog,
+            font=fonts.md,
+            fg_color=colors.accent,
+            text_color=colors.text,
+            width=100,
+        )
+        folder_button.pack(side="right", padx=5, pady=5)
+
+        cancel_button = ctk.CTkButton(
+            file_frame,
+            text="Cancel",
+            command=self.cancel_loading,
+            font=fonts.md,
+            fg_color=colors.red,
+            text_color=colors.text,
+            width=80,
+        )
+        cancel_button.pack(side="right", padx=5, pady=5)
+
 
         # pmin and pmax inputs with an "Apply" button with padding
         input_frame = ctk.CTkFrame(self.content_frame, fg_color=colors.bg)
@@ -113,15 +159,90 @@ class FITSViewer:
         self.pmax_entry.insert(0, "100")
         self.pmax_entry.pack(side="left", padx=5)
 
-        # Bind Enter key to update_image_cache for both entries
+        # Transfer function and its parameter (empty for the default)
+        self.stretch_menu = ctk.CTkOptionMenu(
+            input_frame,
+            values=list(STRETCHES),
+            command=lambda value: self.update_image_cache(),
+            width=90,
+            fg_color=colors.blue,
+            text_color=colors.text,
+            font=fonts.md,
+        )
+        self.stretch_menu.set("linear")
+        self.stretch_menu.pack(side="left", padx=5)
+
+        self.stretch_param_entry = ctk.CTkEntry(
+            input_frame,
+            width=50,
+            placeholder_text="param",
+            fg_color=colors.bg,
+            text_color=colors.text,
+            font=fonts.md,
+        )
+        self.stretch_param_entry.pack(side="left", padx=5)
+
+        self.colormap_menu = ctk.CTkOptionMenu(
+            input_frame,
+            values=list(COLORMAPS),
+            command=self.change_colormap,
+            width=90,
+            fg_color=colors.blue,
+            text_color=colors.text,
+            font=fonts.md,
+        )
+        self.colormap_menu.set(settings.colormap)
+        self.colormap_menu.pack(side="left", padx=5)
+
+        zscale_button = ctk.CTkButton(
+            input_frame,
+            text="ZScale",
+            command=self.apply_zscale,
+            width=60,
+            fg_color=colors.blue,
+            text_color=colors.text,
+            font=fonts.md,
+        )
+        zscale_button.pack(side="left", padx=5)
+
+        # Bind Enter key to update_image_cache for all entries
         self.pmin_entry.bind("<Return>", lambda event: self.update_image_cache())
         self.pmax_entry.bind("<Return>", lambda event: self.update_image_cache())
+        self.stretch_param_entry.bind("<Return>", lambda event: self.update_image_cache())
+
+        # Slice control for data cubes, disabled for 2D images
+        self.slice_slider = ctk.CTkSlider(
+            input_frame,
+            from_=0,
+            to=1,
+            number_of_steps=1,
+            command=self.change_slice,
+            state="disabled",
+        )
+        self.slice_slider.set(0)
+        self.slice_slider.pack(side="left", padx=5)
+
+        self.slice_label = ctk.CTkLabel(
+            input_frame,
+            text="slice: -",
+            fg_color=colors.bg,
+            text_color=colors.text,
+            font=fonts.md,
+        )
+        self.slice_label.pack(side="left", padx=5)
 
         # Canvas to display the FITS image with padding
         self.image_canvas = ctk.CTkCanvas(
             self.content_frame, width=750, height=500, bg=colors.bg
         )
         self.image_canvas.pack(fill="both", expand=True, padx=10, pady=10)
+        self.overlays = OverlayLayer(self.image_canvas)
+
+        # The readout follows the pointer through its own bindtag, so tools
+        # binding <Motion> on the canvas itself don't replace it
+        self.image_canvas.bindtags((READOUT_TAG,) + self.image_canvas.bindtags())
+        self.root.bind_class(READOUT_TAG, "<Motion>", self.track_pointer)
+        self.root.bind_class(READOUT_TAG, "<Leave>", self.leave_canvas)
         
         self.image_canvas.bind("<MouseWheel>", self.zoom)
         self.image_canvas.bind("<Button-1>", self.start_pan)
@@ -182,8 +303,14 @@ class FITSViewer:
         thumbnail_frame.pack(side="left", fill="y")
         
         # Thumbnail canvas in thumbnail_frame
-        self.thumbnail_canvas = ctk.CTkCanvas(thumbnail_frame, width = 150, height=150, bg=colors.dark)
+        self.thumbnail_canvas = ctk.CTkCanvas(
+            thumbnail_frame, width=MAGNIFIER_SIZE[0], height=MAGNIFIER_SIZE[1], bg=colors.dark
+        )
         self.thumbnail_canvas.pack(side="left")
+        # One PhotoImage the magnifier is pasted into, and the pointer marker over it
+        self.thumbnail_photo = ImageTk.PhotoImage("RGB", MAGNIFIER_SIZE)
+        self.thumbnail_item = self.thumbnail_canvas.create_image(0, 0, anchor="nw", image=self.thumbnail_photo)
+        self.thumbnail_marker = self.thumbnail_canvas.create_rectangle(0, 0, 0, 0, outline=colors.accent, state="hidden")
         
         self.bottoml_frame = ctk.CTkFrame(self.content_frame, fg_color=colors.bg)
         self.bottoml_frame.pack(side="left", fill="both", padx=10)
@@ -202,6 +329,32 @@ class FITSViewer:
         self.manager.image_selector.configure(values=list(self.manager.images.keys()))
         if self.manager.active_im():
             self.manager.image_selector.set(self.manager.active_image)
+        self.update_slice_control()
+
+    def update_slice_control(self):
+        """Enable the slice slider when the active image is a data cube."""
+        im = self.manager.im_ref()
+        if not isinstance(im, FitsCube):
+            self.slice_slider.configure(state="disabled")
+            self.slice_label.configure(text="slice: -")
+            return
+
+        steps = max(im.n_slices - 1, 1)
+        self.slice_slider.configure(state="normal", from_=0, to=steps, number_of_steps=steps)
+        self.slice_slider.set(im.slice_index)
+        self.slice_label.configure(text=f"slice: {im.slice_index + 1}/{im.n_slices}")
+
+    def change_slice(self, value):
+        """Show another slice of the active data cube."""
+        im = self.manager.im_ref()
+        if not isinstance(im, FitsCube):
+            return
+        index = int(round(value))
+        if index == im.slice_index:
+            return
+        im.set_slice(index)
+        self.slice_label.configure(text=f"slice: {index + 1}/{im.n_slices}")
+        self.update_display_image()
 
     def change_active_image(self, event=None):
         """Change the active image based on the combobox selection."""
@@ -226,77 +379,161 @@ class FITSViewer:
         #set focus on root again
         self.root.focus_set()
 
-    def load_hdu(self, data, header, image_name):
-        im = FitsImage.load_f_data(data, header, manager=self.manager)
-        im.name = image_name
-        self.manager.images[image_name] = im
-        self.manager.active_image = image_name
-    
     def load_fits(self, file_path):
-        try:
-            image_name = os.path.basename(file_path)
-            
-            hdus = fits.open(file_path)  # Check if the file is a valid FITS file
-            for hdu_num, hdu in enumerate(hdus):
-                # Check if the HDU has image data
-                if hdu.data is not None and hdu.is_image:
-                    if hdu.data.ndim == 3:
-                        for i in range(hdu.data.shape[0]):
-                            self.load_hdu(hdu.data[i], hdu.header, f"[HDU {hdu_num}][dim {i}] - {image_name}")
-                    
-                    else:
-                        self.load_hdu(hdu.data, hdu.header, f"[HDU {hdu_num}] - {image_name}")
-
-            # Manually update the image list
-            self.update_image_list()
-            self.update_display_image()
-
-        except Exception as e:
-            control.critical(f"Error loading file: {e}")
+        """Load a FITS file in the background; images appear as they are ready.
+
+        A directory or a glob pattern loads every matching file in one job.
+        """
+        if os.path.isdir(file_path) or glob.has_magic(file_path):
+            self.manager.loader.submit_many(file_path, self.pmin_entry.get(), self.pmax_entry.get())
+        else:
+            self.manager.loader.submit(file_path, self.pmin_entry.get(), self.pmax_entry.get())
+
+    def open_folder_dialog(self):
+        """Load every FITS file of a directory."""
+        dir_path = filedialog.askdirectory()
+        if dir_path:
+            self.file_path_entry.delete(0, tk.END)
+            self.file_path_entry.insert(0, dir_path)
+            self.load_fits(dir_path)
+        self.root.focus_set()
+
+    def cancel_loading(self):
+        """Cancel every file still being loaded."""
+        self.manager.loader.cancel()
+        self.root.focus_set()
+
+    def stretch_args(self):
+        """(pmin, pmax, stretch, param) as entered in the display controls."""
+        return (
+            self.pmin_entry.get(), self.pmax_entry.get(),
+            self.stretch_menu.get(), self.stretch_param_entry.get(),
+        )
 
     def update_image_cache(self):
         if not self.manager.active_im():
             return
-        self.manager.im_ref().update_image_cache(self.pmin_entry.get(), self.pmax_entry.get())
+        self.manager.im_ref().update_image_cache(*self.stretch_args())
         self.update_display_image()
         # Remove focus from the entry fields by setting focus to the root window
         self.root.focus_set()
 
-    def update_display_image(self):
-        """Efficiently update the display by only rendering the visible portion of the image."""
-        self.tk = self.manager.im_ref().update_display_image(self.image_canvas)
-        self.image_canvas.delete("all")
-        self.image_canvas.create_image(0, 0, anchor="nw", image=self.tk)
+    def change_colormap(self, name):
+        """Show the active image with another colormap; only the palette of the frame changes.
 
-    def update_thumbnail(self):
-        """Update the thumbnail to show the area around the cursor."""
-        if self.coords_frozen:
-            self.root.after(50, self.update_thumbnail)
+        Images opened afterwards start with the same colormap.
+        """
+        settings.colormap = name
+        if not self.manager.active_im():
             return
+        self.manager.im_ref().set_colormap(name)
+        self.update_display_image()
+        self.root.focus_set()
 
+    def apply_zscale(self):
+        """Set the limits of the active image by ZScale on a sample of its pixels."""
         if not self.manager.active_im():
-            self.root.after(50, self.update_thumbnail)
             return
-        
-        # Get mouse position relative to the canvas
-        x_canvas = self.image_canvas.winfo_pointerx() - self.image_canvas.winfo_rootx()
-        y_canvas = self.image_canvas.winfo_pointery() - self.image_canvas.winfo_rooty()
-
-        # Check if the mouse is out of bounds for the image_canvas
-        if not (0 <= x_canvas < self.image_canvas.winfo_width() and 0 <= y_canvas < self.image_canvas.winfo_height()):
-            # If out of bounds, schedule the next update and return early
-            self.root.after(50, self.update_thumbnail)
+        self.manager.im_ref().update_image_cache(*self.stretch_args(), limits="zscale")
+        self.update_display_image()
+        self.root.focus_set()
+
+    def update_display_image(self):
+        """Redraw the view in the next frame; requests until then share one render."""
+        self.frames.request()
+
+    def render_frame(self):
+        """Snapshot the view and hand it to the render worker.
+
+        The tiles and overlays are drawn off the Tk thread; only the
+        finished frame is turned into a PhotoImage here (see show_frame).
+        """
+        if not self.manager.active_im():
+            return
+        im = self.manager.im_ref()
+        # Lazily registered (or evicted) images are materialized on display,
+        # with sampled limits first and exact ones computed in the background
+        if im.ensure_loaded(*self.stretch_args()):
+            self.manager.update_memory()
+        self.manager.loader.refine(im)
+        if im.vmin is None:
             return
 
-        thumbnail_image = self.manager.im_ref().get_thumbnail(
-            self.image_canvas, size=(10, 10), final_size=(150, 150)
-        )
+        view = im.view_state(self.image_canvas)
+        # The pixel under a resting pointer changes with the view
+        self.request_readout()
+        if self._refine_after is not None:
+            self.root.after_cancel(self._refine_after)
+            self._refine_after = None
+
+        if im.renderer.missing(view) >= settings.progressive_tiles:
+            # Large pans, zoom jumps and newly shown images get a coarse
+            # frame now and the full one once the view stops changing
+            self.submit_frame(im, view, coarse=True)
+            self._refine_after = self.root.after(settings.refine_delay_ms, self.refine_frame)
+        else:
+            self.submit_frame(im, view)
 
-        self.thumbnail_photo = ImageTk.PhotoImage(thumbnail_image)
-        self.thumbnail_canvas.create_image(
-            0, 0, anchor="nw", image=self.thumbnail_photo
-        )
-        self.root.after(50, self.update_thumbnail)
+    def refine_frame(self):
+        """Render the full-resolution frame after a coarse one."""
+        self._refine_after = None
+        if not self.manager.active_im():
+            return
+        im = self.manager.im_ref()
+        if im.vmin is None:
+            return
+        self.submit_frame(im, im.view_state(self.image_canvas))
+
+    def submit_frame(self, im, view, coarse=False):
+        self.render_worker.submit(self.render_job, im, view, coarse)
+        if not self._collecting:
+            self._collecting = True
+            self.root.after(RENDER_POLL_MS, self.collect_frames)
+
+    @staticmethod
+    def render_job(im, view, coarse):
+        """Runs on the render worker: the frame of a view, and the view for its overlays."""
+        return im.render_view(view, coarse), view
+
+    def collect_frames(self):
+        """Show the newest finished frame; poll while the worker has frames in flight."""
+        frame = self.render_worker.collect()
+        if frame is not None:
+            image, view = frame[1]
+            self.show_frame(image)
+            # Move the overlays together with the raster they belong to
+            self.overlays.update(overlay_shapes(view))
+        if self.render_worker.busy:
+            self.root.after(RENDER_POLL_MS, self.collect_frames)
+        else:
+            self._collecting = False
+
+    def show_frame(self, image):
+        """Blit a rendered PIL image into the canvas image.
+
+        The PhotoImage is reused while the frame keeps its size and mode, and
+        the canvas item is only pointed at a new one when it has to change.
+        """
+        start = time.perf_counter()
+        mode = "RGB" if image.mode == "P" else image.mode
+        if self.tk is None or self._photo_mode != mode or (self.tk.width(), self.tk.height()) != image.size:
+            # Keep reference to avoid garbage collection
+            self.tk = ImageTk.PhotoImage(mode, image.size)
+            self._photo_mode = mode
+            self.frames.photo_allocations += 1
+            if self.image_item is None:
+                self.image_item = self.image_canvas.create_image(0, 0, anchor="nw", image=self.tk)
+            else:
+                self.image_canvas.itemconfigure(self.image_item, image=self.tk)
+        self.tk.paste(image)
+        self.frames.blitted(time.perf_counter() - start)
+
+    def update_overlays(self):
+        """Move the overlay items to the current state without rendering a frame."""
+        if not self.manager.active_im():
+            self.overlays.clear()
+            return
+        self.overlays.update(overlay_shapes(self.manager.im_ref().view_state(self.image_canvas)))
 
     def zoom(self, event):
         """Zoom in or out relative to the mouse position."""
@@ -335,7 +572,7 @@ class FITSViewer:
     def update_line_position(self, event):
         """Update the end point of the line as the mouse moves for real-time drawing."""
         if self.manager.im_ref().update_line_position(event):
-            self.update_display_image()
+            self.update_overlays()
 
     def toggle_freeze_coords(self, event=None):
         """Toggle freezing of coordinates display."""
@@ -348,9 +585,9 @@ class FITSViewer:
             control.info(f"coordinates frozen on {x_image} {y_image}.")
         else:
             control.info("coordinates unfrozen.")
-            self.update_coordinates()  # Ensure coordinates start updating again if unfrozen
+            self.update_readout()  # Catch up with the pointer
         
-        self.update_display_image()
+        self.update_overlays()
 
     def center_on_coordinate(self, ra, dec, zoom):
         """Center the image on the current mouse coordinates."""
@@ -362,48 +599,85 @@ class FITSViewer:
     def get_panel_ra_dec(self):
         return self.labels["ra"][1].cget("text"), self.labels["dec"][1].cget("text")
     
-    def update_coordinates(self):
-        if self.coords_frozen:
+    def track_pointer(self, event):
+        """Remember the pointer position; the readout follows at most once per frame."""
+        self._pointer = (event.x, event.y)
+        self.request_readout()
+
+    def leave_canvas(self, event):
+        """Forget the pointer and clear the readout, unless it is frozen."""
+        self._pointer = None
+        if not self.coords_frozen:
+            self.clear_readout()
+
+    def request_readout(self):
+        """Update the readout in the next frame interval, for the last pointer position."""
+        if self._readout_scheduled or self._pointer is None:
             return
-
-        if not self.manager.active_im():
-            # Schedule the next update
-            self.root.after(50, self.update_coordinates)
+        self._readout_scheduled = True
+        self.root.after(int(self.frames.interval * 1000), self.update_readout)
+
+    def set_readout(self, name, text):
+        """Set a readout label, only touching the widget when its text changes."""
+        if self._readout_text.get(name) != text:
+            self._readout_text[name] = text
+            self.labels[name][1].configure(text=text)
+
+    def clear_readout(self):
+        """Show no position: N/A labels and no magnifier marker."""
+        self._readout_pixel = None
+        for name in ("x", "y", "ra", "dec", "pixel"):
+            self.set_readout(name, "N/A")
+        self.thumbnail_canvas.itemconfigure(self.thumbnail_marker, state="hidden")
+
+    def update_readout(self):
+        """Show the coordinates, pixel value and magnifier under the pointer.
+
+        X/Y, RA/Dec and the magnifier marker follow the subpixel position
+        (RA/Dec is interpolated by FastWCS, so this is cheap). The pixel
+        value and the magnified crop are only recomputed when the pointer
+        moves to another pixel (or the image, plane or stretch changes).
+        """
+        self._readout_scheduled = False
+        if self.coords_frozen or self._pointer is None or not self.manager.active_im():
             return
 
-        x_image, y_image = self.manager.im_ref().get_image_xy_mouse()
+        im = self.manager.im_ref()
+        x_image, y_image = im.canvas_pos_to_xy(*self._pointer)
         x_int, y_int = round(x_image), round(y_image)
-        
-        # Default values
-        x_value, y_value, ra_value, dec_value, pixel_value = (
-            "N/A",
-            "N/A",
-            "N/A",
-            "N/A",
-            "N/A",
-        )
 
         # Ensure coordinates are within the image boundaries
-        if (
-            0 <= x_int < self.manager.im_ref().image_data.shape[1]
-            and 0 <= y_int < self.manager.im_ref().image_data.shape[0]
-        ):
-            pixel_value = f"{self.manager.im_ref().image_data[y_int - 1, x_int - 1]:.4f}"
-
-            # Calculate RA and Dec if WCS information is available
-            ra_dec = self.manager.im_ref().get_mouse_coords()
-            ra_value, dec_value = f"{ra_dec[0]:.4f}", f"{ra_dec[1]:.4f}"
-
-            # Update coordinate labels
-            x_value = f"{x_image:.2f}"
-            y_value = f"{y_image:.2f}"
-
-        # Update label text using dictionary references
-        self.labels["x"][1].configure(text=x_value)
-        self.labels["y"][1].configure(text=y_value)
-        self.labels["ra"][1].configure(text=ra_value)
-        self.labels["dec"][1].configure(text=dec_value)
-        self.labels["pixel"][1].configure(text=pixel_value)
-        
-        # Schedule the next update
-        self.root.after(50, self.update_coordinates)
+        if not (0 <= x_int < im.shape[1] and 0 <= y_int < im.shape[0]):
+            self.clear_readout()
+            return
+
+        self.set_readout("x", f"{x_image:.2f}")
+        self.set_readout("y", f"{y_image:.2f}")
+
+        # Calculate RA and Dec if WCS information is available
+        ra, dec = im.get_radec_from_xy(x_image, y_image)
+        self.set_readout("ra", f"{ra:.4f}")
+        self.set_readout("dec", f"{dec:.4f}")
+
+        pixel = (id(im), im.plane, x_int, y_int)
+        if pixel != self._readout_pixel:
+            self._readout_pixel = pixel
+            self.set_readout("pixel", f"{im.image_data[y_int - 1, x_int - 1]:.4f}")
+
+        self.update_magnifier(im, x_image, y_image)
+
+    def update_magnifier(self, im, x_image, y_image, size=(10, 10)):
+        """Paste the magnified surroundings of the pointer into the magnifier."""
+        if im.vmin is None:
+            return
+
+        # The crop only changes with its (whole pixel) origin and the stretch
+        origin = (int(x_image - size[0] / 2), int(y_image - size[1] / 2))
+        key = (id(im), im.plane, origin, im.transfer.serial if im.transfer else None, im.colormap)
+        if key != self._magnifier_key:
+            self._magnifier_key = key
+            self.thumbnail_photo.paste(im.get_thumbnail(x_image, y_image, size=size, final_size=MAGNIFIER_SIZE))
+
+        box = im.thumbnail_marker(x_image, y_image, size=size, final_size=MAGNIFIER_SIZE)
+        self.thumbnail_canvas.coords(self.thumbnail_marker, *box)
+        self.thumbnail_canvas.itemconfigure(self.thumbnail_marker, state="normal")
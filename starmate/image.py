@@ -1,30 +1,123 @@
 from astropy.io import fits
 from astropy.wcs import WCS
+from astropy.wcs.utils import proj_plane_pixel_scales
+
+import mmap
+import threading
 
 import numpy as np
 
-from PIL import Image, ImageDraw, ImageTk
+from PIL import Image
 from skimage.draw import line, circle_perimeter, ellipse_perimeter
 
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 
-from starmate.variables import colors
+from starmate.variables import colors, settings
+from starmate.tiles import TiledArray, CompressedImageData, DisplayTiles
+from starmate.preview_cache import PreviewCache, preview_cache
+from starmate.pyramid import ImagePyramid
+from starmate.renderer import TileRenderer, ViewState
+from starmate.wcs_grid import FastWCS, chunked
+from starmate.reproject import ReprojectedArray
+from starmate.stretch import (
+    PixelHistogram, Stretch, STRETCHES, COLORMAPS, apply_colormap, sample_pixels, sampled_limits, valid_param,
+)
+from starmate.utils import LRUCache
 from starmate.measurements import LineMeasurement, CircleMeasurement, EllipseMeasurement
 
 from logpool import control
 
+def is_memmapped(array) -> bool:
+    """Whether an array is a view of a memory-mapped file."""
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap.mmap)):
+            return True
+        array = getattr(array, "base", None)
+    return False
+
+
+def data_bytes(array) -> int:
+    """Memory held by pixel data: the cached tiles of a tiled array, nothing
+    for a memory-mapped file (its pages belong to the OS page cache), and
+    the whole array otherwise."""
+    if array is None or is_memmapped(array):
+        return 0
+    if isinstance(array, TiledArray):
+        return array.cache.size
+    return array.nbytes
+
+
+class HDUData:
+    """Reads the pixels of an HDU on demand and can drop them again.
+
+    The file is opened when the pixels are first needed and closed when
+    they are released, so registered images hold no file handle until
+    they are shown. Without a file path, ``hdu`` is used as it is.
+    Tile-compressed HDUs are wrapped so that only the tiles being looked at
+    are decompressed.
+    """
+
+    def __init__(self, file_path=None, hdu_index=None, hdu=None):
+        self.file_path = file_path
+        self.hdu_index = hdu_index
+        self.hdulist = None  # Opened by this loader, closed on release
+        self._hdu = hdu
+        # The loader workers and the Tk thread may both open the file first
+        self._lock = threading.Lock()
+
+    @property
+    def hdu(self):
+        if self.file_path is None:
+            return self._hdu
+        with self._lock:
+            if self.hdulist is None:
+                self.hdulist = fits.open(self.file_path, lazy_load_hdus=True)
+            return self.hdulist[self.hdu_index]
+
+    def __call__(self):
+        hdu = self.hdu
+        if isinstance(hdu, fits.CompImageHDU):
+            return CompressedImageData(hdu)
+        return hdu.data
+
+    def release(self):
+        """Close the file, or forget the data astropy cached on the HDU; it
+        is re-read from the file on next access."""
+        with self._lock:
+            if self.hdulist is not None:
+                # Arrays still in use keep their memory map alive
+                self.hdulist.close()
+                self.hdulist = None
+                return
+        if self._hdu is None or isinstance(self._hdu, fits.CompImageHDU):
+            return
+        try:
+            del self._hdu.data
+        except AttributeError:
+            pass
+
+
 class FitsImage:
 
-    def __init__(self, image_data, header, manager, name = None):
+    def __init__(self, image_data, header, manager, name = None, data_loader = None, file_path = None, hdu_index = None):
         self.manager = manager
         self.name = name
         
-        self.image_data = image_data
+        # Pixel data may be deferred: when image_data is None, data_loader is
+        # called the first time the pixels are needed (memory-mapped HDUs).
+        self._image_data = image_data
+        self._data_loader = data_loader
         self.header = header
 
+        # Where the pixels come from, if they come from a file
+        self.file_path = file_path
+        self.hdu_index = hdu_index
+
         self.wcs_info = WCS(header, naxis=2)
+        # Interpolated pixel to sky conversion, built on first use
+        self._fast_wcs = None
 
         # Control variables for zooming and panning
         self.zoom_level = 1.0
@@ -33,8 +126,41 @@ class FitsImage:
 
         self.offset_x = 0
         self.offset_y = 0
-
-        self.cached_img_data = None
+        # View to move to when the image is next activated: ("pixel", x, y,
+        # zoom) or ("sky", ra, dec, zoom), see apply_pending_view
+        self.pending_view = None
+
+        # Stretched uint8 tiles of the regions that have been shown, and the
+        # (plane, pyramid) of downsampled levels shown when zoomed out
+        self.display_tiles = DisplayTiles()
+        self._pyramid = None
+
+        # Zoomed screen tiles of the view
+        self.renderer = TileRenderer(self)
+
+        # Display limits of the current stretch, how they were found
+        # ("zscale", "sampled" or "exact") and for which percentiles, and the
+        # pixel histograms exact limits are looked up in (one per plane).
+        # limits_version changes whenever the limits are set.
+        self.vmin = None
+        self.vmax = None
+        self.limits_mode = None
+        self.limits_version = 0
+        self.pmin = 0.0
+        self.pmax = 100.0
+        self.histograms = LRUCache(8)
+        # Preview cache lookups already done: key per plane, stored limits per
+        # (plane, pmin, pmax) and keys whose histogram and levels are stored
+        self._cache_keys = {}
+        self._stored_limits = {}
+        self._stored_previews = set()
+
+        # Transfer function applied between the limits, and its lookup table
+        self.stretch_name = "linear"
+        self.stretch_param = None
+        self.transfer = None
+        # Palette the stretched output is shown with
+        self.colormap = settings.colormap
 
         # Legacy line drawing (keeping for backwards compatibility)
         self.line_start = None
@@ -48,8 +174,208 @@ class FitsImage:
         self.plot_frame = None
         self.plot_canvas = None
 
-    def update_image_cache(self, pmin=0, pmax=100):
-        """Update the cached image based on pmin and pmax values."""
+    def _resident_data(self):
+        """The array the pixels are held in, read on first access: the image
+        itself, or the whole cube of a FitsCube. Released by release()."""
+        if self._image_data is None and self._data_loader is not None:
+            self._image_data = self._data_loader()
+        return self._image_data
+
+    @property
+    def image_data(self):
+        """Pixel data, read from the memory-mapped HDU on first access."""
+        return self._resident_data()
+
+    @image_data.setter
+    def image_data(self, value):
+        self._image_data = value
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether the pixel data has been materialized."""
+        return self._image_data is not None
+
+    @property
+    def shape(self):
+        """(ny, nx) of the image, taken from the header when data is not loaded yet."""
+        if self.is_loaded:
+            return self._image_data.shape[-2:]
+        return (self.header.get("NAXIS2", 0), self.header.get("NAXIS1", 0))
+
+    @property
+    def plane(self):
+        """Index of the displayed plane, None for 2D images."""
+        return None
+
+    @property
+    def is_tiled(self) -> bool:
+        """Whether pixels are produced per tile (e.g. tile-compressed images)."""
+        return isinstance(self.image_data, TiledArray)
+
+    def ensure_loaded(self, pmin=0, pmax=100, stretch=None, param=None, limits=None) -> bool:
+        """Materialize the pixel data and display cache if not done yet.
+
+        The first display uses ``settings.first_limits`` unless ``limits`` is
+        given, or exact limits for ``pmin``/``pmax`` are in the preview cache.
+        Returns True if anything had to be loaded.
+        """
+        if self.vmin is None:
+            if limits is None:
+                try:
+                    stored = self.stored_limits(self.plane, float(pmin), float(pmax))
+                except ValueError:
+                    stored = None
+                limits = "exact" if stored is not None else settings.first_limits
+            self.update_image_cache(pmin, pmax, stretch, param, limits)
+            return True
+        return False
+
+    def prefetch(self):
+        """Read the pixels ahead of their display: fault in every page of
+        memory-mapped data (into the OS page cache) and decompress every tile
+        of tiled data (into its tile cache). In-memory data is already read.
+        """
+        data = self.image_data
+        if isinstance(data, TiledArray):
+            n_ty, n_tx = data.n_tiles
+            for ty in range(n_ty):
+                for tx in range(n_tx):
+                    data.tile(ty, tx)
+        elif is_memmapped(data):
+            # One value per page reads the whole page
+            flat = np.asarray(data).reshape(-1)
+            step = max(mmap.PAGESIZE // flat.itemsize, 1)
+            flat[::step].sum()
+
+    def resident_bytes(self) -> int:
+        """Memory held by this image's pixels and display caches."""
+        # Workers may add histograms meanwhile, so sum a snapshot
+        total = sum(histogram.nbytes for histogram in self.histograms.values())
+        total += self.display_tiles.size + self.renderer.size
+        pyramid = self._pyramid
+        if pyramid is not None:
+            total += pyramid[1].nbytes
+        return total + data_bytes(self._image_data)
+
+    @property
+    def can_release_data(self) -> bool:
+        """Whether the raw pixels can be dropped and read again later."""
+        return self._data_loader is not None
+
+    def release(self):
+        """Drop display caches, and the raw pixels if they can be re-read.
+
+        The image is rehydrated by ensure_loaded when it is next displayed.
+        """
+        self.display_tiles.clear()
+        self.renderer.clear()
+        self._pyramid = None
+        self.vmin = None
+        self.vmax = None
+        self.limits_version += 1
+        self.transfer = None
+        self.histograms.clear()
+
+        if self.can_release_data and self._image_data is not None:
+            self._image_data = None
+            if hasattr(self._data_loader, "release"):
+                self._data_loader.release()
+
+    def stretch(self, data):
+        """Scale raw pixel values to uint8 using the current limits and transfer function."""
+        if self.transfer is None:
+            self.transfer = Stretch(self.vmin, self.vmax, self.stretch_name, self.stretch_param)
+        return self.transfer(data)
+
+    def set_stretch(self, name=None, param=None):
+        """Choose the transfer function; the parameter falls back to the function's default.
+
+        An invalid parameter keeps the previous one of the same function, or
+        its default.
+        """
+        previous = self.stretch_param if name in (None, self.stretch_name) else None
+        if name is not None:
+            if name not in STRETCHES:
+                control.warn(f"Unknown stretch: {name}")
+                return
+            self.stretch_name = name
+        try:
+            param = float(param) if param not in (None, "") else None
+        except ValueError:
+            control.warn(f"Invalid stretch parameter: {param}")
+            param = previous
+        if not valid_param(self.stretch_name, param):
+            control.warn(f"Invalid {self.stretch_name} stretch parameter: {param}, it must be positive")
+            param = previous
+        self.stretch_param = param
+
+    def set_colormap(self, name):
+        """Choose the colormap; the stretched pixels are kept as they are."""
+        if name not in COLORMAPS:
+            control.warn(f"Unknown colormap: {name}")
+            return
+        self.colormap = name
+
+    def build_transfer(self):
+        """Rebuild the lookup table for the current limits and transfer function."""
+        histogram = self.get_histogram() if self.stretch_name == "histeq" else None
+        self.transfer = Stretch(self.vmin, self.vmax, self.stretch_name, self.stretch_param, histogram)
+
+    def get_display_region(self, y_start, y_end, x_start, x_end, level=0, plane=None, data=None, transfer=None):
+        """Get the stretched uint8 pixels of a region of the image, or of a
+        pyramid level (in that level's pixels).
+
+        Only the display tiles overlapping the region are stretched, and
+        they are kept until the stretch changes. The plane and stretch
+        default to the displayed ones; the render worker passes those of
+        its frame.
+        """
+        if data is None:
+            plane, data = self.plane, self.image_data
+        if transfer is None:
+            if self.transfer is None:
+                self.build_transfer()
+            transfer = self.transfer
+        source = self.get_pyramid(plane, data).level(level) if level else data
+        return self.display_tiles.region(
+            source, transfer, (plane, level), y_start, y_end, x_start, x_end
+        )
+
+    def get_pyramid(self, plane=None, data=None):
+        """Pyramid of a plane (the displayed one by default), starting from
+        the levels stored in the preview cache."""
+        if data is None:
+            plane, data = self.plane, self.image_data
+
+        # release() may drop the pyramid meanwhile, so work on one reference
+        pyramid = self._pyramid
+        if pyramid is None or pyramid[0] != plane:
+            stored = {}
+            key = None if isinstance(data, TiledArray) else self.cache_key(plane)
+            entry = preview_cache.load(key) if key else None
+            for name, level in (entry or {}).items():
+                if name.startswith("level_"):
+                    stored[int(name[len("level_"):])] = level
+            pyramid = (plane, ImagePyramid(data, stored))
+            self._pyramid = pyramid
+        return pyramid[1]
+
+    def display_level(self, zoom=None, plane=None, data=None):
+        """Pyramid level matching a zoom (the current one by default)."""
+        zoom = self.zoom_level if zoom is None else zoom
+        if zoom >= 1:
+            return 0
+        return self.get_pyramid(plane, data).level_for_zoom(zoom)
+
+    def update_image_cache(self, pmin=0, pmax=100, stretch=None, param=None, limits="exact"):
+        """Update the cached image based on pmin and pmax values and the stretch function.
+
+        ``limits`` is "exact" for percentiles of every pixel, "sampled" for
+        percentiles of a subsample or "zscale".
+        """
+
+        if stretch is not None:
+            self.set_stretch(stretch, param)
 
         try:
             pmin = float(pmin)
@@ -61,75 +387,208 @@ class FitsImage:
         if pmin >= pmax:
             pmax = pmin + 1
 
-        # Cache processed data once
-        vmin, vmax = np.percentile(self.image_data, [pmin, pmax])
-        img_data = np.clip(self.image_data, vmin, vmax)
-        img_data = ((img_data - vmin) / (vmax - vmin) * 255).astype(np.uint8)
-        self.cached_img_data = img_data  # Store in cache
-        print("Image cache updated")
-
-    def update_display_image(self, image_canvas):
-        """Efficiently update the display by only rendering the visible portion of the image."""
-        if self.cached_img_data is None:
-            return  # If no cache is available, skip
-
-        # Calculate visible area based on offsets and zoom level
-        x_start = max(int(self.offset_x / self.zoom_level), 0)
-        y_start = max(int(self.offset_y / self.zoom_level), 0)
-        visible_width = int(image_canvas.winfo_width() / self.zoom_level)
-        visible_height = int(image_canvas.winfo_height() / self.zoom_level)
-
-        # Ensure the cropped area doesn't exceed image bounds
-        width = min(visible_width, self.cached_img_data.shape[1] - x_start)
-        height = min(visible_height, self.cached_img_data.shape[0] - y_start)
-
-        # Crop and resize only the visible portion of the image
-        cropped_data = self.cached_img_data[
-            y_start : y_start + height, x_start : x_start + width
-        ]
-        display_img = Image.fromarray(cropped_data).convert("RGB").resize(
-            (int(width * self.zoom_level), int(height * self.zoom_level)), Image.NEAREST
-        )
+        self.pmin, self.pmax = pmin, pmax
+        self.limits_mode = limits
+        self.limits_version += 1
+
+        # Limits computed in an earlier session are reused from the disk
+        # cache, also in place of sampled ones. Tiled images take limits from
+        # a sample of tiles and are never read as a whole.
+        key = None if self.is_tiled else self.cache_key()
+        cached_limits = None
+        if key and limits in ("exact", "sampled"):
+            cached_limits = self.stored_limits(self.plane, pmin, pmax)
+        if cached_limits is not None:
+            self.vmin, self.vmax = cached_limits
+            self.limits_mode = "exact"
+        else:
+            self.vmin, self.vmax = self.display_limits(pmin, pmax, limits)
+            if key and limits == "exact":
+                control.submit(
+                    self.store_preview, key, self.plane, self.image_data, self.histograms.get(self.plane),
+                    (pmin, pmax, self.vmin, self.vmax)
+                )
+
+        # Pixels are stretched per display tile when shown
+        self.build_transfer()
+        print("Display limits updated")
+
+    def get_histogram(self, plane=None, data=None):
+        """Histogram of a plane (the displayed one by default): kept in memory,
+        read from the preview cache or computed from the pixels."""
+        if data is None:
+            plane, data = self.plane, self.image_data
+
+        histogram = self.histograms.get(plane)
+        if histogram is not None:
+            return histogram
+
+        if isinstance(data, TiledArray):
+            histogram = PixelHistogram.from_data(data.sample_tiles())
+        else:
+            key = self.cache_key(plane)
+            names = ("histogram", "histogram_edges", "histogram_integer")
+            entry = preview_cache.load(key, names=names) if key else None
+            if entry and "histogram" in entry:
+                histogram = PixelHistogram(
+                    entry["histogram"], entry["histogram_edges"], entry.get("histogram_integer", False)
+                )
+            else:
+                histogram = PixelHistogram.from_data(data)
+
+        if histogram is not None:
+            self.histograms.put(plane, histogram)
+        return histogram
+
+    def sample(self):
+        """A bounded subsample of the finite pixels of the displayed plane."""
+        if self.is_tiled:
+            return sample_pixels(self.image_data.sample_tiles())
+        return sample_pixels(self.image_data)
+
+    def display_limits(self, pmin, pmax, mode="exact"):
+        """(vmin, vmax) of the finite pixels, by ``mode`` (see update_image_cache)."""
+        if mode in ("zscale", "sampled"):
+            return sampled_limits(self.sample(), mode, pmin, pmax)
+
+        histogram = self.get_histogram()
+        if histogram is None:
+            return 0.0, 1.0  # No finite pixels
+        # Tiled images are only refined against their sample
+        data = self.image_data.sample_tiles() if self.is_tiled else self.image_data
+        return histogram.limits(pmin, pmax, data)
+
+    @property
+    def limits_refinable(self) -> bool:
+        """Whether refine_limits has work to do for the displayed plane."""
+        if self.vmin is None or self.is_tiled:
+            return False
+        if self.limits_mode == "sampled":
+            return True
+        return self.limits_mode == "zscale" and self.plane not in self.histograms
+
+    def refine_limits(self) -> bool:
+        """Build the histogram of the displayed plane and replace sampled
+        percentile limits by exact ones. Runs in the background after a
+        sampled first display.
+
+        Returns True if the limits and display cache changed.
+        """
+        version, mode, plane, data = self.limits_version, self.limits_mode, self.plane, self.image_data
+        if mode == "exact" or self.is_tiled or data is None:
+            return False
+
+        histogram = self.get_histogram(plane, data)
+        key = self.cache_key(plane)
+        if histogram is None or mode != "sampled":
+            if key:
+                self.store_preview(key, plane, data, histogram)
+            return False
+
+        vmin, vmax = histogram.limits(self.pmin, self.pmax, data)
+        transfer = Stretch(vmin, vmax, self.stretch_name, self.stretch_param, histogram)
+        if key:
+            self.store_preview(key, plane, data, histogram, (self.pmin, self.pmax, vmin, vmax))
 
-        # Create drawing context
-        draw = ImageDraw.Draw(display_img)
+        # Limits set in the meantime win
+        if version != self.limits_version:
+            return False
+        self.vmin, self.vmax, self.transfer = vmin, vmax, transfer
+        self.limits_mode = "exact"
+        return True
 
+    def cache_key(self, plane=None):
+        """Key of this image (or of a plane) in the persistent preview cache, or None."""
+        if self.file_path is None or self.hdu_index is None:
+            return None
+        plane = self.plane if plane is None else plane
+        # The file is stat'ed once per plane, not on every lookup
+        if plane not in self._cache_keys:
+            self._cache_keys[plane] = PreviewCache.make_key(self.file_path, self.hdu_index, plane=plane)
+        return self._cache_keys[plane]
+
+    def stored_limits(self, plane, pmin, pmax):
+        """Exact limits of a plane for a pair of percentiles from the preview
+        cache, or None. Each pair is looked up on disk once per image."""
+        memo = (plane, pmin, pmax)
+        if memo not in self._stored_limits:
+            key = None if self.is_tiled else self.cache_key(plane)
+            self._stored_limits[memo] = preview_cache.get_limits(key, pmin, pmax) if key else None
+        return self._stored_limits[memo]
+
+    def store_preview(self, key, plane, data, histogram=None, limits=None):
+        """Save display limits (pmin, pmax, vmin, vmax) to the preview cache,
+        with the histogram and small pyramid levels the first time this plane
+        is seen. Building the levels also makes them available for display."""
+        arrays = {}
+        if key not in self._stored_previews:
+            entry = preview_cache.load(key, names=("histogram",))
+            if not entry or "histogram" not in entry:
+                if histogram is not None:
+                    arrays["histogram"] = histogram.counts
+                    arrays["histogram_edges"] = histogram.edges
+                    arrays["histogram_integer"] = np.array(histogram.integer)
+                for level, preview in self.get_pyramid(plane, data).build().items():
+                    arrays[f"level_{level}"] = preview
+            if arrays.get("histogram") is not None or (entry and "histogram" in entry):
+                self._stored_previews.add(key)
+
+        if limits is not None:
+            preview_cache.add_limits(key, *limits, **arrays)
+            pmin, pmax, vmin, vmax = limits
+            self._stored_limits[(plane, pmin, pmax)] = (vmin, vmax)
+        elif arrays:
+            preview_cache.add_arrays(key, **arrays)
+
+    def view_state(self, image_canvas):
+        """Snapshot of the view and its overlays, taken on the Tk thread."""
+        if self.transfer is None:
+            self.build_transfer()
+
+        crosshair = None
         if self.manager.viewer.coords_frozen:
-            # Draw the crosshair at the center of the canvas
+            # The crosshair is drawn at the frozen coordinates
             x_image = self.manager.viewer.labels["x"][1].cget("text")
             y_image = self.manager.viewer.labels["y"][1].cget("text")
+            try:
+                crosshair = (float(x_image), float(y_image))
+            except (ValueError, TypeError):
+                pass  # 'N/A' or not a number
 
-            # Only draw if coordinates are valid (not 'N/A')
-            if x_image != 'N/A' and y_image != 'N/A':
-                try:
-                    frozen_x, frozen_y = self.xy_to_canvas(x_image, y_image)
-                    draw.circle(
-                        (frozen_x, frozen_y), 10, outline=colors.accent, width=3
-                    )
-                except (ValueError, TypeError):
-                    pass  # Skip drawing if conversion fails
-
-        # Draw the legacy line if start and end points are set
-        if self.line_start and self.line_end:
-            # Calculate line coordinates relative to the current view
-            start_x = (self.line_start[0] - x_start) * self.zoom_level
-            start_y = (self.line_start[1] - y_start) * self.zoom_level
-            end_x = (self.line_end[0] - x_start) * self.zoom_level
-            end_y = (self.line_end[1] - y_start) * self.zoom_level
-
-            # Draw the line in red
-            draw.line((start_x, start_y, end_x, end_y), fill="red", width=2)
-
-        # Draw all measurements from the new measurement system
+        measurements = ()
         if hasattr(self.manager, 'measurement_manager'):
-            self.draw_measurements(draw, x_start, y_start)
+            measurements = tuple(self.manager.measurement_manager.get_visible_measurements(self.name))
+
+        return ViewState(
+            zoom=self.zoom_level,
+            offset_x=self.offset_x,
+            offset_y=self.offset_y,
+            width=image_canvas.winfo_width(),
+            height=image_canvas.winfo_height(),
+            plane=self.plane,
+            data=self.image_data,
+            transfer=self.transfer,
+            colormap=self.colormap,
+            crosshair=crosshair,
+            line=(self.line_start, self.line_end) if self.line_start and self.line_end else None,
+            measurements=measurements,
+            measurement_mode=self.measurement_mode,
+            temp_points=tuple(self.temp_measurement_points),
+        )
+
+    def render_view(self, view, coarse=False):
+        """Render a view as an 8-bit PIL image: grayscale, or palette-mapped
+        for a colormap. The overlays are canvas items drawn separately (see
+        starmate.overlay). A ``coarse`` view is a quick low-resolution
+        stand-in for the full one.
+
+        Only reads the snapshot and the caches, so it runs on the render worker.
+        """
+        if coarse:
+            return apply_colormap(self.renderer.render_coarse(view), view.colormap)
+        # Only the screen tiles not rendered before at this zoom and stretch are drawn
+        return apply_colormap(self.renderer.render(view), view.colormap)
 
-        # Display the image with all overlays
-        tk_img = ImageTk.PhotoImage(
-            display_img
-        )  # Keep reference to avoid garbage collection
-        return tk_img
-    
     def xy_to_canvas(self, x_image, y_image):
         """Convert image coordinates to canvas coordinates."""
         x_image = float(x_image)
@@ -168,28 +627,54 @@ class FitsImage:
         
         return x_image, y_image
     
+    @property
+    def fast_wcs(self) -> FastWCS:
+        """Interpolated pixel to sky conversion of this image, for the readout and overlays."""
+        if self._fast_wcs is None:
+            self._fast_wcs = FastWCS(self.wcs_info, self.shape)
+        return self._fast_wcs
+
+    def pixel_to_world(self, x, y, origin=1, chunk_size=None):
+        """RA and Dec (degrees) of arrays of image coordinates.
+
+        NaN where a coordinate is NaN. Large arrays are converted in chunks.
+        """
+        return chunked(lambda x, y: self.fast_wcs.pixel_to_world(x, y, origin), x, y, chunk_size)
+
+    def world_to_pixel(self, ra, dec, origin=1, within=False, chunk_size=None):
+        """Image coordinates of arrays of RA and Dec (degrees).
+
+        NaN where a coordinate is NaN or has no pixel, and with ``within``
+        also where the pixel is outside the image. Large arrays are
+        converted in chunks.
+        """
+        x, y = chunked(lambda ra, dec: self.fast_wcs.world_to_pixel(ra, dec, origin), ra, dec, chunk_size)
+        if within:
+            outside = ~self.in_bounds(x, y, origin)
+            x[outside] = np.nan
+            y[outside] = np.nan
+        return x, y
+
+    def in_bounds(self, x, y, origin=1):
+        """Mask of the image coordinates that fall on a pixel of the image (False for NaN)."""
+        ny, nx = self.shape
+        x = np.asarray(x, dtype=float) - origin
+        y = np.asarray(y, dtype=float) - origin
+        return (x >= -0.5) & (x < nx - 0.5) & (y >= -0.5) & (y < ny - 0.5)
+
     def get_radec_from_xy(self, x_image, y_image):
-        """Get the RA and Dec coordinates from image coordinates."""
-        if hasattr(self.manager.im_ref(), "wcs_info") and self.manager.im_ref().wcs_info:
-            if self.manager.im_ref().header["NAXIS"] == 3:
-                try:
-                    ra_dec = self.manager.im_ref().wcs_info.wcs_pix2world([[x_image, y_image, 0]], 1)[0]
-                except:
-                    ra_dec = self.manager.im_ref().wcs_info.wcs_pix2world([[x_image, y_image]], 1)[0]
-            else:
-                ra_dec = self.manager.im_ref().wcs_info.wcs_pix2world([[x_image, y_image]], 1)[0]
-                
-        return ra_dec[0], ra_dec[1]
+        """Get the RA and Dec coordinates from (1-based) image coordinates."""
+        ra, dec = self.fast_wcs.pixel_to_world(x_image, y_image, 1)
+        return float(ra), float(dec)
     
     def get_xy_from_radec(self, ra, dec):
-        """Get the image coordinates from RA and Dec coordinates."""
+        """Get the (1-based) image coordinates from RA and Dec coordinates."""
         try:
-            if hasattr(self.manager.im_ref(), "wcs_info") and self.manager.im_ref().wcs_info:
-                x_image, y_image = self.manager.im_ref().wcs_info.wcs_world2pix([[ra, dec]], 1)[0]
+            x_image, y_image = self.world_to_pixel(ra, dec)
         except Exception as e:
             control.warn(f"Error converting coordinates: {e}")
-            
-        return x_image, y_image
+            return np.nan, np.nan
+        return float(x_image), float(y_image)
     
     def get_mouse_coords(self):
         """Get the RA and Dec coordinates of the mouse position on the image."""
@@ -206,11 +691,21 @@ class FitsImage:
         
         return ra, dec
     
+    def footprint(self):
+        """RA/Dec of the image corners as a (4, 2) array, or None without a celestial WCS.
+
+        Only the header is used, so this does not load the pixel data.
+        """
+        if not self.wcs_info.has_celestial:
+            return None
+        ny, nx = self.shape
+        return self.wcs_info.calc_footprint(axes=(nx, ny))
+
     def check_xy_image_bounds(self, x_image, y_image):
         """Check if the given image coordinates are within the image bounds."""
-        if x_image < 0 or x_image >= self.image_data.shape[1]:
+        if x_image < 0 or x_image >= self.shape[1]:
             return False
-        if y_image < 0 or y_image >= self.image_data.shape[0]:
+        if y_image < 0 or y_image >= self.shape[0]:
             return False
         
         if np.isnan(x_image) or np.isnan(y_image) or np.isinf(x_image) or np.isinf(y_image):
@@ -218,7 +713,10 @@ class FitsImage:
         
         return True
     
-    def center_on_xy(self, x_image, y_image, zoom_level=2.0):
+    def center_on_xy(self, x_image, y_image, zoom_level=2.0, render=True):
+        """Center the given image coordinates on the canvas with a specified
+        zoom level. Without ``render`` only the view is changed, for an image
+        that is not shown or a caller that redraws itself."""
         if not self.check_xy_image_bounds(x_image, y_image):
             control.warn(f"coordinates out of bounds. {self.name}")
             return
@@ -239,21 +737,23 @@ class FitsImage:
         self.offset_y = max(self.offset_y, 0)
         
         # Update the display with the new centered position
-        self.manager.viewer.update_display_image()
-        control.info(f"Centered on X: {x_image}, Y: {y_image} with zoom: {round(zoom_level, 1)}")
+        if render:
+            self.manager.viewer.update_display_image()
+            control.info(f"Centered on X: {x_image}, Y: {y_image} with zoom: {round(zoom_level, 1)}")
     
     def check_radec_bounds(self, ra, dec):
         """Check if the given RA and Dec coordinates are within the image bounds."""
         x_image, y_image = self.get_xy_from_radec(ra, dec)
         
-        if x_image < 0 or x_image >= self.image_data.shape[1]:
+        if x_image < 0 or x_image >= self.shape[1]:
             return False
-        if y_image < 0 or y_image >= self.image_data.shape[0]:
+        if y_image < 0 or y_image >= self.shape[0]:
             return False
         return True
     
-    def center_on_coordinate(self, ra, dec, zoom_level=2.0):
-        """Center a given RA and Dec coordinate on the canvas with a specified zoom level."""
+    def center_on_coordinate(self, ra, dec, zoom_level=2.0, render=True):
+        """Center a given RA and Dec coordinate on the canvas with a specified
+        zoom level, rendering it unless ``render`` is False (see center_on_xy)."""
         x_image, y_image = self.get_xy_from_radec(ra, dec)
         
         if not self.check_xy_image_bounds(x_image, y_image):
@@ -276,8 +776,45 @@ class FitsImage:
         self.offset_y = max(self.offset_y, 0)
         
         # Update the display with the new centered position
-        self.manager.viewer.update_display_image()
-        control.info(f"Centered on RA: {ra}, Dec: {dec} with zoom: {round(zoom_level, 1)}")
+        if render:
+            self.manager.viewer.update_display_image()
+            control.info(f"Centered on RA: {ra}, Dec: {dec} with zoom: {round(zoom_level, 1)}")
+
+    @property
+    def pixel_scale(self):
+        """Mean pixel size in degrees, or None without a celestial WCS."""
+        if not self.wcs_info.has_celestial:
+            return None
+        return float(np.mean(proj_plane_pixel_scales(self.wcs_info.celestial)))
+
+    def linked_view(self, other):
+        """The view of ``other`` showing what this image shows, as a pending
+        view (see apply_pending_view): the sky position at the canvas center
+        and the same angular scale, through the WCS of both images, or the
+        same pixel position and zoom when one of them has no celestial WCS.
+        """
+        center_x, center_y = self.get_canvas_center_pos()
+        x_image, y_image = self.canvas_pos_to_xy(center_x, center_y)
+        scale, other_scale = self.pixel_scale, other.pixel_scale
+        if scale and other_scale:
+            ra, dec = self.get_radec_from_xy(x_image, y_image)
+            return ("sky", ra, dec, self.zoom_level * other_scale / scale)
+        return ("pixel", x_image, y_image, self.zoom_level)
+
+    def apply_pending_view(self):
+        """Move to the view deferred in ``pending_view``, if any, without rendering.
+
+        Called when the image is activated, so views set for inactive
+        images cost nothing until they are shown.
+        """
+        if self.pending_view is None:
+            return
+        frame, a, b, zoom_level = self.pending_view
+        self.pending_view = None
+        if frame == "sky":
+            self.center_on_coordinate(a, b, zoom_level, render=False)
+        else:
+            self.center_on_xy(a, b, zoom_level, render=False)
         
     def zoom(self, event):
         """Zoom in or out relative to the mouse position."""
@@ -418,7 +955,7 @@ class FitsImage:
         if len(self.temp_measurement_points) == 0:
             # First click - set start point
             self.temp_measurement_points.append((x_image, y_image))
-            image_canvas.bind("<Motion>", lambda e: self._update_temp_line())
+            image_canvas.bind("<Motion>", lambda e: self._update_temp_line() and self.manager.viewer.update_overlays())
             control.info("Line start set. Click to set end point.")
             return False
         else:
@@ -433,7 +970,7 @@ class FitsImage:
         if len(self.temp_measurement_points) == 0:
             # First click - set center
             self.temp_measurement_points.append((x_image, y_image))
-            image_canvas.bind("<Motion>", lambda e: self._update_temp_circle())
+            image_canvas.bind("<Motion>", lambda e: self._update_temp_circle() and self.manager.viewer.update_overlays())
             control.info("Circle center set. Click to set radius.")
             return False
         else:
@@ -448,7 +985,7 @@ class FitsImage:
         if len(self.temp_measurement_points) == 0:
             # First click - set center
             self.temp_measurement_points.append((x_image, y_image))
-            image_canvas.bind("<Motion>", lambda e: self._update_temp_ellipse())
+            image_canvas.bind("<Motion>", lambda e: self._update_temp_ellipse() and self.manager.viewer.update_overlays())
             control.info("Ellipse center set. Click to set semi-major axis.")
             return False
         elif len(self.temp_measurement_points) == 1:
@@ -694,182 +1231,6 @@ class FitsImage:
         self.temp_measurement_points = []
         self.measurement_mode = None
 
-    def draw_measurements(self, image_draw, x_start, y_start):
-        """Draw all visible measurements for this image on the PIL Image."""
-        measurements = self.manager.measurement_manager.get_visible_measurements(self.name)
-
-        for measurement in measurements:
-            # Get drawing instructions
-            drawing_instructions = measurement.draw(
-                self.image_data,
-                self.zoom_level,
-                self.offset_x,
-                self.offset_y,
-                self.xy_to_canvas
-            )
-
-            # Execute drawing instructions
-            for shape_type, params in drawing_instructions:
-                # Adjust coordinates relative to current view
-                if shape_type == "line":
-                    coords = params["coords"]
-                    adjusted_coords = [
-                        (coords[0] - x_start * self.zoom_level),
-                        (coords[1] - y_start * self.zoom_level),
-                        (coords[2] - x_start * self.zoom_level),
-                        (coords[3] - y_start * self.zoom_level)
-                    ]
-                    image_draw.line(adjusted_coords, fill=params["fill"], width=params["width"])
-                elif shape_type == "oval":
-                    coords = params["coords"]
-                    adjusted_coords = [
-                        (coords[0] - x_start * self.zoom_level),
-                        (coords[1] - y_start * self.zoom_level),
-                        (coords[2] - x_start * self.zoom_level),
-                        (coords[3] - y_start * self.zoom_level)
-                    ]
-                    image_draw.ellipse(adjusted_coords, fill=params.get("fill"),
-                                     outline=params.get("outline"), width=params.get("width", 1))
-                elif shape_type == "polygon":
-                    coords = params["coords"]
-                    # Adjust all polygon points
-                    adjusted_coords = []
-                    for i in range(0, len(coords), 2):
-                        adjusted_coords.append(coords[i] - x_start * self.zoom_level)
-                        adjusted_coords.append(coords[i+1] - y_start * self.zoom_level)
-                    image_draw.polygon(adjusted_coords, fill=params.get("fill", ""),
-                                     outline=params.get("outline"), width=params.get("width", 1))
-
-        # Draw temporary measurement in progress
-        if self.measurement_mode and len(self.temp_measurement_points) > 0:
-            self._draw_temp_measurement(image_draw, x_start, y_start)
-
-    def _draw_temp_measurement(self, image_draw, x_start, y_start):
-        """Draw temporary measurement being created."""
-        if self.measurement_mode == 'line' and len(self.temp_measurement_points) >= 1:
-            points = self.temp_measurement_points
-            if len(points) == 2:
-                x1, y1 = self.xy_to_canvas(points[0][0], points[0][1])
-                x2, y2 = self.xy_to_canvas(points[1][0], points[1][1])
-                x1 -= x_start * self.zoom_level
-                y1 -= y_start * self.zoom_level
-                x2 -= x_start * self.zoom_level
-                y2 -= y_start * self.zoom_level
-                image_draw.line([x1, y1, x2, y2], fill="yellow", width=2)
-                # Draw circles at endpoints
-                image_draw.ellipse([x1-3, y1-3, x1+3, y1+3], fill="yellow", outline="yellow")
-                image_draw.ellipse([x2-3, y2-3, x2+3, y2+3], fill="yellow", outline="yellow")
-
-        elif self.measurement_mode == 'circle' and len(self.temp_measurement_points) >= 1:
-            points = self.temp_measurement_points
-            center = points[0]
-
-            # Draw center point
-            cx, cy = self.xy_to_canvas(center[0], center[1])
-            cx -= x_start * self.zoom_level
-            cy -= y_start * self.zoom_level
-            image_draw.ellipse([cx-4, cy-4, cx+4, cy+4], fill="yellow", outline="yellow")
-
-            if len(points) == 2:
-                edge = points[1]
-                dx = edge[0] - center[0]
-                dy = edge[1] - center[1]
-                radius = np.sqrt(dx**2 + dy**2)
-
-                ex, ey = self.xy_to_canvas(center[0] + radius, center[1])
-                canvas_radius = abs(ex - cx)
-
-                # Draw the circle
-                image_draw.ellipse([cx - canvas_radius, cy - canvas_radius,
-                                   cx + canvas_radius, cy + canvas_radius],
-                                  outline="yellow", width=2)
-
-                # Draw radius line
-                edge_x, edge_y = self.xy_to_canvas(edge[0], edge[1])
-                edge_x -= x_start * self.zoom_level
-                edge_y -= y_start * self.zoom_level
-                image_draw.line([cx, cy, edge_x, edge_y], fill="yellow", width=1, dash=(5, 3))
-                # Draw edge point
-                image_draw.ellipse([edge_x-3, edge_y-3, edge_x+3, edge_y+3], fill="yellow", outline="yellow")
-
-        elif self.measurement_mode == 'ellipse' and len(self.temp_measurement_points) >= 1:
-            points = self.temp_measurement_points
-            center = points[0]
-
-            # Draw center point
-            cx, cy = self.xy_to_canvas(center[0], center[1])
-            cx -= x_start * self.zoom_level
-            cy -= y_start * self.zoom_level
-            image_draw.ellipse([cx-4, cy-4, cx+4, cy+4], fill="yellow", outline="yellow")
-
-            if len(points) >= 2:
-                major_point = points[1]
-
-                # Draw center to major axis line
-                mx, my = self.xy_to_canvas(major_point[0], major_point[1])
-                mx -= x_start * self.zoom_level
-                my -= y_start * self.zoom_level
-                image_draw.line([cx, cy, mx, my], fill="yellow", width=2)
-                image_draw.ellipse([mx-3, my-3, mx+3, my+3], fill="yellow", outline="yellow")
-
-                if len(points) == 3:
-                    minor_point = points[2]
-
-                    # Calculate ellipse parameters for preview
-                    dx_major = major_point[0] - center[0]
-                    dy_major = major_point[1] - center[1]
-                    semi_major = np.sqrt(dx_major**2 + dy_major**2)
-                    rotation = np.arctan2(dy_major, dx_major)
-
-                    dx_minor = minor_point[0] - center[0]
-                    dy_minor = minor_point[1] - center[1]
-                    perp_x = -dy_major
-                    perp_y = dx_major
-                    perp_len = np.sqrt(perp_x**2 + perp_y**2)
-                    if perp_len > 0:
-                        perp_x /= perp_len
-                        perp_y /= perp_len
-                    semi_minor = abs(dx_minor * perp_x + dy_minor * perp_y)
-
-                    # Draw the ellipse preview
-                    try:
-                        # Generate ellipse points
-                        theta = np.linspace(0, 2*np.pi, 100)
-                        x_local = semi_major * np.cos(theta)
-                        y_local = semi_minor * np.sin(theta)
-
-                        cos_rot = np.cos(rotation)
-                        sin_rot = np.sin(rotation)
-                        x_rotated = x_local * cos_rot - y_local * sin_rot
-                        y_rotated = x_local * sin_rot + y_local * cos_rot
-
-                        x_img = x_rotated + center[0]
-                        y_img = y_rotated + center[1]
-
-                        # Convert to canvas coordinates and adjust for view
-                        canvas_points = []
-                        for xi, yi in zip(x_img, y_img):
-                            xc, yc = self.xy_to_canvas(xi, yi)
-                            xc -= x_start * self.zoom_level
-                            yc -= y_start * self.zoom_level
-                            canvas_points.append((xc, yc))
-
-                        # Draw ellipse as polygon
-                        if len(canvas_points) > 2:
-                            for i in range(len(canvas_points)):
-                                next_i = (i + 1) % len(canvas_points)
-                                image_draw.line([canvas_points[i], canvas_points[next_i]],
-                                              fill="yellow", width=2)
-                    except:
-                        pass
-
-                    # Draw minor axis point
-                    mnx, mny = self.xy_to_canvas(minor_point[0], minor_point[1])
-                    mnx -= x_start * self.zoom_level
-                    mny -= y_start * self.zoom_level
-                    image_draw.line([cx, cy, mnx, mny], fill="yellow", width=1, dash=(5, 3))
-                    image_draw.ellipse([mnx-3, mny-3, mnx+3, mny+3], fill="yellow", outline="yellow")
-
     def plot_pixel_values(self, pixel_values):
         """Plot the pixel values along the line and display it within the Tkinter interface with a custom background."""
 
@@ -919,53 +1280,36 @@ class FitsImage:
         self.plot_canvas.draw()
         self.plot_canvas.get_tk_widget().pack(fill="both", expand=True)
 
-    def get_thumbnail(self, image_canvas, size=(25, 25), final_size=(50, 50)):
-        """Generate a thumbnail of the cached image for display with precise subpixel alignment of the center square."""
-        if self.cached_img_data is None:
-            print("Cached image data is not available.")
-            return None
+    def get_thumbnail(self, x_image, y_image, size=(25, 25), final_size=(50, 50)):
+        """Magnified RGB crop of the displayed image of ``size`` image pixels around a position."""
+        # Define the cropping area around the position, within the image bounds
+        x_start = max(x_image - size[0] / 2, 0)
+        y_start = max(y_image - size[1] / 2, 0)
+        x_end = min(x_image + size[0] / 2, self.shape[1])
+        y_end = min(y_image + size[1] / 2, self.shape[0])
 
-        x_image, y_image = self.get_image_xy_mouse()
-        
-        # Define the cropping area around the mouse location with subpixel precision
-        x_start = x_image - size[0] / 2
-        y_start = y_image - size[1] / 2
-        x_end = x_image + size[0] / 2
-        y_end = y_image + size[1] / 2
-
-        # Ensure the crop boundaries are within the image bounds
-        x_start = max(x_start, 0)
-        y_start = max(y_start, 0)
-        x_end = min(x_end, self.cached_img_data.shape[1])
-        y_end = min(y_end, self.cached_img_data.shape[0])
-
-        # Extract the thumbnail data, handling subpixel precision using resampling
-        cropped_data = self.cached_img_data[
-            int(y_start) : int(y_end), int(x_start) : int(x_end)
-        ]
-        thumbnail_image = Image.fromarray(cropped_data).convert("RGB").resize(
+        cropped_data = self.get_display_region(
+            int(y_start), int(y_end), int(x_start), int(x_end)
+        )
+        return apply_colormap(Image.fromarray(cropped_data), self.colormap).convert("RGB").resize(
             final_size, Image.NEAREST
         )
 
-        # Calculate the offset within the pixel for accurate subpixel placement
+    @staticmethod
+    def thumbnail_marker(x_image, y_image, size=(25, 25), final_size=(50, 50)):
+        """Box (x0, y0, x1, y1) of the square marking a position in its thumbnail,
+        placed with subpixel precision."""
         subpixel_offset_x = (x_image - int(x_image)) * final_size[0] / size[0]
         subpixel_offset_y = (y_image - int(y_image)) * final_size[1] / size[1]
 
-        # Draw a square at the exact subpixel position within the thumbnail
-        draw = ImageDraw.Draw(thumbnail_image)
         center_x = (final_size[0] / 2) + subpixel_offset_x - 3
         center_y = (final_size[1] / 2) + subpixel_offset_y - 3
         square_size = 10  # Size of the square in pixels
-        draw.rectangle(
-            [
-                (center_x - square_size / 2, center_y - square_size / 2),
-                (center_x + square_size / 2, center_y + square_size / 2),
-            ],
-            outline=colors.accent,
+        return (
+            center_x - square_size / 2, center_y - square_size / 2,
+            center_x + square_size / 2, center_y + square_size / 2,
         )
 
-        return thumbnail_image
-
     @staticmethod
     def load_f_data(data, header, manager = None, name = None):
         fits_image = FitsImage(data, header, manager, name)
@@ -975,10 +1319,50 @@ class FitsImage:
     
     @staticmethod
     def load(file_path, hdu_index=0, manager = None, name = None):
-        hdulist = fits.open(file_path)
+        hdulist = fits.open(file_path, lazy_load_hdus=True)
         hdu = hdulist[hdu_index]
 
-        fits_image = FitsImage(hdu.data, hdu.header, manager, name)
+        fits_image = FitsImage(hdu.data, hdu.header, manager, name, file_path=file_path, hdu_index=hdu_index)
         fits_image.update_image_cache()
 
         return fits_image
+
+    @staticmethod
+    def load_lazy(hdu, manager = None, name = None, file_path = None, hdu_index = None):
+        """Register an HDU with only its header parsed.
+
+        The pixel data is read (memory-mapped where possible) when the
+        image is first activated or measured, from a handle of its own when
+        ``file_path`` is given.
+        """
+        return FitsImage(
+            None, hdu.header, manager, name,
+            data_loader=HDUData(file_path, hdu_index, hdu), file_path=file_path, hdu_index=hdu_index
+        )
+
+
+class ReprojectedImage(FitsImage):
+    """An image resampled onto the pixel grid of ``target``.
+
+    It takes the header and WCS of the target, so pixel coordinates, zoom
+    and offsets mean the same on both. The pixels (see starmate.reproject)
+    are computed per tile as they are shown, and again after the image has
+    been released.
+    """
+
+    def __init__(self, source, target, manager, name = None):
+        super().__init__(
+            None, target.header.copy(), manager, name,
+            data_loader=lambda: ReprojectedArray(source, target),
+        )
+        self.source = source
+        self.target = target
+
+        # Shown like the source
+        self.stretch_name = source.stretch_name
+        self.stretch_param = source.stretch_param
+        self.colormap = source.colormap
+        if source.vmin is not None:
+            self.vmin, self.vmax = source.vmin, source.vmax
+            self.pmin, self.pmax = source.pmin, source.pmax
+            self.limits_mode = source.limits_mode
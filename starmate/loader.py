@@ -0,0 +1,378 @@
+"""
+Background loading of FITS files.
+
+Single files, or whole directories and glob patterns, are parsed on a worker pool: headers, WCS construction and the first
+display stretch all happen off the Tk thread, and so do the exact limits of
+images first shown with sampled ones. Finished images and progress
+messages are queued and picked up by the Tk thread, which inserts them into
+``Manager.images`` and the image selector as they become ready.
+"""
+
+import glob
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from astropy.io import fits
+from logpool import control
+
+from starmate.cube import FitsCube
+from starmate.image import FitsImage
+from starmate.memory import format_bytes
+from starmate.variables import settings
+
+POLL_INTERVAL_MS = 50
+
+# File patterns picked up when a directory is loaded
+FITS_PATTERNS = ("*.fits", "*.fit", "*.fts", "*.fz", "*.fits.gz")
+
+
+def expand_paths(path):
+    """Expand a directory or glob pattern into a sorted list of FITS files."""
+    path = os.path.expanduser(path)
+    if os.path.isdir(path):
+        files = set()
+        for pattern in FITS_PATTERNS:
+            files.update(glob.glob(os.path.join(path, pattern)))
+        return sorted(files)
+    if glob.has_magic(path):
+        return sorted(p for p in glob.glob(path) if os.path.isfile(p))
+    return [path] if os.path.isfile(path) else []
+
+
+def estimate_nbytes(header):
+    """Memory needed to display an HDU: its raw pixels (display tiles are bounded separately)."""
+    naxis = header.get("NAXIS", 0)
+    npix = int(np.prod([header.get(f"NAXIS{i}", 0) for i in range(1, naxis + 1)]))
+    return npix * (abs(header.get("BITPIX", 8)) // 8)
+
+
+def _sort_value(value):
+    # Numbers sort numerically, anything else as text, missing values last
+    if value is None:
+        return (2, 0.0, "")
+    try:
+        return (0, float(value), "")
+    except (TypeError, ValueError):
+        return (1, 0.0, str(value))
+
+
+class LoadJob:
+    """A file being loaded, which can be cancelled between HDUs."""
+
+    def __init__(self, file_path, pmin=0, pmax=100, activate=True):
+        self.file_path = file_path
+        self.name = os.path.basename(file_path)
+        self.pmin = pmin
+        self.pmax = pmax
+        self.activate = activate
+        self.shown = False
+
+        self.future = None
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self) -> bool:
+        """Request cancellation. Returns True if the job never started."""
+        self._cancelled.set()
+        return self.future is not None and self.future.cancel()
+
+
+class FileLoader:
+    """Loads FITS files on a worker pool and hands the images to the Tk thread."""
+
+    def __init__(self, manager, max_workers=None):
+        self.manager = manager
+        self.executor = ThreadPoolExecutor(
+            max_workers or settings.loader_workers, thread_name_prefix="starmate-load"
+        )
+
+        self.jobs = {}
+        self.results = queue.Queue()
+        self._polling = False
+
+        # ids of images whose exact limits are being computed
+        self._refining = set()
+
+    def submit(self, file_path, pmin=0, pmax=100, activate=True) -> LoadJob:
+        """Start loading a file in the background.
+
+        ``pmin``/``pmax`` are used for the first display stretch, which is
+        computed on the worker. Must be called from the Tk thread.
+        """
+        job = LoadJob(file_path, pmin, pmax, activate)
+        self.jobs[id(job)] = job
+        job.future = self.executor.submit(self._load, job)
+
+        control.info(f"Loading {job.name}...")
+        self._start_polling()
+        return job
+
+    def submit_many(self, paths, pmin=0, pmax=100, workers=None, memory_limit_mb=None, sort_key=None):
+        """Load many files (a directory, a glob pattern or a list) in one job.
+
+        Headers of all files are indexed first with ``workers`` threads, the
+        images are registered lazily in ``sort_key`` order, and pixels are
+        prefetched in that order until ``memory_limit_mb`` is reached; the
+        rest are read on demand. Must be called from the Tk thread.
+        """
+        if isinstance(paths, str):
+            label = paths
+            paths = expand_paths(paths)
+        else:
+            label = f"{len(paths)} files"
+
+        if not paths:
+            control.warn(f"No FITS files found for {label}")
+            return None
+
+        job = LoadJob(label, pmin, pmax)
+        job.name = f"{label} ({len(paths)} files)"
+        self.jobs[id(job)] = job
+        job.future = self.executor.submit(
+            self._load_many, job, paths,
+            workers or settings.bulk_workers,
+            settings.bulk_memory_limit_mb if memory_limit_mb is None else memory_limit_mb,
+            sort_key or settings.bulk_sort_key,
+        )
+
+        control.info(f"Indexing {job.name}...")
+        self._start_polling()
+        return job
+
+    def cancel(self, job=None):
+        """Cancel one job, or every running job."""
+        jobs = [job] if job is not None else list(self.jobs.values())
+        for j in jobs:
+            if j.cancel():
+                # Never started, so no worker will report it as done
+                self.jobs.pop(id(j), None)
+        if jobs:
+            control.warn(f"Cancelled loading of {len(jobs)} file(s).")
+
+    def refine(self, im):
+        """Compute the exact limits (and histogram) of an image shown with
+        sampled limits, in the background. The display is refreshed if they
+        change while the image is active. Must be called from the Tk thread.
+        """
+        if not settings.refine_limits or id(im) in self._refining or not im.limits_refinable:
+            return
+        self._refining.add(id(im))
+        self.executor.submit(self._refine, im)
+        self._start_polling()
+
+    @property
+    def busy(self) -> bool:
+        return bool(self.jobs)
+
+    # ---------------------------------------------------------------- worker
+
+    def _load(self, job):
+        """Parse a file on a worker thread, queuing each image as it is ready."""
+        try:
+            # Only headers are read here. Each image opens the file again
+            # when its pixels are needed (see HDUData)
+            image_hdus = self._image_hdus(job.file_path)
+
+            for count, (hdu_num, hdu) in enumerate(image_hdus, start=1):
+                if job.cancelled:
+                    return
+
+                im = self._build_image(job.file_path, hdu, hdu_num)
+
+                # The first image of the file is shown right away, so its
+                # stretch is computed here rather than on the Tk thread
+                if count == 1 and job.activate:
+                    im.ensure_loaded(job.pmin, job.pmax)
+
+                if job.cancelled:
+                    return
+
+                self.results.put(("image", job, im))
+                self.results.put(("progress", job, f"{job.name}: HDU {count}/{len(image_hdus)} ready"))
+
+        except Exception as e:
+            self.results.put(("error", job, e))
+        finally:
+            self.results.put(("done", job, None))
+
+    def _load_many(self, job, paths, workers, memory_limit_mb, sort_key):
+        """Index headers, register images in order and prefetch within the memory limit."""
+        try:
+            with ThreadPoolExecutor(workers, thread_name_prefix="starmate-index") as pool:
+                futures = [pool.submit(self._index_file, path, sort_key) for path in paths]
+
+                entries = []
+                for count, future in enumerate(futures, start=1):
+                    if job.cancelled:
+                        for f in futures:
+                            f.cancel()
+                        return
+                    try:
+                        entries.append(future.result())
+                    except Exception as e:
+                        self.results.put(("progress", job, f"Skipping {paths[count - 1]}: {e}"))
+                    if count % 50 == 0 or count == len(paths):
+                        self.results.put(("progress", job, f"Indexed {count}/{len(paths)} headers"))
+
+                entries.sort(key=lambda entry: (_sort_value(entry["sort_value"]), entry["path"]))
+
+                # Register every image lazily, in order
+                images = []
+                for entry in entries:
+                    for hdu_num, hdu in entry["hdus"]:
+                        images.append((self._build_image(entry["path"], hdu, hdu_num), estimate_nbytes(hdu.header)))
+
+                if job.cancelled or not images:
+                    return
+
+                # The first image is displayed right away
+                images[0][0].ensure_loaded(job.pmin, job.pmax)
+                for im, _ in images:
+                    self.results.put(("image", job, im))
+                self.results.put(("progress", job, f"{len(images)} images from {len(entries)} files registered"))
+
+                # Read the pixels of the following images ahead, while they
+                # fit in the memory limit, and compute their first limits
+                budget = memory_limit_mb * 1024**2 - images[0][1]
+                prefetch = []
+                for im, nbytes in images[1:]:
+                    if nbytes > budget:
+                        break
+                    budget -= nbytes
+                    prefetch.append((pool.submit(self._prefetch, job, im), nbytes))
+                read = [nbytes for future, nbytes in prefetch if future.result()]
+                if read:
+                    self.results.put((
+                        "progress", job,
+                        f"Read ahead {len(read)} of {len(images) - 1} images ({format_bytes(sum(read))})"
+                    ))
+
+        except Exception as e:
+            self.results.put(("error", job, e))
+        finally:
+            self.results.put(("done", job, None))
+
+    @staticmethod
+    def _image_hdus(path, primary=False):
+        """The (index, HDU) of the images of a file, with their headers read
+        and the file closed again; with ``primary`` also the primary header.
+
+        memmap is left to astropy: scaled data (BZERO/BSCALE, e.g. unsigned
+        16-bit frames) cannot be memory-mapped and is read into memory on
+        first access instead.
+        """
+        with fits.open(path, lazy_load_hdus=True) as hdus:
+            image_hdus = [
+                (hdu_num, hdu) for hdu_num, hdu in enumerate(hdus)
+                if hdu.is_image and hdu.header.get("NAXIS", 0) >= 2
+            ]
+            if primary:
+                return image_hdus, hdus[0].header
+        return image_hdus
+
+    @staticmethod
+    def _index_file(path, sort_key):
+        """Read the headers of a file and its value of the sort keyword."""
+        image_hdus, primary_header = FileLoader._image_hdus(path, primary=True)
+
+        # The sort key may live in the primary header or in the image extension
+        sort_value = primary_header.get(sort_key)
+        if sort_value is None and image_hdus:
+            sort_value = image_hdus[0][1].header.get(sort_key)
+
+        return {"path": path, "hdus": image_hdus, "sort_value": sort_value}
+
+    def _refine(self, im):
+        changed = False
+        try:
+            changed = im.refine_limits()
+        except Exception as e:
+            self.results.put(("error", None, e))
+        finally:
+            self.results.put(("refined", None, (im, changed)))
+
+    @staticmethod
+    def _prefetch(job, im) -> bool:
+        """Read an image's pixels and compute its first limits; False if cancelled."""
+        if job.cancelled:
+            return False
+        im.prefetch()
+        im.ensure_loaded(job.pmin, job.pmax)
+        return True
+
+    def _build_image(self, file_path, hdu, hdu_num):
+        name = os.path.basename(file_path)
+        if hdu.header["NAXIS"] == 3:
+            return FitsCube.load_lazy(
+                hdu, manager=self.manager, name=f"[HDU {hdu_num}][cube] - {name}",
+                file_path=file_path, hdu_index=hdu_num
+            )
+        return FitsImage.load_lazy(
+            hdu, manager=self.manager, name=f"[HDU {hdu_num}] - {name}",
+            file_path=file_path, hdu_index=hdu_num
+        )
+
+    # ------------------------------------------------------------- Tk thread
+
+    def _start_polling(self):
+        if not self._polling:
+            self._polling = True
+            self.manager.root.after(POLL_INTERVAL_MS, self.poll)
+
+    def poll(self):
+        """Move finished work from the workers into the UI. Runs on the Tk thread."""
+        new_images = False
+        shown = None
+        refresh = False
+
+        while True:
+            try:
+                kind, job, payload = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == "image":
+                if job.cancelled:
+                    continue
+                self.manager.images[payload.name] = payload
+                new_images = True
+                if job.activate and shown is None and not job.shown:
+                    job.shown = True
+                    shown = payload.name
+            elif kind == "progress":
+                control.info(payload)
+            elif kind == "error":
+                control.critical(f"Error loading file: {payload}")
+            elif kind == "done":
+                self.jobs.pop(id(job), None)
+                if not job.cancelled:
+                    control.info(f"Finished loading {job.name}.")
+            elif kind == "refined":
+                im, changed = payload
+                self._refining.discard(id(im))
+                if changed and self.manager.im_ref() is im:
+                    refresh = True
+
+        if shown is not None:
+            self.manager.activate_image(shown)
+        if new_images:
+            self.manager.viewer.update_image_list()
+            self.manager.update_memory()
+        if shown is not None or refresh:
+            self.manager.viewer.update_display_image()
+
+        if self.jobs or self._refining or not self.results.empty():
+            self.manager.root.after(POLL_INTERVAL_MS, self.poll)
+        else:
+            self._polling = False
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False)
@@ -1,8 +1,19 @@
-from starmate.core import manager
+import sys
+
 
 def main():
 
-    # Define CLI arguments here, e.g.,
-    # parser.add_argument('arg_name', help="Description of argument")
+    # `starmate cache ...` manages the preview cache without starting the UI
+    if len(sys.argv) > 1 and sys.argv[1] == "cache":
+        from starmate.preview_cache import cache_cli
+        cache_cli(sys.argv[2:])
+        return
+
+    # `starmate index ...` scans and queries the header index
+    if len(sys.argv) > 1 and sys.argv[1] == "index":
+        from starmate.archive_index import index_cli
+        index_cli(sys.argv[2:])
+        return
 
+    from starmate.core import manager
     manager.start()
@@ -0,0 +1,75 @@
+"""
+Global memory budget for loaded images.
+
+Images are tracked in least-recently-activated order. When the pixels and
+display caches of all images exceed the budget, inactive images are
+released oldest first; they are rehydrated from their memory-mapped file
+and the preview cache when activated again.
+"""
+
+from collections import OrderedDict
+
+from logpool import control
+
+from starmate.variables import settings
+
+
+def format_bytes(nbytes):
+    return f"{nbytes / 1024**2:.1f} MB"
+
+
+class MemoryBudget:
+    def __init__(self, manager, limit_mb=None):
+        self.manager = manager
+        self.limit_mb = limit_mb if limit_mb is not None else settings.memory_budget_mb
+        self._recent = OrderedDict()
+
+    @property
+    def limit_bytes(self):
+        return int(self.limit_mb * 1024**2)
+
+    def touch(self, name):
+        """Mark an image as the most recently used."""
+        self._recent.pop(name, None)
+        self._recent[name] = True
+
+    def usage(self):
+        """Resident bytes of every loaded image, as {name: bytes}."""
+        return {name: im.resident_bytes() for name, im in self.manager.images.items()}
+
+    def _lru_order(self):
+        # Images never activated come first, then by last activation
+        names = [n for n in self.manager.images if n not in self._recent]
+        names += [n for n in self._recent if n in self.manager.images]
+        return names
+
+    def enforce(self):
+        """Release inactive images, least recently used first, until within budget.
+
+        Returns the names of the released images.
+        """
+        usage = self.usage()
+        total = sum(usage.values())
+
+        released = []
+        for name in self._lru_order():
+            if total <= self.limit_bytes:
+                break
+            if name == self.manager.active_image or usage.get(name, 0) == 0:
+                continue
+
+            self.manager.images[name].release()
+            freed = usage[name] - self.manager.images[name].resident_bytes()
+            if freed > 0:
+                total -= freed
+                released.append(name)
+
+        if released:
+            control.info(f"Memory budget: released {len(released)} image(s), {format_bytes(total)} in use")
+        return released
+
+    def release_inactive(self):
+        """Release every image except the active one."""
+        for name, im in self.manager.images.items():
+            if name != self.manager.active_image:
+                im.release()
\ No newline at end of file
@@ -0,0 +1,162 @@
+"""
+Vector overlays of the image view, as persistent Tk canvas items.
+
+The crosshair, the legacy line, the measurements and the measurement being
+drawn are not baked into the rendered raster. They are described as shapes
+in canvas coordinates, each under a stable key, and an OverlayLayer keeps
+one canvas item per key: a view change or a rubber-band preview moves the
+existing items with coords() and never re-renders the image.
+"""
+
+import numpy as np
+
+from starmate.variables import colors
+
+TAG = "overlay"
+
+# Color of the measurement being drawn
+PREVIEW_COLOR = "yellow"
+
+
+def marker(x, y, radius):
+    """Bounding box of a circle, for an oval item."""
+    return (x - radius, y - radius, x + radius, y + radius)
+
+
+def ellipse_points(center, semi_major, semi_minor, rotation, count=100):
+    """Image coordinates of points along an ellipse, as two arrays."""
+    theta = np.linspace(0, 2 * np.pi, count)
+    x_local = semi_major * np.cos(theta)
+    y_local = semi_minor * np.sin(theta)
+
+    cos_rot, sin_rot = np.cos(rotation), np.sin(rotation)
+    x_img = x_local * cos_rot - y_local * sin_rot + center[0]
+    y_img = x_local * sin_rot + y_local * cos_rot + center[1]
+    return x_img, y_img
+
+
+def temp_shapes(view):
+    """Shapes of the measurement being drawn."""
+    points = view.temp_points
+    mode = view.measurement_mode
+    if not mode or not points:
+        return []
+
+    shapes = []
+    to_canvas = view.xy_to_canvas
+
+    if mode == "line":
+        if len(points) == 2:
+            x1, y1 = to_canvas(*points[0])
+            x2, y2 = to_canvas(*points[1])
+            shapes.append(("line", (x1, y1, x2, y2), {"fill": PREVIEW_COLOR, "width": 2}))
+            shapes.append(("oval", marker(x1, y1, 3), {"fill": PREVIEW_COLOR, "outline": PREVIEW_COLOR}))
+            shapes.append(("oval", marker(x2, y2, 3), {"fill": PREVIEW_COLOR, "outline": PREVIEW_COLOR}))
+        return shapes
+
+    center = points[0]
+    cx, cy = to_canvas(*center)
+    shapes.append(("oval", marker(cx, cy, 4), {"fill": PREVIEW_COLOR, "outline": PREVIEW_COLOR}))
+
+    if mode == "circle" and len(points) == 2:
+        edge = points[1]
+        radius = np.hypot(edge[0] - center[0], edge[1] - center[1])
+        ex, _ = to_canvas(center[0] + radius, center[1])
+        edge_x, edge_y = to_canvas(*edge)
+        shapes.append(("oval", marker(cx, cy, abs(ex - cx)), {"outline": PREVIEW_COLOR, "width": 2}))
+        shapes.append(("line", (cx, cy, edge_x, edge_y), {"fill": PREVIEW_COLOR, "width": 1, "dash": (5, 3)}))
+        shapes.append(("oval", marker(edge_x, edge_y, 3), {"fill": PREVIEW_COLOR, "outline": PREVIEW_COLOR}))
+
+    elif mode == "ellipse" and len(points) >= 2:
+        major_point = points[1]
+        mx, my = to_canvas(*major_point)
+        shapes.append(("line", (cx, cy, mx, my), {"fill": PREVIEW_COLOR, "width": 2}))
+        shapes.append(("oval", marker(mx, my, 3), {"fill": PREVIEW_COLOR, "outline": PREVIEW_COLOR}))
+
+        if len(points) == 3:
+            minor_point = points[2]
+            dx_major = major_point[0] - center[0]
+            dy_major = major_point[1] - center[1]
+            semi_major = np.hypot(dx_major, dy_major)
+            rotation = np.arctan2(dy_major, dx_major)
+
+            # Distance of the minor point from the major axis
+            semi_minor = 0.0
+            if semi_major > 0:
+                dx_minor = minor_point[0] - center[0]
+                dy_minor = minor_point[1] - center[1]
+                semi_minor = abs(-dx_minor * dy_major + dy_minor * dx_major) / semi_major
+
+            x_img, y_img = ellipse_points(center, semi_major, semi_minor, rotation)
+            outline = []
+            for xi, yi in zip(x_img, y_img):
+                outline.extend(to_canvas(xi, yi))
+            shapes.append(("line", tuple(outline), {"fill": PREVIEW_COLOR, "width": 2}))
+
+            mnx, mny = to_canvas(*minor_point)
+            shapes.append(("line", (cx, cy, mnx, mny), {"fill": PREVIEW_COLOR, "width": 1, "dash": (5, 3)}))
+            shapes.append(("oval", marker(mnx, mny, 3), {"fill": PREVIEW_COLOR, "outline": PREVIEW_COLOR}))
+
+    return shapes
+
+
+def overlay_shapes(view):
+    """Keyed shapes of all the overlays of a view, as (key, kind, coords, options)."""
+    shapes = []
+
+    if view.crosshair is not None:
+        x, y = view.xy_to_canvas(*view.crosshair)
+        shapes.append(("crosshair", "oval", marker(x, y, 10), {"outline": colors.accent, "width": 3}))
+
+    if view.line:
+        (x0, y0), (x1, y1) = view.line
+        coords = view.xy_to_canvas(x0, y0) + view.xy_to_canvas(x1, y1)
+        shapes.append(("line", "line", coords, {"fill": "red", "width": 2}))
+
+    for measurement in view.measurements:
+        instructions = measurement.draw(
+            view.data, view.zoom, view.offset_x, view.offset_y, view.xy_to_canvas
+        )
+        for i, (kind, params) in enumerate(instructions):
+            options = {name: value for name, value in params.items() if name != "coords" and value is not None}
+            shapes.append(((measurement.id, i), kind, tuple(params["coords"]), options))
+
+    for i, (kind, coords, options) in enumerate(temp_shapes(view)):
+        shapes.append((("temp", i), kind, coords, options))
+
+    return shapes
+
+
+class OverlayLayer:
+    """Canvas items of the overlays, created once and moved afterwards."""
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.items = {}  # key -> (item id, kind, options)
+
+    def update(self, shapes):
+        """Show exactly the given shapes, reusing the items of their keys."""
+        seen = set()
+        for key, kind, coords, options in shapes:
+            seen.add(key)
+            item = self.items.get(key)
+            if item is not None and item[1] == kind:
+                self.canvas.coords(item[0], *coords)
+                if item[2] != options:
+                    self.canvas.itemconfigure(item[0], **options)
+                    self.items[key] = (item[0], kind, options)
+                continue
+
+            if item is not None:
+                self.canvas.delete(item[0])
+            create = getattr(self.canvas, f"create_{kind}")
+            self.items[key] = (create(*coords, tags=(TAG,), **options), kind, options)
+
+        for key in [key for key in self.items if key not in seen]:
+            self.canvas.delete(self.items.pop(key)[0])
+
+        # Keep the overlays above the image
+        self.canvas.tag_raise(TAG)
+
+    def clear(self):
+        self.update([])
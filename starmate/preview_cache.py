@@ -0,0 +1,171 @@
+"""
+Persistent on-disk cache of display statistics and previews.
+
+Each entry belongs to one HDU of one file and is keyed by the file's path,
+size, modification time and the HDU index, so editing or replacing a file
+invalidates its entries. Entries hold the display limits already computed
+for (pmin, pmax) pairs, a histogram of the pixel values and downsampled
+preview levels. The cache directory is bounded in size and evicted least
+recently used first.
+"""
+
+import argparse
+import hashlib
+import os
+import tempfile
+import threading
+
+import numpy as np
+from logpool import control
+
+from starmate.variables import settings
+
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "starmate", "previews")
+
+
+class PreviewCache:
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or settings.preview_cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes if max_bytes is not None else settings.preview_cache_mb * 1024**2
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(file_path, hdu_index, plane=None):
+        """Cache key of an HDU (or a plane of a cube), or None if the file is gone."""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        ident = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}|{hdu_index}|{plane}"
+        return hashlib.sha1(ident.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def load(self, key, names=None):
+        """Get an entry as a dict of arrays (only ``names`` if given), or None."""
+        path = self._path(key)
+        try:
+            with np.load(path) as npz:
+                entry = {name: npz[name] for name in npz.files if names is None or name in names}
+        except (OSError, ValueError):
+            return None
+
+        # Entries are evicted by modification time, so reading one refreshes it
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def store(self, key, entry):
+        """Write an entry atomically, then keep the cache within its size limit."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **entry)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            control.warn(f"Could not write preview cache: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.prune()
+
+    def get_limits(self, key, pmin, pmax):
+        """Display limits cached for a (pmin, pmax) pair, or None."""
+        entry = self.load(key, names=("limits",))
+        if entry is None or "limits" not in entry:
+            return None
+        for row in entry["limits"]:
+            if row[0] == pmin and row[1] == pmax:
+                return float(row[2]), float(row[3])
+        return None
+
+    def add_limits(self, key, pmin, pmax, vmin, vmax, **arrays):
+        """Record display limits for a (pmin, pmax) pair, plus any other arrays."""
+        with self._lock:
+            entry = self.load(key) or {}
+            limits = entry.get("limits", np.empty((0, 4)))
+            limits = limits[(limits[:, 0] != pmin) | (limits[:, 1] != pmax)]
+            entry["limits"] = np.vstack([limits, [pmin, pmax, vmin, vmax]])
+            entry.update(arrays)
+            self.store(key, entry)
+
+    def add_arrays(self, key, **arrays):
+        """Add arrays to an entry, creating it if needed."""
+        with self._lock:
+            entry = self.load(key) or {}
+            entry.update(arrays)
+            self.store(key, entry)
+
+    def entries(self):
+        """(path, size, mtime) of every entry, oldest first."""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npz"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((path, stat.st_size, stat.st_mtime))
+        return sorted(files, key=lambda f: f[2])
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def prune(self, max_bytes=None):
+        """Delete least recently used entries until the cache fits in max_bytes.
+
+        Returns the number of entries removed.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        files = self.entries()
+        total = sum(size for _, size, _ in files)
+
+        removed = 0
+        for path, size, _ in files:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        return self.prune(0)
+
+
+preview_cache = PreviewCache()
+
+
+def cache_cli(argv):
+    """``starmate cache {info,prune,clear}``: manage the preview cache."""
+    parser = argparse.ArgumentParser(prog="starmate cache", description="Manage the starmate preview cache")
+    parser.add_argument("action", choices=["info", "prune", "clear"])
+    parser.add_argument("--max-mb", type=float, default=None,
+                        help="size to prune the cache down to (defaults to the configured limit)")
+    parser.add_argument("--dir", default=None, help="cache directory")
+    args = parser.parse_args(argv)
+
+    cache = PreviewCache(args.dir)
+    if args.action == "info":
+        print(f"{cache.cache_dir}: {len(cache.entries())} entries, {cache.size() / 1024**2:.1f} MB "
+              f"(limit {cache.max_bytes / 1024**2:.0f} MB)")
+    elif args.action == "prune":
+        max_bytes = None if args.max_mb is None else int(args.max_mb * 1024**2)
+        removed = cache.prune(max_bytes)
+        print(f"Removed {removed} entries, {cache.size() / 1024**2:.1f} MB left")
+    else:
+        print(f"Removed {cache.clear()} entries")
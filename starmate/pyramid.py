@@ -0,0 +1,146 @@
+"""
+Downsampled versions of images for zoomed-out display and previews.
+
+An ImagePyramid holds the 2x area-averaged levels of one image plane.
+Large levels are produced tile by tile from the level below when they are
+looked at; the small levels also stored in the preview cache are built once
+as plain arrays, in one pass over the image.
+"""
+
+import math
+import threading
+
+import numpy as np
+
+from starmate.tiles import TiledArray
+from starmate.variables import settings
+
+
+def downsample(data):
+    """Halve an image by averaging 2x2 blocks, ignoring NaNs.
+
+    An odd last row or column is averaged with itself, so the result has
+    shape ceil(ny / 2), ceil(nx / 2).
+    """
+    data = np.asarray(data, dtype=np.float32)
+    ny, nx = data.shape
+    if ny % 2:
+        data = np.concatenate([data, data[-1:]], axis=0)
+    if nx % 2:
+        data = np.concatenate([data, data[:, -1:]], axis=1)
+
+    blocks = data.reshape(data.shape[0] // 2, 2, data.shape[1] // 2, 2)
+    valid = np.isfinite(blocks)
+    total = np.where(valid, blocks, 0).sum(axis=(1, 3))
+    count = valid.sum(axis=(1, 3))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / count, np.nan).astype(np.float32)
+
+
+class PyramidLevel(TiledArray):
+    """A pyramid level whose tiles are downsampled from the level below."""
+
+    def __init__(self, parent, tile_size=256, cache_bytes=None):
+        shape = (-(-parent.shape[0] // 2), -(-parent.shape[1] // 2))
+        if cache_bytes is None:
+            cache_bytes = settings.pyramid_cache_mb * 1024**2
+        super().__init__(shape, np.float32, (tile_size, tile_size), cache_bytes)
+        self.parent = parent
+
+    def _read_tile(self, ty, tx):
+        y0, y1, x0, x1 = self.tile_bounds(ty, tx)
+        return downsample(self.parent[2 * y0 : 2 * y1, 2 * x0 : 2 * x1])
+
+
+class ImagePyramid:
+    """Levels 0 (the image itself), 1 (half size), 2, ... of an image plane.
+
+    ``stored`` maps level numbers to arrays computed earlier (for example
+    read back from the preview cache).
+
+    Levels are built in the background while the UI reads them, so
+    ``levels`` is never changed in place: a new dict replaces it, and
+    readers work on the dict they got.
+    """
+
+    def __init__(self, data, stored=None):
+        levels = {0: data}
+        levels.update(stored or {})
+        self.levels = levels
+        self._lock = threading.Lock()  # Serializes replacing levels
+
+        # Levels stop once the image fits in 64 pixels
+        size = max(data.shape[-2:])
+        self.n_levels = 1
+        while size > 64:
+            size = -(-size // 2)
+            self.n_levels += 1
+
+    def level(self, n):
+        """Data of level ``n``, created on first use."""
+        n = min(max(n, 0), self.n_levels - 1)
+        data = self.levels.get(n)
+        if data is None:
+            parent = self.level(n - 1)
+            with self._lock:
+                data = self.levels.get(n)
+                if data is None:
+                    data = PyramidLevel(parent)
+                    self.levels = {**self.levels, n: data}
+        return data
+
+    def level_for_zoom(self, zoom):
+        """The coarsest level that still has at least one pixel per screen pixel."""
+        if zoom >= 1:
+            return 0
+        return min(int(math.floor(math.log2(1 / zoom))), self.n_levels - 1)
+
+    def plain_level(self, max_level):
+        """The coarsest level up to ``max_level`` held as a plain array (level
+        0 otherwise), as (level, data). Reading it costs no downsampling."""
+        levels = self.levels
+        for n in range(min(max_level, self.n_levels - 1), 0, -1):
+            if isinstance(levels.get(n), np.ndarray):
+                return n, levels[n]
+        return 0, levels[0]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by levels above 0."""
+        total = 0
+        for n, data in self.levels.items():  # A snapshot, see the class docstring
+            if n == 0:
+                continue
+            total += data.cache.size if isinstance(data, TiledArray) else data.nbytes
+        return total
+
+    def build(self, max_size=None):
+        """Turn the levels no larger than ``max_size`` into plain arrays.
+
+        The largest of them is read tile by tile through the lazy levels
+        below it, the others are downsampled from it. Returns them as a dict
+        mapping level number to array.
+        """
+        max_size = settings.preview_max_size if max_size is None else max_size
+        built = {}
+        for n in range(1, self.n_levels):
+            data = self.level(n)
+            if max(data.shape) > max_size:
+                continue
+            if n - 1 in built:
+                data = downsample(built[n - 1])
+            elif isinstance(data, TiledArray):
+                data = data.read(0, data.shape[0], 0, data.shape[1])
+            built[n] = data
+
+        # Published all at once
+        with self._lock:
+            levels = {**self.levels, **built}
+            self.levels = levels
+
+        # The lazy levels below are not needed for the built ones anymore
+        for n, data in levels.items():
+            if isinstance(data, PyramidLevel) and n not in built:
+                data.cache.clear()
+        return built
@@ -0,0 +1,318 @@
+"""
+Tiled rendering of the image view, off the Tk thread.
+
+The zoomed image is cut into fixed-size screen tiles on a grid anchored to
+the image, so panning moves the viewport over the same tiles. Tiles are
+rendered from the pyramid level matching the zoom and kept in an LRU keyed
+by (plane, level, zoom, tile x, tile y, stretch), so a pan only renders
+the tiles that enter the viewport, and going back to an earlier zoom or
+stretch reuses what was rendered for it. Tiles hold the 8-bit stretch
+output; the colormap is a palette put on the frame, so it is part of the
+view and not of the tile key.
+
+A view missing many tiles can first be shown coarsely (render_coarse):
+its pixels are read with a stride, from the finest pyramid level already in
+memory, stretched directly and enlarged, without going through the caches.
+
+Frames are rendered by a RenderWorker thread. Every request gets a
+generation number; a frame older than the one on screen is discarded, and
+a request replaced by a newer one before it started is never rendered.
+"""
+
+import math
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple
+
+from PIL import Image
+from logpool import control
+
+from starmate.tiles import tile_range
+from starmate.utils import LRUCache
+from starmate.variables import settings
+
+
+@dataclass(frozen=True)
+class ViewState:
+    """Everything a frame is rendered from, captured on the Tk thread so
+    the render worker never reads state the UI is changing."""
+
+    zoom: float
+    offset_x: float
+    offset_y: float
+    width: int
+    height: int
+    plane: Any
+    data: Any
+    transfer: Any
+    colormap: str = "gray"
+    crosshair: Optional[Tuple[float, float]] = None  # Image x, y of the frozen crosshair
+    line: Optional[Tuple[Any, Any]] = None           # Legacy line start and end
+    measurements: Tuple = ()
+    measurement_mode: Optional[str] = None
+    temp_points: Tuple = ()
+
+    @property
+    def left(self) -> int:
+        """Zoomed image pixel at the left edge of the rendered view."""
+        return int(max(self.offset_x, 0))
+
+    @property
+    def top(self) -> int:
+        return int(max(self.offset_y, 0))
+
+    def xy_to_canvas(self, x_image, y_image):
+        """Convert image coordinates to canvas coordinates."""
+        return float(x_image) * self.zoom - self.offset_x, float(y_image) * self.zoom - self.offset_y
+
+
+class TileRenderer:
+    def __init__(self, image, tile_size=None, cache_bytes=None):
+        self.image = image
+        self.tile_size = tile_size or settings.render_tile_size
+        if cache_bytes is None:
+            cache_bytes = settings.render_cache_mb * 1024**2
+        # Tiles are 8-bit, one byte per pixel
+        self.cache = LRUCache(cache_bytes, sizeof=lambda tile: tile.width * tile.height)
+
+        self.rendered = 0  # Tiles rendered (not found in the cache)
+
+    @property
+    def size(self):
+        return self.cache.size
+
+    def clear(self):
+        self.cache.clear()
+
+    def zoomed_shape(self, zoom):
+        """(height, width) of the whole image at ``zoom``, in screen pixels."""
+        ny, nx = self.image.shape
+        return int(ny * zoom), int(nx * zoom)
+
+    def tile(self, level, zoom, tx, ty, plane, data, transfer):
+        """Screen tile (tx, ty) of a plane at ``zoom``, drawn from pyramid ``level``."""
+        im = self.image
+        key = (plane, level, zoom, tx, ty, transfer.serial)
+        tile = self.cache.get(key)
+        if tile is not None:
+            return tile
+
+        ts = self.tile_size
+        height, width = self.zoomed_shape(zoom)
+        x0, y0 = tx * ts, ty * ts
+        x1, y1 = min(x0 + ts, width), min(y0 + ts, height)
+
+        # Screen pixels to level pixels, and the level pixels covering the tile
+        scale = zoom * 2 ** level
+        sx0, sy0, sx1, sy1 = x0 / scale, y0 / scale, x1 / scale, y1 / scale
+        ix0, iy0 = int(sx0), int(sy0)
+        ix1, iy1 = math.ceil(sx1), math.ceil(sy1)
+        source = Image.fromarray(
+            im.get_display_region(iy0, iy1, ix0, ix1, level=level, plane=plane, data=data, transfer=transfer)
+        )
+
+        resample = Image.NEAREST if zoom >= 1 else Image.BILINEAR
+        tile = source.resize(
+            (x1 - x0, y1 - y0), resample,
+            box=(sx0 - ix0, sy0 - iy0, min(sx1 - ix0, source.width), min(sy1 - iy0, source.height)),
+        )
+        self.cache.put(key, tile)
+        self.rendered += 1
+        return tile
+
+    def bounds(self, view):
+        """Zoomed pixels (x0, y0, x1, y1) of a view covered by the image."""
+        full_height, full_width = self.zoomed_shape(view.zoom)
+        x0, y0 = view.left, view.top
+        x1, y1 = min(x0 + view.width, full_width), min(y0 + view.height, full_height)
+        return x0, y0, max(x1, x0), max(y1, y0)
+
+    def missing(self, view) -> int:
+        """Number of screen tiles of a view that are not rendered yet."""
+        level = self.image.display_level(view.zoom, view.plane, view.data)
+        x0, y0, x1, y1 = self.bounds(view)
+        ts = self.tile_size
+        return sum(
+            (view.plane, level, view.zoom, tx, ty, view.transfer.serial) not in self.cache
+            for ty in tile_range(y0, y1, ts)
+            for tx in tile_range(x0, x1, ts)
+        )
+
+    def render(self, view):
+        """The part of ``view`` covered by the image, from its top left
+        (``view.left``, ``view.top``) in zoomed pixels, as an 8-bit PIL image.
+
+        The result is cut to the image, so it can be smaller than the view.
+        """
+        zoom = view.zoom
+        level = self.image.display_level(zoom, view.plane, view.data)
+        x0, y0, x1, y1 = self.bounds(view)
+        frame = Image.new("L", (x1 - x0, y1 - y0))
+        if frame.width == 0 or frame.height == 0:
+            return frame
+
+        ts = self.tile_size
+        tiles = [(tx, ty) for ty in tile_range(y0, y1, ts) for tx in tile_range(x0, x1, ts)]
+        self.prefetch(view, level, tiles)
+        for tx, ty in tiles:
+            tile = self.tile(level, zoom, tx, ty, view.plane, view.data, view.transfer)
+            frame.paste(tile, (tx * ts - x0, ty * ts - y0))
+        return frame
+
+    def prefetch(self, view, level, tiles):
+        """Ask data that produces its tiles concurrently (a ReprojectedArray)
+        for the image pixels under the screen tiles not rendered yet, in one go
+        instead of one tile at a time."""
+        prefetch = getattr(view.data, "prefetch", None)
+        if prefetch is None:
+            return
+        missing = [
+            (tx, ty) for tx, ty in tiles
+            if (view.plane, level, view.zoom, tx, ty, view.transfer.serial) not in self.cache
+        ]
+        if not missing:
+            return
+
+        ts, zoom = self.tile_size, view.zoom
+        txs = [tx for tx, _ in missing]
+        tys = [ty for _, ty in missing]
+        prefetch(
+            int(min(tys) * ts / zoom), math.ceil((max(tys) + 1) * ts / zoom),
+            int(min(txs) * ts / zoom), math.ceil((max(txs) + 1) * ts / zoom),
+        )
+
+    def render_coarse(self, view, factor=None):
+        """A quick stand-in for ``render(view)`` at about 1/``factor`` of the
+        screen resolution. Nothing is cached."""
+        factor = factor or settings.progressive_factor
+        x0, y0, x1, y1 = self.bounds(view)
+        frame_size = (x1 - x0, y1 - y0)
+        if frame_size[0] == 0 or frame_size[1] == 0:
+            return Image.new("L", frame_size)
+
+        # Image pixels per coarse pixel, and the level and stride reaching it
+        pixel = factor / view.zoom
+        pyramid = self.image.get_pyramid(view.plane, view.data)
+        level, source = pyramid.plain_level(max(int(math.floor(math.log2(pixel))), 0))
+        scale = view.zoom * 2 ** level  # Screen pixels per source pixel
+        step = max(int(pixel / 2 ** level), 1)
+
+        sx0, sy0, sx1, sy1 = x0 / scale, y0 / scale, x1 / scale, y1 / scale
+        ix0, iy0 = int(sx0), int(sy0)
+        ix1, iy1 = min(math.ceil(sx1), source.shape[1]), min(math.ceil(sy1), source.shape[0])
+        block = Image.fromarray(view.transfer(source[iy0:iy1:step, ix0:ix1:step]))
+
+        resample = Image.NEAREST if view.zoom >= 1 else Image.BILINEAR
+        return block.resize(
+            frame_size, resample,
+            box=(
+                (sx0 - ix0) / step, (sy0 - iy0) / step,
+                min((sx1 - ix0) / step, block.width), min((sy1 - iy0) / step, block.height),
+            ),
+        )
+
+
+class RenderWorker:
+    """Runs render jobs on one background thread, newest request first."""
+
+    def __init__(self):
+        self.results = queue.Queue()
+        self.generation = 0  # Of the latest request
+        self.shown = 0       # Of the latest frame handed out by collect
+
+        self._job = None
+        self._running = 0
+        self._cond = threading.Condition()
+        self._stopped = False
+
+        # Statistics
+        self.rendered = 0
+        self.skipped = 0  # Replaced by a newer request before starting
+        self.stale = 0    # Finished after a newer frame
+        self.durations = deque(maxlen=120)
+
+        self.thread = threading.Thread(target=self._loop, name="starmate-render", daemon=True)
+        self.thread.start()
+
+    def submit(self, render, *args) -> int:
+        """Queue ``render(*args)``, replacing a request that has not started yet.
+
+        Returns the generation number of the request.
+        """
+        with self._cond:
+            self.generation += 1
+            if self._job is not None:
+                self.skipped += 1
+            self._job = (self.generation, render, args)
+            self._cond.notify()
+            return self.generation
+
+    @property
+    def busy(self) -> bool:
+        """Whether a request is pending or rendering, or a frame is waiting to be collected."""
+        with self._cond:
+            return self._job is not None or self._running > 0 or not self.results.empty()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._job is None and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                generation, render, args = self._job
+                self._job = None
+                self._running += 1
+
+            start = time.perf_counter()
+            try:
+                self.results.put((generation, render(*args), None, time.perf_counter() - start))
+            except Exception as e:
+                self.results.put((generation, None, e, time.perf_counter() - start))
+            finally:
+                with self._cond:
+                    self._running -= 1
+
+    def collect(self):
+        """The newest finished frame not older than the one shown, as
+        (generation, result), or None. Older frames are discarded."""
+        latest = None
+        while True:
+            try:
+                generation, result, error, duration = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            self.durations.append(duration)
+            if error is not None:
+                control.critical(f"Error rendering frame: {error}")
+                continue
+            self.rendered += 1
+            if generation <= self.shown or (latest is not None and generation <= latest[0]):
+                self.stale += 1
+                continue
+            if latest is not None:
+                self.stale += 1
+            latest = (generation, result)
+
+        if latest is not None:
+            self.shown = latest[0]
+        return latest
+
+    def stats(self) -> dict:
+        durations = list(self.durations)
+        return {
+            "rendered": self.rendered,
+            "skipped": self.skipped,
+            "stale": self.stale,
+            "mean_ms": sum(durations) / len(durations) * 1000 if durations else 0.0,
+            "max_ms": max(durations) * 1000 if durations else 0.0,
+        }
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
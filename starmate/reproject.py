@@ -0,0 +1,264 @@
+"""
+Resampling of an image onto the pixel grid of another image.
+
+A ReprojectedArray has the shape of a target image and holds the pixels of
+a source image: every target pixel center is converted to the sky with the
+target WCS and back to a source pixel with the source WCS, and the source
+is interpolated there (bilinearly, or at the nearest pixel). Target pixels
+off the source are NaN.
+
+Like any TiledArray, only the tiles that are read are computed, so showing
+a view only costs the tiles under it. The tiles missing from a read are
+computed together by a shared pool of worker processes. Each job gets the
+two WCS and the cutout of the source under its tile, so workers never open
+files and do not care how the source is stored. Tiles are cached per
+reprojection, and a reprojection is kept for each (source, target) pair.
+
+Strided reads, as done for the coarse first frame of a view, are sampled
+directly at the nearest source pixels instead of computing whole tiles.
+"""
+
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.ndimage import map_coordinates
+
+from starmate.tiles import TiledArray, tile_range
+from starmate.variables import settings
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool():
+    """The process pool tiles are computed in, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Worker processes are spawned, not forked from the threaded UI
+            _pool = ProcessPoolExecutor(
+                settings.reproject_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def shutdown():
+    """Stop the worker processes, dropping tiles not started yet."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def compatible(source_wcs, target_wcs) -> bool:
+    """Whether two WCS are celestial and in the same sky frame."""
+    if not (source_wcs.has_celestial and target_wcs.has_celestial):
+        return False
+    source_type = source_wcs.wcs.ctype[source_wcs.wcs.lng][:4]
+    target_type = target_wcs.wcs.ctype[target_wcs.wcs.lng][:4]
+    return source_type == target_type
+
+
+def target_to_source(source_wcs, target_wcs, x, y):
+    """0-based source pixels of 0-based target pixels, NaN where there are none."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        world = target_wcs.all_pix2world(x, y, 0)
+        lon, lat = world[target_wcs.wcs.lng], world[target_wcs.wcs.lat]
+        world = (lon, lat) if source_wcs.wcs.lng == 0 else (lat, lon)
+        return source_wcs.all_world2pix(*world, 0, quiet=True)
+
+
+def inside(x, y, shape):
+    """Mask of the 0-based pixel coordinates on an image of ``shape`` (False for NaN)."""
+    ny, nx = shape
+    return (x >= -0.5) & (x < nx - 0.5) & (y >= -0.5) & (y < ny - 0.5)
+
+
+def reproject_tile(source_wcs, target_wcs, source_shape, bounds, cutout, origin, order=1):
+    """Pixels [y0:y1, x0:x1] = ``bounds`` of the target grid, interpolated
+    from ``cutout``, the source pixels from (x, y) = ``origin`` on.
+
+    Runs in the worker processes.
+    """
+    y0, y1, x0, x1 = bounds
+    y, x = np.mgrid[y0:y1, x0:x1]
+    sx, sy = target_to_source(source_wcs, target_wcs, x.ravel(), y.ravel())
+
+    out = np.full(sx.shape, np.nan, dtype=np.float32)
+    on = inside(sx, sy, source_shape)
+    if on.any():
+        coordinates = [sy[on] - origin[1], sx[on] - origin[0]]
+        # Half a pixel past the edge rows and columns takes their value
+        out[on] = map_coordinates(cutout, coordinates, order=order, mode="nearest")
+    return out.reshape(y1 - y0, x1 - x0)
+
+
+class ReprojectedArray(TiledArray):
+    """Pixels of ``source`` on the grid of ``target`` (both FitsImage).
+
+    The source pixels are those of its displayed plane at creation.
+    ``order`` is 1 for bilinear interpolation, 0 for the nearest pixel.
+    """
+
+    def __init__(self, source, target, order=None, tile_size=None, cache_bytes=None):
+        if not compatible(source.wcs_info, target.wcs_info):
+            raise ValueError(f"{source.name} and {target.name} do not share a celestial frame")
+
+        tile_size = tile_size or settings.display_tile_size
+        if cache_bytes is None:
+            cache_bytes = settings.reproject_cache_mb * 1024**2
+        super().__init__(target.shape, np.float32, (tile_size, tile_size), cache_bytes)
+
+        self.source_data = source.image_data
+        self.source_shape = tuple(source.shape)
+        self.source_wcs = source.wcs_info
+        self.target_wcs = target.wcs_info
+        self.order = settings.reproject_order if order is None else order
+
+        # Pixel to sky of the target is interpolated, sky to pixel of the source is exact
+        self._target_to_world = target.pixel_to_world
+        self._world_to_source = source.world_to_pixel
+        # Whether the world axes of the two WCS are in a different order
+        self._swap = source.wcs_info.wcs.lng != target.wcs_info.wcs.lng
+
+        # Corners of the source on the target grid, for tiles that contain one
+        ny, nx = self.source_shape
+        self._corners = np.array([[-0.5, -0.5], [nx - 0.5, -0.5], [-0.5, ny - 0.5], [nx - 0.5, ny - 0.5]])
+        world = source.pixel_to_world(*self._corners.T, origin=0)
+        self._corners_target = np.column_stack(
+            target.world_to_pixel(*(world[::-1] if self._swap else world), origin=0)
+        )
+
+        self._pending = {}  # (ty, tx) -> future of a tile being computed
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.computed = 0  # Tiles computed in the pool
+        self.empty = 0     # Tiles found to be off the source
+
+    def to_source(self, x, y):
+        """0-based source pixels of 0-based target pixels."""
+        world = self._target_to_world(x, y, origin=0)
+        return self._world_to_source(*(world[::-1] if self._swap else world), origin=0)
+
+    def _source_box(self, ty, tx):
+        """Source pixels (y0, y1, x0, x1) a tile is interpolated from, or None."""
+        y0, y1, x0, x1 = self.tile_bounds(ty, tx)
+
+        # Source pixels under the border of the tile...
+        n = 16
+        edge_x = np.linspace(x0 - 0.5, x1 - 0.5, n)
+        edge_y = np.linspace(y0 - 0.5, y1 - 0.5, n)
+        x = np.concatenate([edge_x, edge_x, np.full(n, x0 - 0.5), np.full(n, x1 - 0.5)])
+        y = np.concatenate([np.full(n, y0 - 0.5), np.full(n, y1 - 0.5), edge_y, edge_y])
+        sx, sy = self.to_source(x, y)
+
+        # ...and the corners of the source that fall on it
+        cx, cy = self._corners_target.T
+        on_tile = (cx >= x0 - 0.5) & (cx < x1 - 0.5) & (cy >= y0 - 0.5) & (cy < y1 - 0.5)
+        sx = np.concatenate([sx, self._corners[on_tile, 0]])
+        sy = np.concatenate([sy, self._corners[on_tile, 1]])
+
+        finite = np.isfinite(sx) & np.isfinite(sy)
+        if not finite.any():
+            return None
+        ny, nx = self.source_shape
+        # A margin for the interpolation and the curvature between border points
+        bx0 = max(int(math.floor(sx[finite].min())) - 2, 0)
+        by0 = max(int(math.floor(sy[finite].min())) - 2, 0)
+        bx1 = min(int(math.ceil(sx[finite].max())) + 3, nx)
+        by1 = min(int(math.ceil(sy[finite].max())) + 3, ny)
+        if bx1 <= bx0 or by1 <= by0:
+            return None
+        return by0, by1, bx0, bx1
+
+    def _submit(self, ty, tx):
+        """Start computing a tile in the pool; None for a tile off the source."""
+        box = self._source_box(ty, tx)
+        if box is None:
+            return None
+        by0, by1, bx0, bx1 = box
+        cutout = np.asarray(self.source_data[by0:by1, bx0:bx1], dtype=np.float32)
+        return pool().submit(
+            reproject_tile, self.source_wcs, self.target_wcs, self.source_shape,
+            self.tile_bounds(ty, tx), cutout, (bx0, by0), self.order,
+        )
+
+    def compute(self, tiles):
+        """Make sure the tiles (ty, tx) are cached, computing the missing
+        ones at the same time. Tiles another thread is already computing
+        are waited for, not computed again."""
+        waiting = {}
+        with self._lock:
+            for index in tiles:
+                if index in self.cache:
+                    continue
+                future = self._pending.get(index)
+                if future is None:
+                    future = self._submit(*index)
+                    if future is None:
+                        y0, y1, x0, x1 = self.tile_bounds(*index)
+                        self.cache.put(index, np.full((y1 - y0, x1 - x0), np.nan, dtype=np.float32))
+                        self.empty += 1
+                        continue
+                    self._pending[index] = future
+                    self.computed += 1
+                waiting[index] = future
+
+        for index, future in waiting.items():
+            try:
+                self.cache.put(index, future.result())
+            finally:
+                with self._lock:
+                    if self._pending.get(index) is future:
+                        del self._pending[index]
+
+    def prefetch(self, y0, y1, x0, x1):
+        """Compute the tiles overlapping [y0:y1, x0:x1] that are not cached, all at once."""
+        y0, y1 = max(y0, 0), min(y1, self.shape[0])
+        x0, x1 = max(x0, 0), min(x1, self.shape[1])
+        if y1 <= y0 or x1 <= x0:
+            return
+        th, tw = self.tile_shape
+        self.compute([(ty, tx) for ty in tile_range(y0, y1, th) for tx in tile_range(x0, x1, tw)])
+
+    def _read_tile(self, ty, tx):
+        self.compute([(ty, tx)])
+        return self.cache.get((ty, tx))
+
+    def read(self, y0, y1, x0, x1):
+        self.prefetch(y0, y1, x0, x1)
+        return super().read(y0, y1, x0, x1)
+
+    def sample_tiles(self, count=None):
+        count = settings.tile_sample_count if count is None else count
+        n_ty, n_tx = self.n_tiles
+        indices = np.linspace(0, n_ty * n_tx - 1, min(count, n_ty * n_tx)).astype(int)
+        self.compute([divmod(int(i), n_tx) for i in np.unique(indices)])
+        return super().sample_tiles(count)
+
+    def sample(self, x, y):
+        """Source pixels nearest to 0-based target pixels, NaN off the source. Nothing is cached."""
+        sx, sy = self.to_source(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+        out = np.full(sx.shape, np.nan, dtype=np.float32)
+        on = inside(sx, sy, self.source_shape)
+        if on.any():
+            ix = np.rint(sx[on]).astype(int).clip(0, self.source_shape[1] - 1)
+            iy = np.rint(sy[on]).astype(int).clip(0, self.source_shape[0] - 1)
+            out[on] = self.source_data[iy, ix]
+        return out
+
+    def __getitem__(self, key):
+        # Strided reads (the coarse first frame of a view) only need the sampled pixels
+        if (
+            isinstance(key, tuple) and len(key) == 2
+            and all(isinstance(k, slice) and (k.step or 1) > 1 for k in key)
+        ):
+            ys = np.arange(*key[0].indices(self.shape[0]))
+            xs = np.arange(*key[1].indices(self.shape[1]))
+            return self.sample(*np.meshgrid(xs, ys))
+        return super().__getitem__(key)
@@ -0,0 +1,115 @@
+"""
+Frame scheduling for the image view.
+
+Events that change the view (pan, zoom, stretch, ...) only mark it dirty.
+The scheduler renders at most one frame per frame interval, from whatever
+the state is when the frame runs, so a burst of mouse events costs one
+render instead of one per event. Requests folded into a later frame are
+counted as dropped frames.
+
+With a render worker, a frame here only snapshots the view and submits
+it, so the frame timings measure how long the Tk thread was busy; the
+worker's own render timings are reported next to them, as are the times
+spent blitting finished frames into the canvas.
+"""
+
+import time
+from collections import deque
+
+from logpool import control
+
+from starmate.variables import settings
+
+
+class FrameScheduler:
+    def __init__(self, root, render, fps=None, worker=None):
+        self.root = root
+        self.render = render
+        self.worker = worker
+        self.fps = fps or settings.target_fps
+
+        self.dirty = False
+        self._scheduled = False
+        self._pending = 0  # Requests since the last frame
+        self._last_frame = 0.0
+
+        # Statistics
+        self.frames = 0
+        self.dropped = 0
+        self.durations = deque(maxlen=120)  # Seconds per recent frame
+        self.blits = deque(maxlen=120)      # Seconds per recent blit to the canvas
+        self.photo_allocations = 0
+
+    @property
+    def interval(self) -> float:
+        return 1.0 / self.fps
+
+    def request(self):
+        """Mark the view dirty; it is rendered in the next frame."""
+        self.dirty = True
+        self._pending += 1
+        if self._scheduled:
+            return
+
+        self._scheduled = True
+        wait = self._last_frame + self.interval - time.perf_counter()
+        if wait <= 0:
+            self.root.after_idle(self._run)
+        else:
+            self.root.after(int(wait * 1000) + 1, self._run)
+
+    def _run(self):
+        self._scheduled = False
+        if not self.dirty:
+            return
+
+        self.dirty = False
+        self.dropped += self._pending - 1
+        self._pending = 0
+
+        start = time.perf_counter()
+        try:
+            self.render()
+        finally:
+            end = time.perf_counter()
+            self._last_frame = end
+            self.durations.append(end - start)
+            self.frames += 1
+
+        if settings.render_stats_every and self.frames % settings.render_stats_every == 0:
+            control.info(self.report())
+
+    def blitted(self, seconds):
+        """Record the time taken to put a finished frame on the canvas."""
+        self.blits.append(seconds)
+
+    def stats(self) -> dict:
+        """Frame counts and timings (in ms) of the recent frames."""
+        durations = list(self.durations)
+        blits = list(self.blits)
+        return {
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "last_ms": durations[-1] * 1000 if durations else 0.0,
+            "mean_ms": sum(durations) / len(durations) * 1000 if durations else 0.0,
+            "max_ms": max(durations) * 1000 if durations else 0.0,
+            "blit_mean_ms": sum(blits) / len(blits) * 1000 if blits else 0.0,
+            "blit_max_ms": max(blits) * 1000 if blits else 0.0,
+            "photo_allocations": self.photo_allocations,
+        }
+
+    def report(self) -> str:
+        s = self.stats()
+        report = (
+            f"Rendered {s['frames']} frames ({s['dropped']} dropped), "
+            f"last {s['last_ms']:.1f} ms, mean {s['mean_ms']:.1f} ms, max {s['max_ms']:.1f} ms; "
+            f"blit mean {s['blit_mean_ms']:.1f} ms, max {s['blit_max_ms']:.1f} ms "
+            f"({s['photo_allocations']} photo images)"
+        )
+        if self.worker is not None:
+            w = self.worker.stats()
+            report += (
+                f"; worker rendered {w['rendered']} ({w['skipped']} skipped, {w['stale']} stale), "
+                f"mean {w['mean_ms']:.1f} ms, max {w['max_ms']:.1f} ms"
+            )
+        return report
@@ -0,0 +1,365 @@
+"""
+Display limits and transfer functions.
+
+A fine histogram of the finite pixels is built once per image (two passes
+over the data, in row blocks, so it never holds a full-size temporary). Its
+cumulative counts turn any percentile into a bin lookup. When a bin is too
+wide for the requested stretch, the exact value is found by selecting only
+the pixels that fall inside that bin.
+
+For a first display, limits can instead come from a strided sample of a
+bounded number of pixels (ZScale or sampled percentiles), in constant time.
+
+Transfer functions (linear, log, ...) are applied through a lookup table:
+values between the display limits are quantized to 2**16 levels and the
+table gives the 8-bit output of every level, so changing the function only
+rebuilds the table.
+
+Colormaps are 256-entry palettes applied to the 8-bit output when a frame
+is shown, so changing the colormap never touches pixel data.
+"""
+
+import functools
+import itertools
+
+import numpy as np
+from astropy.visualization import ZScaleInterval
+from matplotlib import colormaps
+
+from starmate.variables import settings
+
+# Pixels read per block when scanning the data
+BLOCK_PIXELS = 1 << 22
+
+
+def iter_blocks(data):
+    """Flattened blocks of rows of ``data`` (any 1D or 2D array-like)."""
+    if data.ndim == 1:
+        for start in range(0, data.shape[0], BLOCK_PIXELS):
+            yield np.asarray(data[start:start + BLOCK_PIXELS])
+        return
+
+    rows = max(BLOCK_PIXELS // max(data.shape[1], 1), 1)
+    for y in range(0, data.shape[0], rows):
+        yield np.asarray(data[y:y + rows]).ravel()
+
+
+def sample_pixels(data, max_samples=None):
+    """Finite pixels of ``data`` on a regular grid of at most ``max_samples`` points.
+
+    Only every stride-th row is read, so the cost does not grow with the image.
+    """
+    max_samples = settings.limit_samples if max_samples is None else max_samples
+    if data.ndim == 1:
+        stride = max(int(np.ceil(data.shape[0] / max_samples)), 1)
+        sample = np.asarray(data[::stride])
+    else:
+        stride = max(int(np.ceil(np.sqrt(data.shape[0] * data.shape[1] / max_samples))), 1)
+        sample = np.asarray(data[::stride, ::stride]).ravel()
+    return sample[np.isfinite(sample)]
+
+
+def sampled_limits(sample, mode, pmin=0, pmax=100):
+    """Display limits from a sample of pixels: IRAF ZScale, or percentiles.
+
+    Returns (0, 1) for an empty sample.
+    """
+    if sample.size == 0:
+        return 0.0, 1.0
+    if mode == "zscale":
+        # The line fit is iterative, so it gets its own (smaller) subsample
+        interval = ZScaleInterval(n_samples=settings.zscale_samples, contrast=settings.zscale_contrast)
+        vmin, vmax = interval.get_limits(sample)
+    else:
+        vmin, vmax = np.percentile(sample, [pmin, pmax])
+    return float(vmin), float(vmax)
+
+
+class PixelHistogram:
+    """Cumulative histogram of an image for fast percentile lookups.
+
+    Percentiles are refined against the pixel data when it is passed in
+    (usually a memory-mapped array); without it the histogram estimate is
+    returned. Refined values are remembered, so each is selected once.
+    """
+
+    def __init__(self, counts, edges, integer=False):
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.edges = np.asarray(edges, dtype=np.float64)
+        # One bin per value of integer data, see from_data
+        self.integer = bool(integer)
+        self.cumulative = np.cumsum(self.counts)
+        self._exact = {}
+
+    @classmethod
+    def from_data(cls, data, bins=None):
+        """Histogram of the finite pixels of ``data``, or None if there are none."""
+        bins = settings.histogram_bins if bins is None else bins
+
+        lo, hi = np.inf, -np.inf
+        for block in iter_blocks(data):
+            block = block[np.isfinite(block)]
+            if block.size:
+                lo = min(lo, float(block.min()))
+                hi = max(hi, float(block.max()))
+        if lo > hi:
+            return None
+
+        # Integer data with fewer distinct values than bins gets one bin per
+        # value, centered on it, so lookups are exact without refinement
+        integer = np.issubdtype(data.dtype, np.integer) and hi - lo + 1 <= bins
+        if integer:
+            bins = int(hi - lo + 1)
+            lo, hi = lo - 0.5, hi + 0.5
+        elif hi == lo:
+            # Constant data: a single bin of zero width, so both ends stay exact
+            total = sum(int(np.isfinite(block).sum()) for block in iter_blocks(data))
+            return cls([total], [lo, hi])
+
+        counts = np.zeros(bins, dtype=np.int64)
+        for block in iter_blocks(data):
+            counts += np.histogram(block[np.isfinite(block)], bins=bins, range=(lo, hi))[0]
+        return cls(counts, np.linspace(lo, hi, bins + 1), integer)
+
+    @property
+    def total(self) -> int:
+        return int(self.cumulative[-1]) if self.cumulative.size else 0
+
+    @property
+    def discrete(self) -> bool:
+        """Whether every bin holds a single integer value."""
+        return self.integer
+
+    @property
+    def nbytes(self) -> int:
+        return self.counts.nbytes + self.edges.nbytes + self.cumulative.nbytes
+
+    def _rank_bin(self, rank):
+        """Bin holding the pixel of a given rank, and the number of pixels before it."""
+        b = int(np.searchsorted(self.cumulative, rank, side="right"))
+        b = min(b, len(self.counts) - 1)
+        return b, int(self.cumulative[b - 1]) if b else 0
+
+    def _bin_width(self, rank):
+        b, _ = self._rank_bin(rank)
+        return self.edges[b + 1] - self.edges[b]
+
+    def _estimate(self, rank):
+        """Value at a rank, assuming pixels are spread evenly inside their bin."""
+        b, before = self._rank_bin(rank)
+        if self.discrete:
+            return self.edges[b] + 0.5
+        fraction = (rank - before + 0.5) / max(self.counts[b], 1)
+        return self.edges[b] + min(fraction, 1.0) * (self.edges[b + 1] - self.edges[b])
+
+    def _select(self, data, ranks):
+        """Exact values at the given ranks, in one pass over the data."""
+        bins = {rank: self._rank_bin(rank) for rank in ranks}
+        wanted = sorted({b for b, _ in bins.values()})
+        last = len(self.counts) - 1
+
+        gathered = {b: [] for b in wanted}
+        for block in iter_blocks(data):
+            for b in wanted:
+                upper = block <= self.edges[b + 1] if b == last else block < self.edges[b + 1]
+                gathered[b].append(block[(block >= self.edges[b]) & upper])
+
+        values = {}
+        for rank, (b, before) in bins.items():
+            pixels = np.concatenate(gathered[b])
+            if pixels.size == 0:
+                values[rank] = self._estimate(rank)
+                continue
+            k = int(np.clip(rank - before, 0, pixels.size - 1))
+            values[rank] = float(np.partition(pixels, k)[k])
+        return values
+
+    def percentiles(self, percents, data=None, tolerance=None):
+        """Values at the given percentiles, matching np.percentile's linear interpolation.
+
+        With ``data``, a value is refined exactly when its bin is wider than
+        ``tolerance`` (default: 1/1024 of the spread of the requested values).
+        """
+        n = self.total
+        if n == 0:
+            return [np.nan for _ in percents]
+
+        positions = [np.clip(p, 0, 100) / 100 * (n - 1) for p in percents]
+        ranks = sorted({r for pos in positions for r in (int(np.floor(pos)), int(np.ceil(pos)))})
+
+        # The outer edges are the minimum and maximum, except for one bin
+        # per integer value where every bin is exact anyway
+        known = dict(self._exact)
+        if not self.discrete:
+            known.update({0: self.edges[0], n - 1: self.edges[-1]})
+
+        values = {rank: known[rank] if rank in known else self._estimate(rank) for rank in ranks}
+
+        if tolerance is None:
+            spread = max(values.values()) - min(values.values())
+            tolerance = spread / 1024 if spread > 0 else 0
+
+        # Refine the ranks whose bin is too coarse
+        coarse = [
+            rank for rank in ranks
+            if rank not in known and not self.discrete and self._bin_width(rank) > tolerance
+        ]
+        if coarse and data is not None:
+            self._exact.update(self._select(data, coarse))
+            values.update({rank: self._exact[rank] for rank in coarse})
+
+        result = []
+        for pos in positions:
+            lo, hi = int(np.floor(pos)), int(np.ceil(pos))
+            result.append(float(values[lo] + (pos - lo) * (values[hi] - values[lo])))
+        return result
+
+    def limits(self, pmin, pmax, data=None):
+        """Display limits (vmin, vmax) for a pair of percentiles."""
+        vmin, vmax = self.percentiles([pmin, pmax], data)
+        return vmin, vmax
+
+
+# Transfer functions on [0, 1] and the default of their parameter
+STRETCHES = {
+    "linear": None,
+    "log": 1000.0,
+    "sqrt": None,
+    "asinh": 0.1,
+    "power": 2.0,
+    "histeq": None,
+}
+
+# Input quantization of the lookup tables
+LUT_BITS = 16
+
+
+def valid_param(name, param) -> bool:
+    """Whether ``param`` can be used with a transfer function: log, asinh
+    and power need a finite positive one, the others ignore it."""
+    if param is None or STRETCHES.get(name) is None:
+        return True
+    return bool(np.isfinite(param) and param > 0)
+
+
+def transfer(name, x, param=None):
+    """Apply a named transfer function to values in [0, 1]."""
+    if param is None:
+        param = STRETCHES[name]
+    if not valid_param(name, param):
+        raise ValueError(f"Invalid {name} stretch parameter: {param}")
+    if name == "linear":
+        return x
+    if name == "log":
+        return np.log10(param * x + 1) / np.log10(param + 1)
+    if name == "sqrt":
+        return np.sqrt(x)
+    if name == "asinh":
+        return np.arcsinh(x / param) / np.arcsinh(1 / param)
+    if name == "power":
+        return x ** param
+    raise ValueError(f"Unknown stretch: {name}")
+
+
+class Stretch:
+    """Maps raw pixel values to uint8 between display limits through a lookup table.
+
+    ``histeq`` equalizes on the image histogram, which must then be given.
+    NaNs are shown as the lowest level. Every table gets a unique ``serial``
+    to key its stretched pixels by.
+    """
+
+    _serials = itertools.count()
+
+    def __init__(self, vmin, vmax, name="linear", param=None, histogram=None):
+        if name not in STRETCHES:
+            raise ValueError(f"Unknown stretch: {name}")
+        self.serial = next(self._serials)
+        self.vmin = float(vmin)
+        self.vmax = float(vmax)
+        self.name = name
+        self.param = param
+
+        self.levels = 1 << LUT_BITS
+        self.scale = (self.levels - 1) / ((self.vmax - self.vmin) or 1)
+
+        x = np.linspace(0.0, 1.0, self.levels)
+        if name == "histeq" and histogram is not None and histogram.total:
+            # Fraction of the pixels between the limits below each level
+            values = self.vmin + x * (self.vmax - self.vmin)
+            cdf = np.interp(values, histogram.edges[1:], histogram.cumulative, left=0)
+            span = cdf[-1] - cdf[0]
+            y = (cdf - cdf[0]) / span if span > 0 else x
+        elif name == "histeq":
+            y = x
+        else:
+            y = transfer(name, x, param)
+        self.lut = np.round(np.clip(y, 0, 1) * 255).astype(np.uint8)
+
+        # Tables indexed directly by raw 8 and 16-bit integer values
+        self._integer_luts = {}
+
+    def quantize(self, data):
+        """Lookup table level of every value, as uint16."""
+        levels = np.subtract(data, self.vmin, dtype=np.float32)
+        levels *= self.scale
+        # fmax/fmin also map NaN to the lowest level
+        np.fmax(levels, 0, out=levels)
+        np.fmin(levels, self.levels - 1, out=levels)
+        return levels.astype(np.uint16)
+
+    def _integer_lut(self, dtype):
+        """Output for every value of a small integer type, indexed by its unsigned view."""
+        if dtype.str not in self._integer_luts:
+            unsigned = np.dtype(f"u{dtype.itemsize}")
+            values = np.arange(1 << (8 * dtype.itemsize)).astype(unsigned).view(dtype)
+            self._integer_luts[dtype.str] = self.lut[self.quantize(values)]
+        return self._integer_luts[dtype.str]
+
+    def __call__(self, data):
+        data = np.asarray(data)
+        if data.dtype.kind in "iu" and data.dtype.itemsize <= 2:
+            # One gather through a table of every possible value
+            data = data.astype(data.dtype.newbyteorder("="), copy=False)
+            unsigned = np.dtype(f"u{data.dtype.itemsize}")
+            return self._integer_lut(data.dtype)[data.view(unsigned)]
+        return self.lut[self.quantize(data)]
+
+
+# Colormaps and the matplotlib colormap they are sampled from (None: grayscale)
+COLORMAPS = {
+    "gray": None,
+    "viridis": "viridis",
+    "inferno": "inferno",
+    "magma": "magma",
+    "plasma": "plasma",
+    "heat": "afmhot",
+    "hot": "hot",
+    "cool": "cool",
+    "rainbow": "rainbow",
+    "invert": "gray_r",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def palette(name):
+    """RGB palette of a colormap for the 256 output levels, flattened for
+    PIL's putpalette, or None for plain grayscale."""
+    if name not in COLORMAPS:
+        raise ValueError(f"Unknown colormap: {name}")
+    if COLORMAPS[name] is None:
+        return None
+    rgb = colormaps[COLORMAPS[name]](np.linspace(0.0, 1.0, 256))[:, :3]
+    return tuple(int(v) for v in np.round(rgb * 255).ravel())
+
+
+def apply_colormap(image, name):
+    """Give an 8-bit grayscale PIL image the palette of a colormap, in place.
+
+    The pixels are left as they are: the image only becomes a "P" image
+    whose levels index the palette.
+    """
+    colors = palette(name)
+    if colors is not None:
+        image.putpalette(colors)
+    return image
@@ -0,0 +1,215 @@
+"""
+Read-only 2D arrays assembled from tiles on demand.
+
+A TiledArray behaves enough like a numpy array (shape, dtype, slicing,
+fancy indexing) for FitsImage to use it as ``image_data``, but only the
+tiles overlapping the requested region are ever produced. Produced tiles
+are kept in a byte-bounded LRU cache.
+
+DisplayTiles applies the same idea to the stretched uint8 pixels shown on
+screen: only the tiles under the viewport are ever stretched.
+"""
+
+import numpy as np
+
+from starmate.utils import LRUCache
+from starmate.variables import settings
+
+
+def tile_range(start, stop, tile_size):
+    """Indices of the tiles of size ``tile_size`` overlapping [start, stop)."""
+    return range(start // tile_size, (stop - 1) // tile_size + 1)
+
+
+def assemble(shape, tile_shape, get_tile, y0, y1, x0, x1, dtype):
+    """Build the region [y0:y1, x0:x1] of an array of ``shape`` from its tiles.
+
+    ``get_tile(ty, tx)`` returns the pixels of a tile. The region is clipped
+    to the array.
+    """
+    y0, y1 = max(y0, 0), min(y1, shape[0])
+    x0, x1 = max(x0, 0), min(x1, shape[1])
+    out = np.empty((max(y1 - y0, 0), max(x1 - x0, 0)), dtype=dtype)
+    if out.size == 0:
+        return out
+
+    th, tw = tile_shape
+    for ty in tile_range(y0, y1, th):
+        for tx in tile_range(x0, x1, tw):
+            ty0, tx0 = ty * th, tx * tw
+            data = get_tile(ty, tx)
+
+            # Intersection of the tile and the requested region
+            iy0, iy1 = max(y0, ty0), min(y1, ty0 + data.shape[0])
+            ix0, ix1 = max(x0, tx0), min(x1, tx0 + data.shape[1])
+            out[iy0 - y0 : iy1 - y0, ix0 - x0 : ix1 - x0] = data[
+                iy0 - ty0 : iy1 - ty0, ix0 - tx0 : ix1 - tx0
+            ]
+    return out
+
+
+class TiledArray:
+    """Base class for arrays whose pixels are produced one tile at a time."""
+
+    ndim = 2
+
+    def __init__(self, shape, dtype, tile_shape, cache_bytes=None):
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+        self.tile_shape = tuple(int(n) for n in tile_shape)
+
+        if cache_bytes is None:
+            cache_bytes = settings.tile_cache_mb * 1024**2
+        self.cache = LRUCache(cache_bytes, sizeof=lambda tile: tile.nbytes)
+
+    @property
+    def size(self):
+        return self.shape[0] * self.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    @property
+    def n_tiles(self):
+        """Number of tiles along (y, x)."""
+        return (
+            -(-self.shape[0] // self.tile_shape[0]),
+            -(-self.shape[1] // self.tile_shape[1]),
+        )
+
+    def tile_bounds(self, ty, tx):
+        """Pixel bounds (y0, y1, x0, x1) of a tile."""
+        y0 = ty * self.tile_shape[0]
+        x0 = tx * self.tile_shape[1]
+        y1 = min(y0 + self.tile_shape[0], self.shape[0])
+        x1 = min(x0 + self.tile_shape[1], self.shape[1])
+        return y0, y1, x0, x1
+
+    def _read_tile(self, ty, tx):
+        """Produce the pixels of one tile. Implemented by subclasses."""
+        raise NotImplementedError
+
+    def tile(self, ty, tx):
+        """Get a tile from the cache, producing it if needed."""
+        data = self.cache.get((ty, tx))
+        if data is None:
+            data = self._read_tile(ty, tx)
+            self.cache.put((ty, tx), data)
+        return data
+
+    def read(self, y0, y1, x0, x1):
+        """Assemble the region [y0:y1, x0:x1] from the tiles overlapping it."""
+        return assemble(self.shape, self.tile_shape, self.tile, y0, y1, x0, x1, self.dtype)
+
+    def sample_tiles(self, count=None):
+        """Flattened pixels of up to ``count`` tiles spread evenly over the image."""
+        if count is None:
+            count = settings.tile_sample_count
+
+        n_ty, n_tx = self.n_tiles
+        indices = np.linspace(0, n_ty * n_tx - 1, min(count, n_ty * n_tx)).astype(int)
+        return np.concatenate(
+            [self.tile(*divmod(int(i), n_tx)).ravel() for i in np.unique(indices)]
+        )
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        if len(key) != 2:
+            raise IndexError("TiledArray only supports 2D indexing")
+        ykey, xkey = key
+
+        # Read the bounding box of the request, then index into it
+        y0, y1, ylocal = self._localize(ykey, self.shape[0])
+        x0, x1, xlocal = self._localize(xkey, self.shape[1])
+        return self.read(y0, y1, x0, x1)[ylocal, xlocal]
+
+    @staticmethod
+    def _localize(key, length):
+        """Bounding range of an index along one axis, and the index relative to it."""
+        if isinstance(key, slice):
+            r = range(*key.indices(length))
+            if len(r) == 0:
+                return 0, 0, slice(0, 0)
+            lo, hi = min(r[0], r[-1]), max(r[0], r[-1]) + 1
+            stop = r[-1] - lo + (1 if r.step > 0 else -1)
+            return lo, hi, slice(r[0] - lo, stop if stop >= 0 else None, r.step)
+
+        key = np.asarray(key)
+        if key.size == 0:
+            return 0, 0, key
+        # Like numpy, only negative indices down to -length count from the end
+        outside = (key < -length) | (key >= length)
+        if outside.any():
+            raise IndexError(f"index {key[outside].flat[0]} is out of bounds for axis with size {length}")
+        key = np.where(key < 0, key + length, key)
+        lo = int(key.min())
+        return lo, int(key.max()) + 1, key - lo
+
+    def __array__(self, dtype=None, copy=None):
+        # Materializes the whole image; avoid on large images
+        data = self.read(0, self.shape[0], 0, self.shape[1])
+        return data if dtype is None else data.astype(dtype)
+
+
+class CompressedImageData(TiledArray):
+    """Pixels of a tile-compressed (.fz) image HDU, decompressed per tile.
+
+    Cache tiles are whole multiples of the compression tiles, grown to at
+    least ``min_tile`` pixels per side so row-compressed images do not get
+    read one row at a time.
+    """
+
+    def __init__(self, hdu, min_tile=256, cache_bytes=None):
+        self.hdu = hdu
+
+        shape = (hdu.header["NAXIS2"], hdu.header["NAXIS1"])
+        ztile = [int(n) for n in hdu.tile_shape][-2:]
+        tile_shape = [
+            min(-(-min_tile // z) * z, n) for z, n in zip(ztile, shape)
+        ]
+
+        # Decompressing a single pixel only touches the first tile
+        dtype = hdu.section[0:1, 0:1].dtype
+
+        super().__init__(shape, dtype, tile_shape, cache_bytes)
+
+    def _read_tile(self, ty, tx):
+        y0, y1, x0, x1 = self.tile_bounds(ty, tx)
+        return np.asarray(self.hdu.section[y0:y1, x0:x1])
+
+
+class DisplayTiles:
+    """Stretched uint8 tiles of an image, produced for the regions being shown.
+
+    Tiles are keyed by plane, stretch and tile index, so a new stretch
+    simply stops hitting the old tiles, which age out of the LRU.
+    """
+
+    def __init__(self, tile_size=None, cache_bytes=None):
+        self.tile_size = tile_size or settings.display_tile_size
+        if cache_bytes is None:
+            cache_bytes = settings.display_cache_mb * 1024**2
+        self.cache = LRUCache(cache_bytes, sizeof=lambda tile: tile.nbytes)
+
+    @property
+    def size(self):
+        return self.cache.size
+
+    def clear(self):
+        self.cache.clear()
+
+    def region(self, data, transfer, plane, y0, y1, x0, x1):
+        """Stretched pixels [y0:y1, x0:x1] of ``data`` through ``transfer``."""
+        ts = self.tile_size
+
+        def get_tile(ty, tx):
+            key = (plane, transfer.serial, ty, tx)
+            tile = self.cache.get(key)
+            if tile is None:
+                tile = transfer(data[ty * ts : (ty + 1) * ts, tx * ts : (tx + 1) * ts])
+                self.cache.put(key, tile)
+            return tile
+
+        return assemble(data.shape[-2:], (ts, ts), get_tile, y0, y1, x0, x1, np.uint8)
@@ -1,3 +1,7 @@
+from collections import OrderedDict
+import threading
+
+
 class DotDict(dict):
     """A dictionary that supports dot notation as well as dictionary access notation."""
 
@@ -15,3 +19,71 @@ class DotDict(dict):
             del self[key]
         except KeyError:
             raise AttributeError(f"'DotDict' object has no attribute '{key}'")
+
+
+class LRUCache:
+    """A bounded mapping that evicts the least recently used entries.
+
+    ``maxsize`` is a number of entries, or a number of bytes when a
+    ``sizeof`` function is given to measure each value.
+    """
+
+    def __init__(self, maxsize=128, sizeof=None):
+        self.maxsize = maxsize
+        self.sizeof = sizeof
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _measure(self, value):
+        return self.sizeof(value) if self.sizeof is not None else 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            if key in self._data:
+                self.size -= self._measure(self._data.pop(key))
+            self._data[key] = value
+            self.size += self._measure(value)
+            self._evict()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data.pop(key)
+            self.size -= self._measure(value)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def _evict(self):
+        # Always keep the most recent entry, even if it alone exceeds maxsize
+        while self.size > self.maxsize and len(self._data) > 1:
+            _, value = self._data.popitem(last=False)
+            self.size -= self._measure(value)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    def values(self):
+        """Snapshot of the values, without refreshing them."""
+        with self._lock:
+            return list(self._data.values())
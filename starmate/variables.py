@@ -30,4 +30,78 @@ colors = DotDict(
         "green": "#2a9d8f",
         "red": "#e63946",
     }
-)
\ No newline at end of file
+)
+
+# Tunable limits for loading and caching image data
+settings = DotDict(
+    {
+        # Decompressed tiles of tile-compressed (.fz) images kept in memory
+        "tile_cache_mb": 256,
+        # Number of compression tiles sampled to estimate display limits
+        "tile_sample_count": 16,
+        # Stretched uint8 tiles kept per image for display: tile edge in
+        # pixels and cache size
+        "display_tile_size": 256,
+        "display_cache_mb": 32,
+        # Downsampled tiles kept per pyramid level for zoomed-out display
+        "pyramid_cache_mb": 32,
+        # Zoomed screen tiles kept per image: tile edge and cache size
+        "render_tile_size": 256,
+        "render_cache_mb": 32,
+        # Most frames drawn per second, and how often (in frames) render
+        # timings are logged; 0 turns the log off
+        "target_fps": 60,
+        "render_stats_every": 0,
+        # Views missing at least progressive_tiles screen tiles are first
+        # shown coarsely, at 1/progressive_factor of the screen resolution,
+        # and rendered in full once the view has not changed for
+        # refine_delay_ms
+        "progressive_tiles": 4,
+        "progressive_factor": 4,
+        "refine_delay_ms": 150,
+        # Worker threads used to load files in the background
+        "loader_workers": 4,
+        # Loading a directory or glob pattern: header indexing threads,
+        # pixels prefetched up front, and header keyword to order frames by
+        "bulk_workers": 8,
+        "bulk_memory_limit_mb": 1024,
+        "bulk_sort_key": "DATE-OBS",
+        # Persistent preview cache: directory (None for ~/.cache/starmate),
+        # size limit and largest preview level stored
+        "preview_cache_dir": None,
+        "preview_cache_mb": 2048,
+        "preview_max_size": 1024,
+        # Bins of the per-image histogram display limits are looked up in
+        "histogram_bins": 65536,
+        # Colormap of newly displayed images (see stretch.COLORMAPS)
+        "colormap": "gray",
+        # Pixel to sky conversion interpolated on a grid with nodes every
+        # wcs_grid_spacing pixels, wherever it is within wcs_tolerance_arcsec
+        # of the exact WCS
+        "wcs_grid_spacing": 32,
+        "wcs_tolerance_arcsec": 0.01,
+        # Points converted at a time by the batch coordinate conversions
+        "wcs_chunk_size": 1 << 20,
+        # Images resampled onto another image's grid: worker processes
+        # (None for one per CPU), tiles kept per reprojection and
+        # interpolation order (1 bilinear, 0 nearest pixel)
+        "reproject_workers": None,
+        "reproject_cache_mb": 128,
+        "reproject_order": 1,
+        # Limits of a newly displayed image: "zscale" or "sampled" percentiles
+        # from at most limit_samples pixels (zscale_samples of them for the
+        # ZScale fit), or "exact" percentiles. With refine_limits the
+        # histogram is built in the background afterwards, and sampled
+        # percentiles are replaced by exact ones.
+        "first_limits": "zscale",
+        "limit_samples": 100000,
+        "zscale_samples": 1000,
+        "zscale_contrast": 0.25,
+        "refine_limits": True,
+        # Pixels and display caches kept for all loaded images before the
+        # least recently used inactive ones are released
+        "memory_budget_mb": 4096,
+        # SQLite header/footprint index (None for ~/.cache/starmate/index.sqlite)
+        "index_db": None,
+    }
+)
@@ -0,0 +1,230 @@
+"""
+Fast pixel to sky conversion for an image WCS.
+
+Evaluating a distorted WCS (SIP, TPV, ...) exactly for every pointer move
+or overlay vertex is expensive. FastWCS evaluates it once on a coarse grid
+of nodes over the image and interpolates between them.
+
+Each grid cell stores the bilinear coefficients of longitude (unwrapped
+around its first corner, so RA wrapping through 0/360 is harmless) and
+latitude, so a position costs a table lookup and a few multiplications.
+When the grid is built, the WCS is also evaluated exactly at the center and
+edge midpoints of every cell, where the error of bilinear interpolation of
+a smooth mapping is largest. Cells whose error there exceeds the tolerance
+(for example near a pole) are flagged, and positions in flagged cells,
+outside the grid, or in an image without a celestial WCS are computed
+exactly.
+
+Sky to pixel conversion is always exact. Large batches of points (catalog
+overlays, photometry) are converted in chunks by ``chunked``, so the
+temporaries of a conversion stay bounded.
+"""
+
+import math
+
+import numpy as np
+
+from starmate.variables import settings
+
+
+def wrap(dlon):
+    """Longitude differences in degrees, wrapped into [-180, 180)."""
+    return (dlon + 180) % 360 - 180
+
+
+def chunked(convert, a, b, chunk_size=None):
+    """Apply a conversion of two coordinate arrays to two arrays, at most
+    ``chunk_size`` points at a time. Non-finite inputs give NaN outputs
+    and are not passed to ``convert``.
+
+    The inputs are broadcast together; the outputs are float arrays of their shape.
+    """
+    chunk_size = chunk_size or settings.wcs_chunk_size
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(b, dtype=float))
+    out_a = np.full(a.shape, np.nan)
+    out_b = np.full(a.shape, np.nan)
+
+    flat_a, flat_b = a.reshape(-1), b.reshape(-1)
+    result_a, result_b = out_a.reshape(-1), out_b.reshape(-1)
+    for start in range(0, flat_a.size, chunk_size):
+        part = slice(start, start + chunk_size)
+        ca, cb = flat_a[part], flat_b[part]
+        finite = np.isfinite(ca) & np.isfinite(cb)
+        if finite.all():
+            result_a[part], result_b[part] = convert(ca, cb)
+        elif finite.any():
+            ra, rb = convert(ca[finite], cb[finite])
+            result_a[part][finite], result_b[part][finite] = ra, rb
+    return out_a, out_b
+
+
+class FastWCS:
+    """Interpolated pixel to sky conversion of a 2D WCS over an image of ``shape``.
+
+    ``spacing`` is the distance between grid nodes in pixels and
+    ``tolerance`` the largest error accepted from interpolation, in arcsec.
+    The grid is built on first use.
+    """
+
+    def __init__(self, wcs, shape, spacing=None, tolerance=None):
+        self.wcs = wcs
+        self.shape = tuple(shape[-2:])
+        self.spacing = spacing or settings.wcs_grid_spacing
+        self.tolerance = settings.wcs_tolerance_arcsec if tolerance is None else tolerance
+
+        # Interpolation only makes sense for a celestial (spherical) WCS
+        self.celestial = wcs.naxis == 2 and wcs.has_celestial
+        if self.celestial:
+            self.lng, self.lat = wcs.wcs.lng, wcs.wcs.lat
+
+        self._origin = None        # Pixel (x, y) of the first node
+        self._lon00 = None         # Longitude of the first corner of every cell
+        self._coefficients = None  # Bilinear coefficients of every cell, for lon and lat
+        self._good = None          # Cells accurate enough to interpolate
+        self._all_good = False
+        self.max_error = None  # Largest error found at the check points, in arcsec
+
+    def exact(self, x, y, origin=0):
+        """World coordinates of pixels from the full WCS, distortions included."""
+        return self.wcs.all_pix2world(x, y, origin)
+
+    def world_to_pixel(self, a, b, origin=0):
+        """Pixel coordinates of world coordinates (in the order of the WCS
+        world axes) from the full WCS; NaN where there is no solution."""
+        x, y = self.wcs.all_world2pix(a, b, origin, quiet=True)
+        return x, y
+
+    def _to_world_order(self, lon, lat):
+        """(lon, lat) in the order of the WCS world axes."""
+        return (lon, lat) if self.lng == 0 else (lat, lon)
+
+    def _exact_lonlat(self, x, y):
+        world = self.exact(x, y, 0)
+        return world[self.lng], world[self.lat]
+
+    def build(self):
+        """Evaluate the WCS on the grid and check every cell against the tolerance."""
+        if not self.celestial or self._coefficients is not None:
+            return
+
+        # Nodes one pixel beyond the image on every side, so any position
+        # on the image falls inside a cell
+        ny, nx = self.shape
+        s = self.spacing
+        ncx = int(np.ceil((nx + 1) / s))
+        ncy = int(np.ceil((ny + 1) / s))
+
+        # The exact WCS on a grid of half the spacing: the even points are
+        # the nodes, the others the cell centers and edge midpoints
+        hx = -1.0 + s / 2 * np.arange(2 * ncx + 1)
+        hy = -1.0 + s / 2 * np.arange(2 * ncy + 1)
+        lon, lat = self._exact_lonlat(*np.meshgrid(hx, hy))
+
+        # Bilinear coefficients per cell: v = a + b tx + c ty + d tx ty,
+        # longitudes relative to the first corner of the cell
+        lon00 = lon[0:-1:2, 0:-1:2]
+        coefficients = []
+        for values, relative in ((lon, True), (lat, False)):
+            v00 = values[0:-1:2, 0:-1:2]
+            v01, v10, v11 = values[0:-1:2, 2::2], values[2::2, 0:-1:2], values[2::2, 2::2]
+            if relative:
+                v01, v10, v11 = wrap(v01 - lon00), wrap(v10 - lon00), wrap(v11 - lon00)
+                v00 = np.zeros_like(v00)
+            # One flat array per coefficient, indexed by cell number
+            coefficients.append([c.ravel() for c in (v00, v01 - v00, v10 - v00, v11 - v01 - v10 + v00)])
+        self._lon00 = lon00.ravel()
+        self._coefficients = coefficients
+        self._origin = (float(hx[0]), float(hy[0]))
+
+        # Error at the check points of every cell: its center and its four edge midpoints
+        cells = np.zeros((ncy, ncx))
+        for dy, dx in ((1, 1), (0, 1), (2, 1), (1, 0), (1, 2)):
+            check_lon = lon[dy:dy + 2 * ncy:2, dx:dx + 2 * ncx:2]
+            check_lat = lat[dy:dy + 2 * ncy:2, dx:dx + 2 * ncx:2]
+            fx, fy = np.meshgrid(np.arange(ncx) + dx / 2, np.arange(ncy) + dy / 2)
+            ilon, ilat = self._evaluate(fx, fy, ncx, ncy)
+            error = np.hypot(wrap(ilon - check_lon) * np.cos(np.radians(check_lat)), ilat - check_lat) * 3600
+            cells = np.maximum(cells, np.where(np.isfinite(error), error, np.inf))
+
+        self._good = cells <= self.tolerance
+        self._all_good = bool(self._good.all())
+        finite = cells[np.isfinite(cells)]
+        self.max_error = float(finite.max()) if finite.size else None
+
+    def _evaluate(self, fx, fy, ncx=None, ncy=None):
+        """Interpolated (lon, lat) at fractional cell indices inside the grid."""
+        if ncx is None:
+            ncy, ncx = self._good.shape
+        ix = np.minimum(fx.astype(int), ncx - 1)
+        iy = np.minimum(fy.astype(int), ncy - 1)
+        tx, ty = fx - ix, fy - iy
+        cell = iy * ncx + ix
+
+        result = []
+        for a, b, c, d in self._coefficients:
+            result.append(a.take(cell) + b.take(cell) * tx + (c.take(cell) + d.take(cell) * tx) * ty)
+        lon, lat = result
+        return (lon + self._lon00.take(cell)) % 360, lat
+
+    @property
+    def coverage(self) -> float:
+        """Fraction of the grid cells that are interpolated."""
+        self.build()
+        return float(self._good.mean()) if self._good is not None else 0.0
+
+    def pixel_to_world(self, x, y, origin=0):
+        """World coordinates of pixels, in the order of the WCS world axes.
+
+        Accepts scalars or arrays, like ``all_pix2world``.
+        """
+        if not self.celestial:
+            return self.exact(x, y, origin)
+        self.build()
+
+        if np.ndim(x) == 0 and np.ndim(y) == 0:
+            return self._pixel_to_world_scalar(float(x) - origin, float(y) - origin)
+
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+        x, y = x - origin, y - origin
+
+        # Fractional cell indices, and the positions whose cell can be interpolated
+        fx = (x - self._origin[0]) / self.spacing
+        fy = (y - self._origin[1]) / self.spacing
+        ncy, ncx = self._good.shape
+        usable = (fx >= 0) & (fx < ncx) & (fy >= 0) & (fy < ncy)  # False for NaN
+        if usable.all() and self._all_good:
+            return self._to_world_order(*self._evaluate(fx, fy))
+        usable[usable] = self._good[fy[usable].astype(int), fx[usable].astype(int)]
+
+        lon = np.full(x.shape, np.nan)
+        lat = np.full(x.shape, np.nan)
+        if usable.any():
+            lon[usable], lat[usable] = self._evaluate(fx[usable], fy[usable])
+        rest = ~usable & np.isfinite(x) & np.isfinite(y)
+        if rest.any():
+            lon[rest], lat[rest] = self._exact_lonlat(x[rest], y[rest])
+        return self._to_world_order(lon, lat)
+
+    def _pixel_to_world_scalar(self, x, y):
+        """pixel_to_world of one 0-based position, without numpy overhead."""
+        fx = (x - self._origin[0]) / self.spacing
+        fy = (y - self._origin[1]) / self.spacing
+        ncy, ncx = self._good.shape
+        if not (0 <= fx < ncx and 0 <= fy < ncy):
+            if math.isnan(x) or math.isnan(y):
+                return self._to_world_order(math.nan, math.nan)
+            lon, lat = self._exact_lonlat(x, y)
+            return self._to_world_order(float(lon), float(lat))
+
+        ix, iy = int(fx), int(fy)
+        if not self._good[iy, ix]:
+            lon, lat = self._exact_lonlat(x, y)
+            return self._to_world_order(float(lon), float(lat))
+
+        tx, ty = fx - ix, fy - iy
+        cell = iy * ncx + ix
+        lon, lat = (
+            float(a[cell]) + float(b[cell]) * tx + (float(c[cell]) + float(d[cell]) * tx) * ty
+            for a, b, c, d in self._coefficients
+        )
+        return self._to_world_order((lon + float(self._lon00[cell])) % 360, lat)
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from starmate.preview_cache import preview_cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_preview_cache(tmp_path, monkeypatch):
+    """Keep the persistent preview cache of the tests out of the user's cache."""
+    monkeypatch.setattr(preview_cache, "cache_dir", str(tmp_path / "previews"))
+
+
+@pytest.fixture
+def write_fits(tmp_path):
+    """Write an HDU list to a file in tmp_path and return its path."""
+
+    def write(name, *hdus):
+        path = tmp_path / name
+        fits.HDUList(list(hdus)).writeto(path)
+        return str(path)
+
+    return write
+
+
+@pytest.fixture
+def ramp():
+    """A small float image with distinct pixel values."""
+    return np.arange(48 * 64, dtype=np.float32).reshape(48, 64)
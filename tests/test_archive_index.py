@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from starmate.archive_index import ArchiveIndex, footprint_box, footprint_contains, header_footprint, read_frames
+
+
+def frame(ra, dec, size=100, scale=0.01, **cards):
+    """An image HDU of ``size`` pixels per side centered on (ra, dec)."""
+    header = fits.Header({
+        "CTYPE1": "RA---TAN", "CTYPE2": "DEC--TAN",
+        "CRVAL1": ra, "CRVAL2": dec,
+        "CRPIX1": size / 2 + 0.5, "CRPIX2": size / 2 + 0.5,
+        "CDELT1": -scale, "CDELT2": scale,
+        **cards,
+    })
+    return fits.PrimaryHDU(np.zeros((size, size), dtype=np.float32), header)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = ArchiveIndex(str(tmp_path / "index.sqlite"))
+    yield index
+    index.close()
+
+
+def scan(index, tmp_path):
+    return index.scan(str(tmp_path), workers=1)
+
+
+def paths(matches):
+    return sorted(m["path"].rsplit("/", 1)[-1] for m in matches)
+
+
+def test_footprint_crossing_ra_zero_is_split():
+    boxes = footprint_box([[359.5, -1], [0.5, -1], [0.5, 1], [359.5, 1]])
+    assert boxes == [(359.5, 360.0, -1, 1), (0.0, pytest.approx(0.5), -1, 1)]
+
+
+def test_footprint_around_a_pole_covers_every_ra():
+    north = [[ra, 89.0] for ra in (10, 100, 190, 280)]
+    assert footprint_box(north) == [(0.0, 360.0, 89.0, 90.0)]
+    south = [[ra, -88.0] for ra in (280, 190, 100, 10)]
+    assert footprint_box(south) == [(0.0, 360.0, -90.0, -88.0)]
+    assert footprint_contains(north, 123.0, 89.9)
+    assert not footprint_contains(north, 123.0, 88.5)
+
+
+def test_query_across_ra_zero(index, tmp_path, write_fits):
+    write_fits("zero.fits", frame(0.0, 10.0, OBJECT="zero"))
+    write_fits("far.fits", frame(180.0, 10.0))
+    assert scan(index, tmp_path) == (2, 0, 0)
+
+    for ra in (359.7, 0.0, 0.3, -0.3, 360.3):
+        assert paths(index.query(ra, 10.0)) == ["zero.fits"]
+    assert index.query(359.0, 10.0) == []
+    assert index.query(0.0, 11.0) == []
+    assert index.query(0.0, 10.0)[0]["object"] == "zero"
+
+
+def test_query_around_the_poles(index, tmp_path, write_fits):
+    write_fits("north.fits", frame(45.0, 90.0))
+    write_fits("south.fits", frame(300.0, -89.8))
+    scan(index, tmp_path)
+
+    for ra in (0.0, 90.0, 181.0, 359.9):
+        assert paths(index.query(ra, 89.8)) == ["north.fits"]
+        assert paths(index.query(ra, -89.9)) == ["south.fits"]
+    assert paths(index.query(0.0, 90.0)) == ["north.fits"]
+    assert index.query(45.0, 88.0) == []
+
+
+def test_multi_extension_frames_and_primary_cards(index, tmp_path, write_fits):
+    primary = fits.PrimaryHDU(header=fits.Header({"OBJECT": "M31", "EXPTIME": 30}))
+    extensions = [frame(ra, 41.0) for ra in (10.0, 10.5)]
+    write_fits("mef.fits", primary, *(fits.ImageHDU(hdu.data, hdu.header) for hdu in extensions))
+    scan(index, tmp_path)
+
+    matches = index.query(10.25, 41.0)
+    assert [m["hdu"] for m in matches] == [1, 2]
+    assert {m["object"] for m in matches} == {"M31"}
+    assert {m["exptime"] for m in matches} == {30.0}
+
+
+def test_rescan_skips_unchanged_and_drops_removed_files(index, tmp_path, write_fits):
+    write_fits("a.fits", frame(20.0, 0.0))
+    removed = write_fits("b.fits", frame(40.0, 0.0))
+    scan(index, tmp_path)
+    assert scan(index, tmp_path) == (0, 2, 0)
+
+    os.remove(removed)
+    assert scan(index, tmp_path) == (0, 1, 1)
+    assert index.stats() == (1, 1)
+    assert index.query(40.0, 0.0) == []
+
+
+def test_frames_are_read_from_the_headers(write_fits):
+    hdu = frame(120.0, -30.0, size=40, OBJECT="field")
+    plain = fits.ImageHDU(np.zeros((10, 20), dtype=np.float32))
+    path = write_fits("frames.fits", hdu, plain)
+
+    frames = read_frames(path)
+    assert [f["hdu"] for f in frames] == [0, 1]
+    assert frames[0]["cards"]["OBJECT"] == "field"
+    expected = header_footprint(hdu.header)
+    np.testing.assert_allclose(frames[0]["footprint"], expected)
+    np.testing.assert_allclose(expected.mean(axis=0), [120.0, -30.0], atol=0.01)
+    # Without a celestial WCS the frame is indexed without a footprint
+    assert (frames[1]["naxis1"], frames[1]["naxis2"]) == (20, 10)
+    assert frames[1]["footprint"] is None
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import numpy as np
+from astropy.io import fits
+
+from starmate.cube import FitsCube
+from starmate.image import data_bytes
+
+
+def canvas(width=64, height=48):
+    return SimpleNamespace(winfo_width=lambda: width, winfo_height=lambda: height)
+
+
+def open_cube(path):
+    hdu = fits.open(path, lazy_load_hdus=True)[0]
+    manager = SimpleNamespace(viewer=SimpleNamespace(coords_frozen=False))
+    return FitsCube.load_lazy(hdu, manager=manager, name="cube", file_path=path, hdu_index=0)
+
+
+def test_shape_before_and_after_loading(write_fits):
+    data = np.zeros((3, 20, 30), dtype=np.float32)
+    cube = open_cube(write_fits("cube.fits", fits.PrimaryHDU(data)))
+
+    assert tuple(cube.shape) == (20, 30)
+    cube.ensure_loaded()
+    assert cube.is_loaded
+    assert tuple(cube.shape) == (20, 30)
+    assert cube.check_xy_image_bounds(10, 10)
+
+
+def test_loaded_cube_renders_a_view(write_fits):
+    data = np.random.default_rng(0).normal(size=(3, 48, 64)).astype(np.float32)
+    cube = open_cube(write_fits("cube.fits", fits.PrimaryHDU(data)))
+    cube.ensure_loaded()
+    cube.set_slice(2)
+
+    frame = cube.render_view(cube.view_state(canvas()))
+    assert frame.size == (64, 48)
+    assert np.asarray(frame).std() > 0
+
+
+def test_memory_mapped_cube_counts_like_an_image(write_fits):
+    data = np.ones((3, 20, 30), dtype=np.float32)
+    cube = open_cube(write_fits("cube.fits", fits.PrimaryHDU(data)))
+    cube.ensure_loaded()
+    cube.set_slice(1)
+
+    assert data_bytes(cube.cube) == 0
+    assert data_bytes(cube.image_data) == 0
+
+
+def test_release_drops_the_cube_and_reads_it_again(write_fits):
+    data = np.arange(3 * 20 * 30, dtype=np.float32).reshape(3, 20, 30)
+    cube = open_cube(write_fits("cube.fits", fits.PrimaryHDU(data)))
+    cube.ensure_loaded()
+    cube.set_slice(1)
+    assert cube.slice_cache.keys()
+
+    cube.release()
+    assert not cube.is_loaded and cube.vmin is None
+    assert cube.slice_cache.keys() == []
+    assert cube._data_loader.hdulist is None
+    assert cube.resident_bytes() == 0
+
+    np.testing.assert_array_equal(cube.image_data, data[1])
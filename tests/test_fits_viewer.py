@@ -0,0 +1,101 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from starmate.fits_viewer import FITSViewer
+from starmate.image import FitsImage
+
+NAMES = ("x", "y", "ra", "dec", "pixel")
+
+
+class FakeLabel:
+    def __init__(self):
+        self.text = None
+        self.updates = 0
+
+    def configure(self, text):
+        self.text = text
+        self.updates += 1
+
+
+class FakeCanvas:
+    def __init__(self):
+        self.state = "hidden"
+
+    def itemconfigure(self, item, state):
+        self.state = state
+
+    def coords(self, item, *box):
+        pass
+
+
+@pytest.fixture
+def viewer(ramp):
+    """A FITSViewer without its widgets, showing a 36 arcsec/pixel image at zoom 1."""
+    header = fits.Header({
+        "NAXIS": 2, "NAXIS1": 64, "NAXIS2": 48,
+        "CTYPE1": "RA---TAN", "CTYPE2": "DEC--TAN", "CRVAL1": 150.0, "CRVAL2": 20.0,
+        "CRPIX1": 32.5, "CRPIX2": 24.5, "CDELT1": -0.01, "CDELT2": 0.01,
+    })
+    image = FitsImage(ramp, header, None, "sky")
+
+    viewer = FITSViewer.__new__(FITSViewer)
+    viewer.manager = SimpleNamespace(active_im=lambda: True, im_ref=lambda: image)
+    viewer.coords_frozen = False
+    viewer.labels = {name: (None, FakeLabel()) for name in NAMES}
+    viewer.thumbnail_canvas = FakeCanvas()
+    viewer.thumbnail_marker = 1
+    viewer._pointer = None
+    viewer._readout_scheduled = False
+    viewer._readout_pixel = None
+    viewer._magnifier_key = None
+    viewer._readout_text = {}
+    return viewer
+
+
+def point(viewer, x, y):
+    viewer._pointer = (x, y)
+    viewer.update_readout()
+    return {name: label.text for name, (_, label) in viewer.labels.items()}
+
+
+def test_sky_position_follows_the_pointer_within_a_pixel(viewer):
+    first = point(viewer, 20.1, 10.0)
+    second = point(viewer, 20.4, 10.0)
+
+    assert first["x"] != second["x"]
+    assert first["ra"] != second["ra"]
+    im = viewer.manager.im_ref()
+    assert float(second["ra"]) == pytest.approx(im.get_radec_from_xy(20.4, 10.0)[0], abs=1e-4)
+    # Same pixel: its value was set once
+    assert first["pixel"] == second["pixel"]
+    assert viewer.labels["pixel"][1].updates == 1
+
+
+def test_leaving_the_canvas_clears_the_readout(viewer):
+    point(viewer, 20.1, 10.0)
+    viewer.thumbnail_canvas.state = "normal"
+
+    viewer.leave_canvas(None)
+    assert all(label.text == "N/A" for _, label in viewer.labels.values())
+    assert viewer.thumbnail_canvas.state == "hidden"
+
+    # An update still scheduled for the last position does nothing
+    viewer.update_readout()
+    assert viewer.labels["x"][1].text == "N/A"
+
+
+def test_frozen_readout_survives_leaving(viewer):
+    shown = point(viewer, 20.1, 10.0)
+    viewer.coords_frozen = True
+    viewer.leave_canvas(None)
+    assert {name: label.text for name, (_, label) in viewer.labels.items()} == shown
+
+
+def test_pointer_off_the_image(viewer):
+    point(viewer, 20.1, 10.0)
+    off = point(viewer, 500.0, 10.0)
+    assert set(off.values()) == {"N/A"}
+    assert np.isfinite(float(point(viewer, 20.1, 10.0)["ra"]))
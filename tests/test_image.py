@@ -0,0 +1,322 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from starmate.image import FitsImage, data_bytes, is_memmapped
+from starmate.preview_cache import PreviewCache, preview_cache
+from starmate.stretch import sample_pixels, sampled_limits
+from starmate.tiles import CompressedImageData
+from starmate.variables import settings
+
+
+@pytest.fixture
+def image(ramp):
+    return FitsImage(ramp, {"NAXIS": 2, "NAXIS1": 64, "NAXIS2": 48}, None, "ramp")
+
+
+def test_invalid_stretch_param_keeps_the_previous_one(image):
+    image.set_stretch("log", 500)
+    image.set_stretch("log", 0)
+    assert image.stretch_param == 500
+    image.set_stretch(None, -3)
+    assert image.stretch_param == 500
+
+
+def test_invalid_param_of_a_new_stretch_falls_back_to_its_default(image):
+    image.set_stretch("log", 500)
+    image.set_stretch("asinh", "0")
+    assert image.stretch_name == "asinh"
+    assert image.stretch_param is None
+
+    image.update_image_cache()
+    assert np.all(np.diff(image.transfer.lut.astype(int)) >= 0)
+    assert image.transfer.lut[-1] == 255
+
+
+def test_unparsable_param_keeps_the_previous_one(image):
+    image.set_stretch("power", 3)
+    image.set_stretch("power", "abc")
+    assert image.stretch_param == 3.0
+
+
+def test_resident_bytes_count_in_memory_pixels(image, ramp):
+    assert data_bytes(image.image_data) == ramp.nbytes
+    assert image.resident_bytes() >= ramp.nbytes
+
+
+def test_memory_mapped_pixels_are_not_resident(write_fits, ramp):
+    image = FitsImage.load(write_fits("ramp.fits", fits.PrimaryHDU(ramp)))
+    assert is_memmapped(image.image_data)
+    assert data_bytes(image.image_data) == 0
+
+
+def test_resident_bytes_with_histograms_evicted_meanwhile(image, monkeypatch):
+    image.get_histogram()
+    # An eviction between listing the keys and reading them used to crash
+    monkeypatch.setattr(image.histograms, "get", lambda key, default=None: None)
+    assert image.resident_bytes() > 0
+
+
+def open_lazy(path):
+    return FitsImage.load_lazy(fits.open(path)[0], name="ramp", file_path=path, hdu_index=0)
+
+
+def test_first_display_uses_exact_limits_from_the_preview_cache(write_fits, ramp):
+    path = write_fits("ramp.fits", fits.PrimaryHDU(ramp))
+    earlier = open_lazy(path)
+    earlier.store_preview(earlier.cache_key(), None, earlier.image_data, None, (1.0, 99.0, 5.0, 50.0))
+
+    image = open_lazy(path)
+    image.ensure_loaded(1, 99)
+    assert (image.vmin, image.vmax) == (5.0, 50.0)
+    assert image.limits_mode == "exact"
+
+
+def test_first_display_without_stored_limits_uses_first_limits(write_fits, ramp):
+    image = open_lazy(write_fits("ramp.fits", fits.PrimaryHDU(ramp)))
+    image.ensure_loaded(0, 100)
+    assert image.limits_mode == settings.first_limits
+
+
+def test_preview_cache_is_looked_up_once_per_limits(write_fits, ramp, monkeypatch):
+    path = write_fits("ramp.fits", fits.PrimaryHDU(ramp))
+    earlier = open_lazy(path)
+    earlier.store_preview(earlier.cache_key(), None, earlier.image_data, None, (0.0, 100.0, 1.0, 2.0))
+    image = open_lazy(path)
+
+    calls = {"stat": 0, "limits": 0}
+    make_key, get_limits = PreviewCache.make_key, preview_cache.get_limits
+
+    def counting_make_key(*args, **kwargs):
+        calls["stat"] += 1
+        return make_key(*args, **kwargs)
+
+    def counting_get_limits(*args):
+        calls["limits"] += 1
+        return get_limits(*args)
+
+    monkeypatch.setattr(PreviewCache, "make_key", staticmethod(counting_make_key))
+    monkeypatch.setattr(preview_cache, "get_limits", counting_get_limits)
+
+    for stretch in ("linear", "sqrt", "log", "linear"):
+        image.update_image_cache(0, 100, stretch)
+        assert (image.vmin, image.vmax) == (1.0, 2.0)
+    assert calls == {"stat": 1, "limits": 1}
+
+
+def test_stored_histogram_keeps_its_integer_bins(write_fits):
+    data = np.arange(48 * 64, dtype=np.int16).reshape(48, 64) % 200
+    path = write_fits("counts.fits", fits.PrimaryHDU(data))
+    earlier = open_lazy(path)
+    earlier.store_preview(earlier.cache_key(), None, earlier.image_data, earlier.get_histogram())
+    assert preview_cache.load(earlier.cache_key())["histogram_integer"]
+
+    histogram = open_lazy(path).get_histogram()
+    assert histogram.discrete
+    assert histogram.percentiles([1, 50, 99]) == pytest.approx(np.percentile(data, [1, 50, 99]))
+
+
+@pytest.fixture
+def sky(ramp):
+    header = fits.Header({
+        "NAXIS": 2, "NAXIS1": 64, "NAXIS2": 48,
+        "CTYPE1": "RA---TAN", "CTYPE2": "DEC--TAN", "CRVAL1": 150.0, "CRVAL2": 20.0,
+        "CRPIX1": 32.5, "CRPIX2": 24.5, "CDELT1": -1 / 3600, "CDELT2": 1 / 3600,
+    })
+    return FitsImage(ramp, header, None, "sky")
+
+
+def test_batch_conversions_round_trip(sky):
+    x, y = np.meshgrid(np.linspace(1, 64, 7), np.linspace(1, 48, 5))
+    ra, dec = sky.pixel_to_world(x, y)
+    assert ra.shape == dec.shape == (5, 7)
+    np.testing.assert_allclose(np.stack(sky.wcs_info.all_pix2world(x, y, 1)), [ra, dec], atol=1e-8)
+
+    # Small chunks give the same result
+    x2, y2 = sky.world_to_pixel(ra, dec, chunk_size=4)
+    np.testing.assert_allclose(x2, x, atol=1e-3)
+    np.testing.assert_allclose(y2, y, atol=1e-3)
+
+
+def test_nan_coordinates_stay_nan(sky):
+    ra, dec = sky.pixel_to_world([np.nan, 10.0, 20.0], [5.0, np.nan, 20.0])
+    assert np.isnan(ra[:2]).all() and np.isnan(dec[:2]).all()
+    assert np.isfinite([ra[2], dec[2]]).all()
+
+    x, y = sky.world_to_pixel([ra[2], np.nan], [dec[2], dec[2]])
+    assert (x[0], y[0]) == pytest.approx((20.0, 20.0), abs=1e-3)
+    assert np.isnan(x[1]) and np.isnan(y[1])
+
+
+def test_positions_off_the_image_are_masked(sky):
+    # Pixel centers 1..64 and 1..48 (origin 1): edges half a pixel beyond
+    x = np.array([0.5, 0.4, 64.4, 64.5, 30.0, 30.0])
+    y = np.array([24.0, 24.0, 24.0, 24.0, 0.5, 48.5])
+    np.testing.assert_array_equal(sky.in_bounds(x, y), [True, False, True, False, True, False])
+    assert not sky.in_bounds(np.nan, 10.0)
+
+    # Round trips are not exact, so stay clear of the edges
+    x = np.array([0.55, 0.45, 64.45, 64.55, 30.0, 30.0])
+    y = np.array([24.0, 24.0, 24.0, 24.0, 0.55, 48.55])
+    ra, dec = sky.pixel_to_world(x, y)
+    px, py = sky.world_to_pixel(ra, dec, within=True)
+    inside = sky.in_bounds(x, y)
+    assert inside.sum() == 3
+    np.testing.assert_allclose(px[inside], x[inside], atol=1e-3)
+    assert np.isnan(px[~inside]).all() and np.isnan(py[~inside]).all()
+    # Without ``within`` they are converted like any other position
+    assert np.isfinite(sky.world_to_pixel(ra, dec)[0]).all()
+
+
+def test_first_display_uses_zscale_of_a_sample(image, ramp, monkeypatch):
+    monkeypatch.setattr(settings, "first_limits", "zscale")
+    monkeypatch.setattr(settings, "limit_samples", 500)
+    image.ensure_loaded()
+
+    assert image.limits_mode == "zscale"
+    assert image.sample().size <= 500
+    assert (image.vmin, image.vmax) == sampled_limits(sample_pixels(ramp, 500), "zscale")
+    # No histogram is built for the first display
+    assert image.histograms.keys() == []
+    assert image.limits_refinable
+
+
+def test_refinement_keeps_zscale_limits(image):
+    image.update_image_cache(0, 100, limits="zscale")
+    limits = (image.vmin, image.vmax)
+
+    # Only the histogram is built; the ZScale limits are what was asked for
+    assert not image.refine_limits()
+    assert (image.vmin, image.vmax) == limits
+    assert image.histograms.keys() == [None]
+    assert not image.limits_refinable
+
+
+def test_sampled_limits_are_refined_to_exact_ones(image, ramp, monkeypatch):
+    monkeypatch.setattr(settings, "limit_samples", 100)
+    image.update_image_cache(1, 99, limits="sampled")
+    assert image.limits_mode == "sampled" and image.limits_refinable
+    version = image.limits_version
+
+    assert image.refine_limits()
+    assert image.limits_mode == "exact"
+    assert (image.vmin, image.vmax) == pytest.approx(tuple(np.percentile(ramp, [1, 99])), abs=0.05)
+    assert image.transfer.vmin == image.vmin
+    assert image.limits_version == version
+    assert not image.limits_refinable
+
+
+def test_limits_set_during_refinement_win(image, monkeypatch):
+    image.update_image_cache(1, 99, limits="sampled")
+    get_histogram = image.get_histogram
+
+    def histogram_meanwhile(*args):
+        # The user picks other limits while the histogram is built
+        image.update_image_cache(0, 100, limits="zscale")
+        return get_histogram(*args)
+
+    monkeypatch.setattr(image, "get_histogram", histogram_meanwhile)
+
+    assert not image.refine_limits()
+    assert image.limits_mode == "zscale"
+    assert (image.vmin, image.vmax) == sampled_limits(image.sample(), "zscale")
+
+
+def test_tiled_images_are_not_refined(write_fits, ramp):
+    path = write_fits("ramp.fits.fz", fits.PrimaryHDU(), fits.CompImageHDU(ramp, tile_shape=(16, 64)))
+    image = FitsImage(CompressedImageData(fits.open(path)[1]), fits.getheader(path, 1), None, "tiled")
+    image.update_image_cache(1, 99, limits="sampled")
+    assert not image.limits_refinable
+    assert not image.refine_limits()
+    assert image.limits_mode == "sampled"
+
+
+class FakeViewer:
+    """The parts of the viewer the view math reads: a 200x150 canvas, and
+    redraw requests, which views deferred to activation must not make."""
+
+    def __init__(self):
+        self.image_canvas = SimpleNamespace(winfo_width=lambda: 200, winfo_height=lambda: 150)
+        self.redraws = 0
+
+    def update_display_image(self):
+        self.redraws += 1
+
+
+def field(name, viewer, scale, rotation=0.0, wcs=True):
+    """A 400x300 image on the viewer; with a TAN WCS of ``scale`` arcsec/pixel."""
+    c, s = np.cos(np.radians(rotation)), np.sin(np.radians(rotation))
+    header = {"NAXIS": 2, "NAXIS1": 400, "NAXIS2": 300}
+    if wcs:
+        header.update({
+            "CTYPE1": "RA---TAN", "CTYPE2": "DEC--TAN", "CRVAL1": 150.0, "CRVAL2": 20.0,
+            "CRPIX1": 180.0, "CRPIX2": 160.0,
+            "CD1_1": -c * scale / 3600, "CD1_2": s * scale / 3600,
+            "CD2_1": s * scale / 3600, "CD2_2": c * scale / 3600,
+        })
+    manager = SimpleNamespace(viewer=viewer)
+    return FitsImage(np.zeros((300, 400), dtype=np.float32), fits.Header(header), manager, name)
+
+
+def center_sky(image):
+    """RA/Dec at the center of the canvas."""
+    return image.get_radec_from_xy(*image.canvas_pos_to_xy(*image.get_canvas_center_pos()))
+
+
+def same_sky(position):
+    """Approximately ``position``, within the interpolated WCS tolerance of
+    the conversions both ways."""
+    return pytest.approx(position, abs=2 * settings.wcs_tolerance_arcsec / 3600)
+
+
+def activate(image, previous=None):
+    """What Manager.activate_image does, with views locked to ``previous``."""
+    if previous is not None:
+        image.pending_view = previous.linked_view(image)
+    image.apply_pending_view()
+
+
+def test_pending_sky_view_waits_for_activation():
+    viewer = FakeViewer()
+    image = field("b", viewer, 1.0)
+    image.pending_view = ("sky", 150.01, 20.005, 2.0)
+    assert (image.zoom_level, image.offset_x, image.offset_y) == (1.0, 0, 0)
+
+    activate(image)
+    assert image.pending_view is None
+    assert image.zoom_level == 2.0
+    assert center_sky(image) == same_sky((150.01, 20.005))
+    assert viewer.redraws == 0
+
+    # Applied once
+    image.offset_x += 50
+    activate(image)
+    assert center_sky(image) != same_sky((150.01, 20.005))
+
+
+def test_locked_views_keep_the_sky_center_and_angular_scale():
+    viewer = FakeViewer()
+    shown = field("a", viewer, 1.0)
+    shown.center_on_xy(220.0, 140.0, zoom_level=3.0, render=False)
+    # Another grid: twice the pixel size, rotated
+    image = field("b", viewer, 2.0, rotation=30.0)
+
+    activate(image, previous=shown)
+    assert center_sky(image) == same_sky(center_sky(shown))
+    # Same arcsec per screen pixel
+    assert shown.pixel_scale / shown.zoom_level == pytest.approx(image.pixel_scale / image.zoom_level)
+    assert image.zoom_level == pytest.approx(6.0)
+    assert viewer.redraws == 0
+
+
+def test_locked_views_without_wcs_keep_the_pixel_view():
+    viewer = FakeViewer()
+    shown = field("a", viewer, 1.0)
+    shown.center_on_xy(220.0, 140.0, zoom_level=3.0, render=False)
+    image = field("b", viewer, 1.0, wcs=False)
+
+    activate(image, previous=shown)
+    assert image.pending_view is None
+    assert (image.zoom_level, image.offset_x, image.offset_y) == (3.0, shown.offset_x, shown.offset_y)
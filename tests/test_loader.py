@@ -0,0 +1,127 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+from astropy.io import fits
+
+from starmate.image import FitsImage, HDUData
+from starmate.loader import FileLoader, LoadJob
+
+
+def unsigned_frame(write_fits, name="u16.fits"):
+    """A uint16 frame, stored by astropy as int16 with BZERO = 32768."""
+    data = (np.arange(40 * 50, dtype=np.uint16).reshape(40, 50) * 30).astype(np.uint16)
+    path = write_fits(name, fits.PrimaryHDU(data))
+    assert fits.getheader(path)["BZERO"] == 32768
+    return path, data
+
+
+def drain(results):
+    messages = []
+    while True:
+        try:
+            messages.append(results.get_nowait())
+        except queue.Empty:
+            return messages
+
+
+def make_loader():
+    return FileLoader(SimpleNamespace(), max_workers=1)
+
+
+def test_load_scaled_unsigned_frame(write_fits):
+    path, data = unsigned_frame(write_fits)
+    im = FitsImage.load(path)
+    np.testing.assert_array_equal(np.asarray(im.image_data), data)
+    assert im.vmin is not None
+
+
+def test_background_load_of_scaled_frame(write_fits):
+    path, data = unsigned_frame(write_fits)
+    loader = make_loader()
+    loader._load(LoadJob(path))
+
+    messages = drain(loader.results)
+    assert not [m for m in messages if m[0] == "error"]
+    images = [payload for kind, _, payload in messages if kind == "image"]
+    assert len(images) == 1
+    assert images[0].vmin is not None
+    np.testing.assert_array_equal(np.asarray(images[0].image_data), data)
+
+
+def test_bulk_load_of_scaled_frames(write_fits):
+    paths = [unsigned_frame(write_fits, f"u16_{i}.fits")[0] for i in range(3)]
+    loader = make_loader()
+    loader._load_many(LoadJob("frames"), paths, 2, 1024, "DATE-OBS")
+
+    messages = drain(loader.results)
+    assert not [m for m in messages if m[0] == "error"]
+    assert len([m for m in messages if m[0] == "image"]) == 3
+
+
+def test_registered_images_hold_no_file_handle(write_fits, ramp):
+    paths = [write_fits(f"ramp_{i}.fits", fits.PrimaryHDU(ramp)) for i in range(3)]
+    loader = make_loader()
+    loader._load_many(LoadJob("frames"), paths, 2, 0, "DATE-OBS")
+
+    images = [payload for kind, _, payload in drain(loader.results) if kind == "image"]
+    # Only the image shown first has read its pixels
+    assert [im._data_loader.hdulist is not None for im in images] == [True, False, False]
+
+    first = images[0]
+    first.release()
+    assert first._data_loader.hdulist is None
+    first.ensure_loaded()
+    np.testing.assert_array_equal(np.asarray(first.image_data), ramp)
+
+
+def test_concurrent_first_access_opens_the_file_once(write_fits, ramp, monkeypatch):
+    loader = HDUData(write_fits("ramp.fits", fits.PrimaryHDU(ramp)), 0)
+    opened = []
+    fits_open = fits.open
+
+    def slow_open(*args, **kwargs):
+        time.sleep(0.05)  # Widen the window between the check and the open
+        opened.append(fits_open(*args, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr(fits, "open", slow_open)
+    start = threading.Barrier(4)
+
+    def first_access():
+        start.wait()
+        return loader.hdu
+
+    with ThreadPoolExecutor(4) as pool:
+        hdus = list(pool.map(lambda _: first_access(), range(4)))
+    assert len(opened) == 1
+    assert all(hdu is hdus[0] for hdu in hdus)
+
+    loader.release()
+    assert opened[0]._file.closed
+
+
+def test_bulk_load_reads_ahead_within_the_memory_limit(write_fits, ramp):
+    paths = [write_fits(f"ramp_{i}.fits", fits.PrimaryHDU(ramp)) for i in range(4)]
+    loader = make_loader()
+    # Room for the first image and two more
+    limit_mb = 3 * ramp.nbytes / 1024**2
+    loader._load_many(LoadJob("frames"), paths, 2, limit_mb, "DATE-OBS")
+
+    messages = drain(loader.results)
+    images = [payload for kind, _, payload in messages if kind == "image"]
+    assert [im.vmin is not None for im in images] == [True, True, True, False]
+    assert any(kind == "progress" and payload.startswith("Read ahead 2 of 3 images")
+               for kind, _, payload in messages)
+
+
+def test_prefetch_decompresses_every_tile(write_fits, ramp):
+    path = write_fits("ramp.fits.fz", fits.PrimaryHDU(), fits.CompImageHDU(ramp, tile_shape=(16, 64)))
+    hdu = fits.open(path)[1]
+    im = FitsImage.load_lazy(hdu, name="ramp", file_path=path, hdu_index=1)
+    im.prefetch()
+    assert len(im.image_data.cache) == np.prod(im.image_data.n_tiles)
+    np.testing.assert_array_equal(np.asarray(im.image_data), ramp)
@@ -0,0 +1,55 @@
+import threading
+
+import numpy as np
+
+from starmate.pyramid import ImagePyramid, PyramidLevel, downsample
+
+
+def test_downsample_averages_blocks_ignoring_nan():
+    data = np.array([[1, 3, 5], [np.nan, 2, 7]], dtype=np.float32)
+    np.testing.assert_allclose(downsample(data), [[2.0, 6.0]])
+
+
+def test_lazy_levels_match_downsampled_image():
+    data = np.random.default_rng(1).normal(size=(300, 500)).astype(np.float32)
+    pyramid = ImagePyramid(data)
+    level = pyramid.level(2)
+    assert isinstance(level, PyramidLevel)
+    np.testing.assert_allclose(np.asarray(level), downsample(downsample(data)), rtol=1e-6)
+    assert pyramid.level(2) is level
+
+
+def test_build_publishes_plain_levels():
+    data = np.ones((512, 512), dtype=np.float32)
+    pyramid = ImagePyramid(data)
+    built = pyramid.build(max_size=128)
+    assert sorted(built) == [2, 3]
+    for n, level in built.items():
+        assert pyramid.levels[n] is level
+        assert isinstance(level, np.ndarray)
+    assert pyramid.plain_level(3) == (3, pyramid.levels[3])
+
+
+def test_readers_are_safe_while_levels_are_built():
+    data = np.random.default_rng(2).normal(size=(1024, 1024)).astype(np.float32)
+    pyramid = ImagePyramid(data)
+    errors = []
+    done = threading.Event()
+
+    def read():
+        try:
+            while not done.is_set():
+                pyramid.nbytes
+                pyramid.plain_level(10)
+                pyramid.level(1)
+        except Exception as e:
+            errors.append(e)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        pyramid.build(max_size=256)
+    finally:
+        done.set()
+        reader.join()
+    assert not errors
@@ -0,0 +1,116 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from starmate.image import FitsImage
+from starmate.renderer import RenderWorker, ViewState
+from starmate.stretch import Stretch
+
+
+def view(offset_x, zoom=1.0, offset_y=0, width=100, height=80, data=None, transfer=None):
+    return ViewState(
+        zoom=zoom, offset_x=offset_x, offset_y=offset_y, width=width, height=height,
+        plane=None, data=data, transfer=transfer,
+    )
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+@pytest.fixture
+def worker():
+    worker = RenderWorker()
+    yield worker
+    worker.stop()
+
+
+def test_only_the_newest_of_queued_requests_is_rendered(worker):
+    started, release = threading.Event(), threading.Event()
+    rendered = []
+
+    def render(state):
+        rendered.append(state.offset_x)
+        if state.offset_x == 0:
+            started.set()
+            release.wait(5)
+        return state
+
+    # The first request blocks the worker while the others queue up
+    worker.submit(render, view(0))
+    assert started.wait(5)
+    generations = [worker.submit(render, view(x)) for x in (1, 2, 3, 4)]
+    assert generations == [2, 3, 4, 5]
+    release.set()
+    wait_until(lambda: worker.results.qsize() == 2)
+
+    generation, frame = worker.collect()
+    assert generation == 5 and frame.offset_x == 4
+    assert rendered == [0, 4]
+    stats = worker.stats()
+    assert stats["skipped"] == 3
+    assert stats["rendered"] == 2 and stats["stale"] == 1
+    assert worker.collect() is None
+    wait_until(lambda: not worker.busy)
+
+
+def test_frames_older_than_the_shown_one_are_discarded(worker):
+    for x in (1, 2):
+        worker.submit(lambda state: state, view(x))
+        wait_until(lambda: worker.results.qsize() == 1)
+        assert worker.collect()[1].offset_x == x
+    assert worker.shown == 2
+
+    # A frame of an earlier generation finishing after generation 2 was shown
+    worker.results.put((1, view(1), None, 0.0))
+    assert worker.collect() is None
+    assert worker.shown == 2
+    assert worker.stats()["stale"] == 1
+
+
+def test_render_errors_are_not_collected(worker):
+    def fail(state):
+        raise RuntimeError("broken")
+
+    worker.submit(fail, view(0))
+    wait_until(lambda: worker.results.qsize() == 1)
+    assert worker.collect() is None
+    assert worker.shown == 0
+
+
+@pytest.fixture
+def noise():
+    data = np.random.default_rng(3).normal(100, 10, (256, 320)).astype(np.float32)
+    image = FitsImage(data, {"NAXIS": 2, "NAXIS1": 320, "NAXIS2": 256}, None, "noise")
+    return image, Stretch(70, 130)
+
+
+def test_coarse_frame_samples_the_image_with_a_stride(noise):
+    image, transfer = noise
+    state = view(16, offset_y=8, width=96, height=64, data=image.image_data, transfer=transfer)
+
+    frame = image.renderer.render_coarse(state, factor=4)
+    assert frame.size == (96, 64)
+    # Every 4x4 block of screen pixels shows one pixel of a 4-strided read
+    expected = transfer(image.image_data[8:72:4, 16:112:4])
+    np.testing.assert_array_equal(np.asarray(frame)[::4, ::4], expected)
+    np.testing.assert_array_equal(np.asarray(frame)[3::4, 3::4], expected)
+    assert image.renderer.size == 0
+
+
+def test_coarse_frame_reads_the_finest_level_in_memory(noise):
+    image, transfer = noise
+    built = image.get_pyramid().build(max_size=100)
+    assert sorted(built)[0] == 2
+
+    # One coarse pixel is 4 image pixels: level 2 is read without a stride
+    state = view(16, offset_y=8, width=96, height=64, data=image.image_data, transfer=transfer)
+    frame = image.renderer.render_coarse(state, factor=4)
+    assert frame.size == (96, 64)
+    expected = transfer(built[2][2:18, 4:28])
+    np.testing.assert_array_equal(np.asarray(frame)[::4, ::4], expected)
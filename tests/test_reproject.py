@@ -0,0 +1,101 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from starmate import reproject
+from starmate.image import FitsImage
+from starmate.reproject import ReprojectedArray
+
+
+class RecordingExecutor(ThreadPoolExecutor):
+    """Runs tiles in threads of this process and records the bounds submitted."""
+
+    def __init__(self):
+        super().__init__(2)
+        self.bounds = []
+
+    def submit(self, fn, *args, **kwargs):
+        self.bounds.append(args[3])
+        return super().submit(fn, *args, **kwargs)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Compute tiles in process instead of in spawned workers, which need a
+    ``__main__`` guard the test runner does not have."""
+    executor = RecordingExecutor()
+    monkeypatch.setattr(reproject, "_pool", executor)
+    yield executor
+    executor.shutdown()
+
+
+def sky_image(data, crpix=None, rotation=0.0, name="image"):
+    """A FitsImage with a 1 arcsec/pixel TAN WCS at (150, 20)."""
+    ny, nx = data.shape
+    crpix = crpix or (nx / 2 + 0.5, ny / 2 + 0.5)
+    c, s = np.cos(np.radians(rotation)), np.sin(np.radians(rotation))
+    header = fits.Header({
+        "NAXIS": 2, "NAXIS1": nx, "NAXIS2": ny,
+        "CTYPE1": "RA---TAN", "CTYPE2": "DEC--TAN",
+        "CRVAL1": 150.0, "CRVAL2": 20.0, "CRPIX1": crpix[0], "CRPIX2": crpix[1],
+        "CD1_1": -c / 3600, "CD1_2": s / 3600, "CD2_1": s / 3600, "CD2_2": c / 3600,
+    })
+    return FitsImage(data, header, None, name)
+
+
+def exact_source_pixels(source, target, x, y):
+    """0-based source pixels of 0-based target pixels through the exact WCS."""
+    ra, dec = target.wcs_info.all_pix2world(x, y, 0)
+    return source.wcs_info.all_world2pix(ra, dec, 0)
+
+
+def test_pixels_follow_the_exact_wcs_round_trip(pool):
+    # A linear field is interpolated exactly, so any error is in the geometry
+    y, x = np.mgrid[0:60, 0:80]
+    source = sky_image((2.0 * x + 3.0 * y).astype(np.float32), name="source")
+    target = sky_image(np.zeros((70, 70), dtype=np.float32), crpix=(30.0, 40.0), rotation=25.0, name="target")
+    array = ReprojectedArray(source, target, order=1, tile_size=32)
+
+    result = np.asarray(array)
+    ty, tx = np.mgrid[0:70, 0:70]
+    sx, sy = exact_source_pixels(source, target, tx, ty)
+
+    interior = (sx >= 0) & (sx <= 79) & (sy >= 0) & (sy <= 59)
+    off = (sx < -0.5) | (sx >= 79.5) | (sy < -0.5) | (sy >= 59.5)
+    assert interior.sum() > 1000 and off.sum() > 100
+    np.testing.assert_allclose(result[interior], (2.0 * sx + 3.0 * sy)[interior], atol=1e-3)
+    assert np.isnan(result[off]).all()
+
+
+def test_tiles_off_the_source_are_nan_without_reaching_the_pool(pool):
+    # The source covers the first 64 columns of the target
+    source = sky_image(np.ones((64, 64), dtype=np.float32), crpix=(32.5, 32.5))
+    target = sky_image(np.zeros((64, 256), dtype=np.float32), crpix=(32.5, 32.5))
+    array = ReprojectedArray(source, target, tile_size=32)
+
+    assert np.isnan(array.read(0, 64, 128, 256)).all()
+    assert pool.bounds == []
+    assert array.empty == 8 and array.computed == 0
+
+    assert (array.read(0, 64, 0, 64) == 1).all()
+    assert sorted(pool.bounds) == [(0, 32, 0, 32), (0, 32, 32, 64), (32, 64, 0, 32), (32, 64, 32, 64)]
+
+
+def test_strided_reads_sample_the_nearest_source_pixels(pool):
+    # Target pixel (x, y) is source pixel (x - 10, y - 5)
+    source = sky_image(np.arange(40 * 50, dtype=np.float32).reshape(40, 50), crpix=(25.5, 20.5))
+    target = sky_image(np.zeros((60, 70), dtype=np.float32), crpix=(35.5, 25.5), rotation=0.0)
+    array = ReprojectedArray(source, target, tile_size=32)
+
+    result = array[::4, 1::3]
+    ys, xs = np.arange(0, 60, 4), np.arange(1, 70, 3)
+    expected = np.full((ys.size, xs.size), np.nan, dtype=np.float32)
+    sy, sx = ys[:, None] - 5, xs[None, :] - 10
+    on = (sy >= 0) & (sy < 40) & (sx >= 0) & (sx < 50)
+    expected[on] = source.image_data[np.broadcast_to(sy, on.shape)[on], np.broadcast_to(sx, on.shape)[on]]
+
+    np.testing.assert_array_equal(result, expected)
+    # Nothing computed or cached
+    assert pool.bounds == [] and array.cache.keys() == []
@@ -0,0 +1,73 @@
+import pytest
+
+from starmate.scheduler import FrameScheduler
+
+
+class FakeRoot:
+    """Records the callbacks scheduled with after/after_idle; ``run`` calls them."""
+
+    def __init__(self):
+        self.scheduled = []  # (delay in ms or None for after_idle, callback)
+
+    def after(self, ms, callback):
+        self.scheduled.append((ms, callback))
+
+    def after_idle(self, callback):
+        self.scheduled.append((None, callback))
+
+    def run(self):
+        scheduled, self.scheduled = self.scheduled, []
+        for _, callback in scheduled:
+            callback()
+
+
+@pytest.fixture
+def root():
+    return FakeRoot()
+
+
+def test_requests_within_a_frame_share_one_render(root):
+    renders = []
+    frames = FrameScheduler(root, lambda: renders.append(1), fps=20)
+
+    for _ in range(5):
+        frames.request()
+    # The first frame is due at once, and only one is scheduled
+    assert [ms for ms, _ in root.scheduled] == [None]
+    root.run()
+    assert len(renders) == 1
+    assert frames.stats()["frames"] == 1 and frames.stats()["dropped"] == 4
+
+    # Right after a frame the next one waits for the rest of the interval
+    for _ in range(3):
+        frames.request()
+    assert len(root.scheduled) == 1
+    ms, _ = root.scheduled[0]
+    assert 0 < ms <= 51
+    root.run()
+    stats = frames.stats()
+    assert len(renders) == 2
+    assert stats["frames"] == 2 and stats["dropped"] == 6
+
+
+def test_a_single_request_drops_nothing(root):
+    frames = FrameScheduler(root, lambda: None, fps=20)
+    frames.request()
+    root.run()
+    assert frames.stats()["dropped"] == 0
+    # Nothing to do without a new request
+    assert root.scheduled == []
+
+
+def test_failed_render_still_counts_the_frame(root):
+    def render():
+        raise RuntimeError("broken")
+
+    frames = FrameScheduler(root, render, fps=20)
+    frames.request()
+    with pytest.raises(RuntimeError):
+        root.run()
+    assert frames.stats()["frames"] == 1
+    # The next request schedules a new frame
+    frames.request()
+    assert len(root.scheduled) == 1
@@ -0,0 +1,162 @@
+import warnings
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from starmate import stretch
+from starmate.stretch import (
+    COLORMAPS, STRETCHES, PixelHistogram, Stretch, apply_colormap, palette, transfer, valid_param,
+)
+
+X = np.linspace(0.0, 1.0, 1001)
+
+# Each transfer function at its default and at extreme parameters
+EDGE_PARAMS = [
+    ("linear", None),
+    ("sqrt", None),
+    ("log", None), ("log", 1e-6), ("log", 1e9),
+    ("asinh", None), ("asinh", 1e-6), ("asinh", 1e6),
+    ("power", None), ("power", 1e-3), ("power", 50.0),
+]
+
+
+@pytest.mark.parametrize("name, param", EDGE_PARAMS)
+def test_transfer_maps_unit_interval_monotonically(name, param):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        y = transfer(name, X, param)
+    assert np.all(np.isfinite(y))
+    assert y[0] == pytest.approx(0.0, abs=1e-9)
+    assert y[-1] == pytest.approx(1.0)
+    assert np.all(np.diff(y) >= -1e-12)
+
+
+@pytest.mark.parametrize("name", ["log", "asinh", "power"])
+@pytest.mark.parametrize("param", [0.0, -1.0, np.nan, np.inf])
+def test_invalid_params_are_rejected(name, param):
+    assert not valid_param(name, param)
+    with pytest.raises(ValueError):
+        transfer(name, X, param)
+    with pytest.raises(ValueError):
+        Stretch(0, 1, name, param)
+
+
+@pytest.mark.parametrize("name", ["linear", "sqrt", "histeq"])
+def test_functions_without_param_ignore_it(name):
+    assert valid_param(name, 0.0)
+
+
+@pytest.mark.parametrize("name, param", EDGE_PARAMS)
+def test_lookup_table_spans_the_output_range(name, param):
+    stretch = Stretch(10.0, 20.0, name, param)
+    out = stretch(np.array([5.0, 10.0, 20.0, 25.0, np.nan]))
+    assert out.dtype == np.uint8
+    assert list(out) == [0, 0, 255, 255, 0]
+
+
+def test_integer_input_matches_float_input():
+    stretch = Stretch(100, 60000, "asinh", 0.05)
+    values = np.array([0, 100, 1000, 30000, 65535], dtype=np.uint16)
+    np.testing.assert_array_equal(stretch(values), stretch(values.astype(np.float64)))
+
+
+def test_defaults_are_valid():
+    for name, default in STRETCHES.items():
+        assert valid_param(name, default)
+
+
+PERCENTS = [0, 0.25, 1, 50, 99, 99.75, 100]
+
+
+@pytest.fixture
+def skewed():
+    """Sky-like data: a narrow background with a long tail and a few NaNs."""
+    rng = np.random.default_rng(1)
+    data = rng.normal(1000, 5, (200, 300)) + rng.exponential(50, (200, 300)) ** 2
+    data[::37, ::41] = np.nan
+    return data
+
+
+def test_refined_percentiles_match_numpy(skewed, monkeypatch):
+    # Several blocks per pass over the data
+    monkeypatch.setattr(stretch, "BLOCK_PIXELS", 7000)
+    histogram = PixelHistogram.from_data(skewed, bins=256)
+    expected = np.nanpercentile(skewed, PERCENTS)
+    assert histogram.percentiles(PERCENTS, skewed, tolerance=0) == pytest.approx(expected, rel=1e-12)
+
+
+def test_estimates_stay_within_their_bin(skewed):
+    histogram = PixelHistogram.from_data(skewed, bins=256)
+    width = histogram.edges[1] - histogram.edges[0]
+    estimates = histogram.percentiles(PERCENTS)
+    assert estimates == pytest.approx(np.nanpercentile(skewed, PERCENTS), abs=width)
+
+
+def test_refined_values_are_remembered(skewed):
+    histogram = PixelHistogram.from_data(skewed, bins=256)
+    exact = histogram.percentiles([1, 99], skewed, tolerance=0)
+    # Without the data the refined values are still used
+    assert histogram.percentiles([1, 99]) == exact
+
+
+def test_bins_finer_than_the_tolerance_are_not_refined(skewed):
+    histogram = PixelHistogram.from_data(skewed, bins=256)
+    histogram.percentiles([1, 99], skewed, tolerance=np.inf)
+    assert histogram._exact == {}
+
+
+def test_integer_data_gets_one_bin_per_value():
+    data = np.random.default_rng(2).integers(100, 140, (50, 60)).astype(np.uint16)
+    histogram = PixelHistogram.from_data(data)
+    assert histogram.discrete
+    assert len(histogram.counts) == 40
+    # Exact without looking at the pixels
+    assert histogram.percentiles(PERCENTS) == pytest.approx(np.percentile(data, PERCENTS))
+    assert histogram._exact == {}
+
+
+def test_constant_and_empty_data():
+    histogram = PixelHistogram.from_data(np.full((4, 4), 7.0))
+    assert histogram.total == 16
+    assert histogram.limits(0, 100) == (7.0, 7.0)
+    assert histogram.limits(0, 100, np.full((4, 4), 7.0)) == (7.0, 7.0)
+    assert np.all(Stretch(7.0, 7.0, "histeq", histogram=histogram).lut[[0, -1]] == [0, 255])
+    assert PixelHistogram.from_data(np.full((4, 4), np.nan)) is None
+
+
+
+def test_float_data_aligned_like_integer_bins_is_refined():
+    # Bins one unit wide with edges at .5, as integer data would get
+    data = np.linspace(0.5, 10.5, 1001).reshape(7, 143)
+    histogram = PixelHistogram.from_data(data, bins=10)
+    assert np.all(np.diff(histogram.edges) == 1) and histogram.edges[0] == 0.5
+    assert not histogram.discrete
+
+    expected = np.percentile(data, PERCENTS)
+    assert histogram.percentiles(PERCENTS, data, tolerance=0) == pytest.approx(expected, rel=1e-12)
+
+
+@pytest.mark.parametrize("name", [name for name in COLORMAPS if COLORMAPS[name] is not None])
+def test_palettes_have_an_rgb_entry_per_level(name):
+    colors = palette(name)
+    assert len(colors) == 768
+    assert all(isinstance(v, int) and 0 <= v <= 255 for v in colors)
+
+    image = apply_colormap(Image.fromarray(np.arange(256, dtype=np.uint8).reshape(16, 16)), name)
+    assert image.mode == "P"
+    # Only the palette is added, the levels stay as they are
+    assert np.array_equal(np.asarray(image).ravel(), np.arange(256))
+    assert image.convert("RGB").getpixel((15, 15)) == tuple(colors[-3:])
+
+
+def test_gray_stays_grayscale():
+    assert palette("gray") is None
+    image = apply_colormap(Image.new("L", (4, 4), 7), "gray")
+    assert image.mode == "L"
+
+
+def test_unknown_colormap():
+    with pytest.raises(ValueError):
+        palette("sepia")
+
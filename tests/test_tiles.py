@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from starmate.tiles import CompressedImageData, TiledArray, tile_range
+
+
+class ArrayTiles(TiledArray):
+    """Tiles cut from an array in memory, counting the tiles produced."""
+
+    def __init__(self, data, tile_shape, cache_bytes=None):
+        super().__init__(data.shape, data.dtype, tile_shape, cache_bytes)
+        self.data = data
+        self.produced = []
+
+    def _read_tile(self, ty, tx):
+        self.produced.append((ty, tx))
+        y0, y1, x0, x1 = self.tile_bounds(ty, tx)
+        return self.data[y0:y1, x0:x1].copy()
+
+
+@pytest.fixture
+def tiles(ramp):
+    return ArrayTiles(ramp, (16, 20))
+
+
+KEYS = [
+    (slice(None), slice(None)),
+    (slice(5, 37), slice(18, 61)),
+    (slice(40, 100), slice(-10, None)),
+    (slice(None, None, 3), slice(1, None, 7)),
+    (slice(None, None, -1), slice(50, 3, -4)),
+    (slice(10, 10), slice(None)),
+    ([3, 40, 7, 3], slice(0, 64, 9)),
+    (np.array([-1, 0]), np.array([63, 0])),
+    (slice(2, 30), 21),
+]
+
+
+@pytest.mark.parametrize("key", KEYS)
+def test_indexing_matches_numpy(tiles, ramp, key):
+    result = tiles[key]
+    assert result.dtype == ramp.dtype
+    np.testing.assert_array_equal(result, ramp[key])
+
+
+def test_row_index(tiles, ramp):
+    np.testing.assert_array_equal(tiles[17], ramp[17])
+    np.testing.assert_array_equal(tiles[-1], ramp[-1])
+
+
+@pytest.mark.parametrize("key", [48, -49, (0, 64), (slice(None), [0, -65]), ([47, 48], slice(None))])
+def test_out_of_range_indices_raise(tiles, ramp, key):
+    with pytest.raises(IndexError):
+        ramp[key]
+    with pytest.raises(IndexError):
+        tiles[key]
+
+
+def test_only_overlapping_tiles_are_produced(tiles):
+    assert tiles.n_tiles == (3, 4)
+    tiles.read(20, 30, 45, 62)
+    assert sorted(tiles.produced) == [(1, 2), (1, 3)]
+
+    # Cached tiles are not produced again
+    tiles.read(16, 32, 40, 60)
+    assert sorted(tiles.produced) == [(1, 2), (1, 3)]
+
+
+def test_reads_are_clipped_to_the_array(tiles, ramp):
+    np.testing.assert_array_equal(tiles.read(-5, 4, 60, 80), ramp[0:4, 60:64])
+    assert tiles.read(50, 60, 0, 10).shape == (0, 10)
+    assert tiles.produced == [(0, 3)]
+
+
+def test_edge_tiles_are_partial(tiles):
+    assert tiles.tile_bounds(2, 3) == (32, 48, 60, 64)
+    assert tiles.tile(2, 3).shape == (16, 4)
+
+
+def test_cache_stays_within_its_budget(ramp):
+    tile_bytes = 16 * 20 * ramp.itemsize
+    tiles = ArrayTiles(ramp, (16, 20), cache_bytes=2 * tile_bytes)
+    np.asarray(tiles)
+    assert len(tiles.produced) == 12
+    assert len(tiles.cache.keys()) <= 2
+
+    # Evicted tiles are produced again on the next read
+    tiles.read(0, 16, 0, 20)
+    assert tiles.produced.count((0, 0)) == 2
+
+
+def test_sample_tiles_spread_over_the_image(tiles, ramp):
+    sample = tiles.sample_tiles(3)
+    assert sorted(tiles.produced) == [(0, 0), (1, 1), (2, 3)]
+    assert sample.size == 16 * 20 * 2 + 16 * 4
+    assert np.isin(sample, ramp).all()
+
+
+def test_array_conversion(tiles, ramp):
+    np.testing.assert_array_equal(np.asarray(tiles), ramp)
+    assert np.asarray(tiles, dtype=np.float64).dtype == np.float64
+
+
+def test_tile_range():
+    assert list(tile_range(0, 16, 16)) == [0]
+    assert list(tile_range(15, 17, 16)) == [0, 1]
+    assert list(tile_range(32, 33, 16)) == [2]
+
+
+def test_compressed_image_reads_match_the_data(write_fits, ramp):
+    data = (ramp * 3).astype(np.int32)
+    path = write_fits("ramp.fits.fz", fits.PrimaryHDU(), fits.CompImageHDU(data, tile_shape=(1, 64)))
+
+    with fits.open(path) as hdus:
+        tiles = CompressedImageData(hdus[1], min_tile=10, cache_bytes=1 << 20)
+        # Row-compressed tiles are grown to whole compression tiles of at least min_tile rows
+        assert tiles.tile_shape == (10, 64)
+        assert tiles.dtype == data.dtype
+        np.testing.assert_array_equal(tiles[7:29, 5:50], data[7:29, 5:50])
+        np.testing.assert_array_equal(np.asarray(tiles), data)
@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+from astropy.wcs import WCS
+
+from starmate.wcs_grid import FastWCS, chunked, wrap
+
+
+def tan_wcs(ra, dec, scale, shape, ctype=("RA---TAN", "DEC--TAN")):
+    """A TAN WCS centered on (ra, dec), ``scale`` degrees per pixel."""
+    wcs = WCS(naxis=2)
+    wcs.wcs.ctype = list(ctype)
+    wcs.wcs.crval = [ra, dec]
+    wcs.wcs.crpix = [shape[1] / 2 + 0.5, shape[0] / 2 + 0.5]
+    wcs.wcs.cdelt = [-scale, scale]
+    wcs.wcs.pc = [[np.cos(0.3), -np.sin(0.3)], [np.sin(0.3), np.cos(0.3)]]
+    return wcs
+
+
+def error_arcsec(fast, exact):
+    """Angular distance between two (lon, lat) results, in arcsec."""
+    (lon, lat), (elon, elat) = fast, exact
+    return np.hypot(wrap(lon - elon) * np.cos(np.radians(elat)), lat - elat) * 3600
+
+
+def pixels(shape, n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-0.5, shape[1] - 0.5, n), rng.uniform(-0.5, shape[0] - 0.5, n)
+
+
+def test_small_field_is_interpolated_within_the_tolerance():
+    shape = (400, 600)
+    fast = FastWCS(tan_wcs(150, 20, 1 / 3600, shape), shape, tolerance=0.01)
+    assert fast.coverage == 1.0
+    assert fast.max_error <= 0.01
+
+    x, y = pixels(shape)
+    assert error_arcsec(fast.pixel_to_world(x, y), fast.exact(x, y)).max() <= 0.01
+
+
+def test_cells_over_the_tolerance_are_flagged_and_computed_exactly():
+    shape = (400, 600)
+    # A wide field, where the interpolation error grows away from the tangent point
+    wcs = tan_wcs(150, 20, 300 / 3600, shape)
+    loose = FastWCS(wcs, shape, spacing=64, tolerance=3600)
+    assert loose.coverage == 1.0
+    strict = FastWCS(wcs, shape, spacing=64, tolerance=loose.max_error / 2)
+    assert 0 < strict.coverage < 1.0
+
+    # Flagged cells fall back to the exact WCS, so the tolerance holds everywhere
+    x, y = pixels(shape)
+    assert error_arcsec(strict.pixel_to_world(x, y), strict.exact(x, y)).max() <= strict.tolerance
+
+
+def test_cells_around_the_pole_are_flagged():
+    shape = (200, 200)
+    fast = FastWCS(tan_wcs(30, 90, 36 / 3600, shape), shape, spacing=32, tolerance=0.01)
+    fast.build()
+    assert not fast._good.all()
+    # The pole is at the center of the image, in a flagged cell
+    center = (shape[0] / 2 - 0.5 - fast._origin[1]) / fast.spacing
+    assert not fast._good[int(center), int(center)]
+
+    x, y = pixels(shape)
+    assert error_arcsec(fast.pixel_to_world(x, y), fast.exact(x, y)).max() <= 0.01
+
+
+def test_ra_zero_crossing_does_not_wrap_the_interpolation():
+    shape = (300, 300)
+    fast = FastWCS(tan_wcs(0, 10, 2 / 3600, shape), shape)
+    x, y = pixels(shape)
+    lon, lat = fast.pixel_to_world(x, y)
+    assert lon.min() >= 0 and lon.max() < 360
+    assert (lon > 180).any() and (lon < 180).any()
+    assert error_arcsec((lon, lat), fast.exact(x, y)).max() <= fast.tolerance
+
+
+def test_scalar_and_array_conversions_agree():
+    shape = (300, 300)
+    fast = FastWCS(tan_wcs(0, 10, 2 / 3600, shape), shape)
+    x, y = pixels(shape, n=20)
+    lon, lat = fast.pixel_to_world(x, y, origin=1)
+    for i in range(len(x)):
+        assert fast.pixel_to_world(x[i], y[i], origin=1) == pytest.approx((lon[i], lat[i]), abs=1e-9)
+
+
+def test_positions_outside_the_grid_and_nan():
+    shape = (100, 100)
+    fast = FastWCS(tan_wcs(150, 20, 1 / 3600, shape), shape)
+    x = np.array([-500.0, 50.0, np.nan])
+    y = np.array([50.0, 1e4, 50.0])
+    lon, lat = fast.pixel_to_world(x, y)
+    elon, elat = fast.exact(x[:2], y[:2])
+    assert lon[:2] == pytest.approx(elon) and lat[:2] == pytest.approx(elat)
+    assert np.isnan(lon[2]) and np.isnan(lat[2])
+    assert all(np.isnan(fast.pixel_to_world(np.nan, 50.0)))
+
+
+def test_latitude_first_axes():
+    shape = (200, 200)
+    wcs = tan_wcs(20, 150, 1 / 3600, shape, ctype=("DEC--TAN", "RA---TAN"))
+    fast = FastWCS(wcs, shape)
+    x, y = pixels(shape)
+    dec, ra = fast.pixel_to_world(x, y)
+    edec, era = fast.exact(x, y)
+    assert error_arcsec((ra, dec), (era, edec)).max() <= fast.tolerance
+
+
+def test_chunked_conversion_skips_non_finite_inputs():
+    calls = []
+
+    def convert(a, b):
+        calls.append(len(a))
+        assert np.isfinite(a).all() and np.isfinite(b).all()
+        return a + 1, b * 2
+
+    a = np.arange(10.0).reshape(2, 5)
+    a[1, 2] = np.nan
+    out_a, out_b = chunked(convert, a, 3.0, chunk_size=4)
+    assert out_a.shape == out_b.shape == (2, 5)
+    assert calls == [4, 3, 2]
+    assert np.isnan(out_a[1, 2]) and np.isnan(out_b[1, 2])
+    assert out_a[0, 0] == 1 and out_b[0, 4] == 6